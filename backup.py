@@ -0,0 +1,292 @@
+import asyncio
+import os
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from pyrogram import enums, raw
+from pyrogram.errors import FloodWait
+
+# ==========================================================
+# --- BACKUP PIPELINE ---
+# Tarix yig'ish -> parallel media yuklovchilar -> tartib bo'yicha render.
+# ==========================================================
+
+
+class DownloadPool:
+    def __init__(self, client, folder, parallel=4, retries=3, known=None, store=None):
+        self.client = client
+        self.folder = folder
+        self.store = store         # MediaStore: bir xil fayl qayta yuklanmaydi
+        self.parallel = parallel
+        self.retries = retries
+        self.known = known or {}   # msg_id -> oldin yuklangan fayl yo'li (resume uchun)
+        self.stats = {"done": 0, "failed": 0, "flood_waits": 0, "reused": 0}
+        self._sem = None
+        self._resume_at = 0.0   # FloodWait bo'lsa hamma yuklovchilar shu vaqtgacha kutadi
+        self._tasks = set()
+
+    async def _pause(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0: await asyncio.sleep(delay)
+
+    async def _download(self, m):
+        if self.store:
+            path = await self.store.reuse(m, self.folder)
+            if path: return path
+        if self._sem is None: self._sem = asyncio.Semaphore(self.parallel)
+        async with self._sem:
+            for _ in range(self.retries):
+                await self._pause()
+                try:
+                    path = await self.client.download_media(m, file_name=self.folder + "/")
+                    if self.store: await self.store.add(m, path)
+                    self.stats["done"] += 1
+                    return path
+                except FloodWait as e:
+                    self.stats["flood_waits"] += 1
+                    self._resume_at = max(self._resume_at, time.monotonic() + e.value + 1)
+                except asyncio.CancelledError: raise
+                except Exception: break
+            self.stats["failed"] += 1
+            return None
+
+    def submit(self, m):
+        path = self.known.get(m.id)
+        if path and os.path.exists(path):
+            self.stats["reused"] += 1
+            fut = asyncio.get_running_loop().create_future(); fut.set_result(path)
+            return fut
+        task = asyncio.ensure_future(self._download(m))
+        self._tasks.add(task); task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def close(self):
+        # .stop: navbatdagi va ishlayotgan yuklashlar bekor qilinadi
+        for t in list(self._tasks): t.cancel()
+        if self._tasks: await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def aiter_list(items):
+    for item in items: yield item
+
+
+async def prefetch_media(messages, pool, lookahead=32):
+    """(message, media_path) juftlarini asl tartibda qaytaradi.
+    Oldindagi `lookahead` ta xabarning mediasi parallel yuklanadi."""
+    window = deque()
+    async for m in messages:
+        window.append((m, pool.submit(m) if m.media else None))
+        if len(window) >= lookahead:
+            m0, t0 = window.popleft()
+            yield m0, (await t0 if t0 else None)
+    while window:
+        m0, t0 = window.popleft()
+        yield m0, (await t0 if t0 else None)
+
+
+# .backup -type qiymatlari -> Telegram server tomonidagi qidiruv filtrlari
+BACKUP_TYPES = {
+    "photo": enums.MessagesFilter.PHOTO, "video": enums.MessagesFilter.VIDEO,
+    "media": enums.MessagesFilter.PHOTO_VIDEO, "voice": enums.MessagesFilter.VOICE_NOTE,
+    "audio": enums.MessagesFilter.AUDIO, "round": enums.MessagesFilter.VIDEO_NOTE,
+    "gif": enums.MessagesFilter.ANIMATION, "document": enums.MessagesFilter.DOCUMENT,
+    "link": enums.MessagesFilter.URL,
+}
+
+
+async def _history_ids(client, chat_id, start_date, end_date, min_id):
+    # offset_date bilan to'g'ridan-to'g'ri oraliq oxiriga sakraymiz, yangi xabarlar varaqlanmaydi
+    kwargs = {"offset_date": end_date + timedelta(seconds=1)} if end_date else {}
+    async for m in client.get_chat_history(chat_id, **kwargs):
+        if m.id <= min_id or (start_date and m.date < start_date): return
+        if end_date and m.date > end_date: continue
+        yield m.id
+
+
+async def _search_ids(client, chat_id, start_date, end_date, min_id, from_user, media):
+    # Sana, yuboruvchi va tur filtrlari serverda qo'llanadi (messages.Search)
+    peer = await client.resolve_peer(chat_id)
+    from_id = await client.resolve_peer(from_user) if from_user else None
+    flt = (media or enums.MessagesFilter.EMPTY).value()
+    offset_id = 0
+    while True:
+        r = await client.invoke(raw.functions.messages.Search(
+            peer=peer, q="", filter=flt, from_id=from_id,
+            min_date=int(start_date.timestamp()) if start_date else 0,
+            max_date=int(end_date.timestamp()) if end_date else 0,
+            offset_id=offset_id, add_offset=0, limit=100, max_id=0, min_id=min_id, hash=0))
+        ids = [m.id for m in r.messages if m.id > min_id]
+        if not ids: return
+        for mid in ids: yield mid
+        offset_id = ids[-1]
+
+
+async def scan_history(client, chat_id, limit=0, start_date=None, end_date=None, min_id=0, from_user=None, media=None):
+    """So'ralgan bo'lak xabar id larini yangidan eskiga qaytaradi.
+    Narx chatning yoshiga emas, bo'lak hajmiga bog'liq."""
+    if from_user or media: source = _search_ids(client, chat_id, start_date, end_date, min_id, from_user, media)
+    else: source = _history_ids(client, chat_id, start_date, end_date, min_id)
+    count = 0
+    async for mid in source:
+        yield mid
+        count += 1
+        if limit and count >= limit: return
+
+
+async def fetch_messages(client, chat_id, ids, batch=200):
+    # Xabarlar id bo'yicha kichik bo'laklarda olinadi — xotirada faqat bitta bo'lak turadi
+    for i in range(0, len(ids), batch):
+        for m in await client.get_messages(chat_id, ids[i:i + batch]):
+            if m and not m.empty: yield m
+
+
+class PageWriter:
+    """Har bir xabarni darhol diskka yozadi, `page_size` tadan sahifalarga bo'ladi.
+    `pages` berilsa, oldingi backupdan davom etadi (raqamlash va navigatsiya ulanadi)."""
+
+    def __init__(self, folder, head, footer, page_size=500, pages=None):
+        self.folder = folder
+        self.head = head
+        self.footer = footer
+        self.page_size = page_size
+        self.pages = [list(p) for p in pages or []]   # [fayl, soni, birinchi sana, oxirgi sana, oxirgi id]
+        self.count = 0
+        self._resumed = bool(self.pages)
+        self._f = None
+
+    @staticmethod
+    def page_name(n):
+        return f"page_{n:04d}.html"
+
+    def _nav(self, n, has_next):
+        links = ['<a href="index.html">📚 Mundarija</a>']
+        if n > 1: links.insert(0, f'<a href="{self.page_name(n - 1)}">⬅️ Oldingi</a>')
+        if has_next: links.append(f'<a href="{self.page_name(n + 1)}">Keyingi ➡️</a>')
+        return f'<div class="nav">{" ".join(links)}</div>'
+
+    def _link_previous(self, n):
+        # Oldingi backupning oxirgi sahifasiga "Keyingi" havolasini qo'shamiz
+        path = f"{self.folder}/{self.page_name(n - 1)}"
+        if not os.path.exists(path): return None
+        with open(path, encoding="utf-8") as f: content = f.read()
+        cut = content.rfind('<div class="nav">')
+        if cut < 0: return None
+        with open(path, "w", encoding="utf-8") as f: f.write(content[:cut] + self._nav(n - 1, True) + self.footer)
+        return path
+
+    def _open(self, date, msg_id):
+        n = len(self.pages) + 1; changed = []
+        if self._resumed and n > 1: changed.append(self._link_previous(n))
+        self._resumed = False
+        self._f = open(f"{self.folder}/{self.page_name(n)}", "w", encoding="utf-8")
+        self._f.write(self.head + self._nav(n, False))
+        self.pages.append([self.page_name(n), 0, date, date, msg_id])
+        return changed
+
+    def _close(self, has_next):
+        self._f.write(self._nav(len(self.pages), has_next) + self.footer)
+        self._f.close(); self._f = None
+        return f"{self.folder}/{self.pages[-1][0]}"
+
+    def closed_pages(self):
+        return self.pages[:-1] if self._f else self.pages
+
+    def write(self, block, date="", msg_id=0):
+        """Xabarni yozadi. Yopilgan yoki o'zgargan sahifalar yo'llarini qaytaradi."""
+        changed = []
+        # Sahifa keyingi xabar kelgandagina yopiladi — shunda "Keyingi" havolasi aniq bo'ladi
+        if self._f and self.pages[-1][1] >= self.page_size: changed.append(self._close(True))
+        if not self._f: changed += self._open(date, msg_id)
+        self._f.write(block)
+        page = self.pages[-1]; page[1] += 1; page[3] = date; page[4] = msg_id
+        self.count += 1
+        return [p for p in changed if p]
+
+    def finish(self):
+        """Oxirgi sahifa va index.html ni yozadi, ularning yo'llarini qaytaradi."""
+        files = [self._close(False)] if self._f else []
+        rows = "".join(f'<div class="message incoming"><a href="{p[0]}">📄 {p[0]}</a>'
+                       f'<div class="meta">{p[1]} ta • {p[2]} — {p[3]}</div></div>'
+                       for p in self.pages)
+        total = sum(p[1] for p in self.pages)
+        with open(f"{self.folder}/index.html", "w", encoding="utf-8") as f:
+            f.write(self.head + f'<div class="nav">📚 Jami: {total} ta xabar, {len(self.pages)} sahifa</div>' + rows + self.footer)
+        return files + [f"{self.folder}/index.html"]
+
+
+# Allaqachon siqilgan formatlar qayta DEFLATE qilinmaydi
+STORED_EXT = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic", ".mp4", ".mkv", ".webm", ".mov", ".avi",
+              ".ogg", ".oga", ".opus", ".mp3", ".m4a", ".aac", ".flac", ".tgs", ".zip", ".rar", ".7z", ".gz"}
+# Pyrogram 2000 MiB dan kattasini yubormaydi; zaxira — sarlavhalar va taxmin xatosi uchun
+VOLUME_SIZE = 1900 * 1024 * 1024
+# ZIP yozuvi tuzilmasi: lokal sarlavha 30 + nom, markaziy katalog 46 + nom (+ ZIP64 qo'shimchalari), oxiri 22 (+ ZIP64 76)
+LOCAL_HEADER = 30 + 20
+CENTRAL_HEADER = 46 + 28
+END_RECORD = 22 + 76
+
+
+class ArchiveWriter:
+    """ZIP ni loopdan tashqarida, fayllar tayyor bo'lishi bilan yozadi.
+    Tom hajmi sarlavhalar va markaziy katalog bilan birga `volume_size` dan oshmaydi;
+    undan ham katta bitta fayl arxivga kirmaydi va `skipped` ga yoziladi."""
+
+    def __init__(self, base, root, volume_size=VOLUME_SIZE):
+        self.base = base
+        self.root = root
+        self.volume_size = volume_size
+        self.volumes = []
+        self._zip = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="zip")
+        self._jobs = []
+        self._added = set()   # bir fayl ikki marta qo'shilmaydi
+        self._central = 0     # joriy tomning markaziy katalogi (close da yoziladi)
+        self.skipped = []
+
+    def _next_volume(self):
+        if self._zip: self._zip.close()
+        path = f"{self.base}.part{len(self.volumes) + 1:02d}.zip"
+        self._zip = zipfile.ZipFile(path, "w", allowZip64=True)
+        self.volumes.append(path); self._central = 0
+
+    def _add(self, path):
+        name = os.path.relpath(path, self.root); name_len = len(name.encode())
+        ext = os.path.splitext(path)[1].lower()
+        method = zipfile.ZIP_STORED if ext in STORED_EXT else zipfile.ZIP_DEFLATED
+        size = os.path.getsize(path)
+        # DEFLATE siqilmaydigan ma'lumotni biroz kattalashtirishi mumkin
+        if method == zipfile.ZIP_DEFLATED: size += size // 1000 + 16
+        local = LOCAL_HEADER + name_len + size; central = CENTRAL_HEADER + name_len
+        if local + central + END_RECORD > self.volume_size:
+            self.skipped.append(name); return
+        if not self._zip or (self._central and self._zip.fp.tell() + local + self._central + central + END_RECORD > self.volume_size):
+            self._next_volume()
+        self._zip.write(path, name, compress_type=method)
+        self._central += central
+
+    def add(self, path):
+        if path and path not in self._added:
+            self._added.add(path); self._jobs.append(asyncio.get_running_loop().run_in_executor(self._executor, self._add, path))
+
+    def _finish(self):
+        if self._zip: self._zip.close(); self._zip = None
+        # Bitta tom bo'lsa oddiy nom: base.zip
+        if len(self.volumes) == 1:
+            os.replace(self.volumes[0], f"{self.base}.zip"); self.volumes = [f"{self.base}.zip"]
+        return self.volumes
+
+    async def close(self):
+        try:
+            await asyncio.gather(*self._jobs)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._finish)
+        finally: self._executor.shutdown(wait=False)
+
+    async def abort(self):
+        await asyncio.gather(*self._jobs, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._finish)
+        self._executor.shutdown(wait=False)
+        for v in self.volumes:
+            if os.path.exists(v): os.remove(v)
+        self.volumes = []
@@ -0,0 +1,101 @@
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+
+# ==========================================================
+# --- AI NATIJALAR KESHI ---
+# Kalit: (vazifa, model, til, normallashtirilgan matn) xeshi.
+# 1-daraja: xotiradagi LRU, 2-daraja: SQLite (TTL + hajm chegarasi).
+# ==========================================================
+
+
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def make_key(task, model_name, lang, text):
+    raw = "\x1f".join([task, model_name or "", lang or "", normalize_text(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, db, max_memory=512, ttl=7 * 24 * 3600, max_rows=20000, prune_every=100):
+        self.db = db
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.memory = OrderedDict()   # key -> (value, created)
+        self.stats = {"hits": 0, "db_hits": 0, "misses": 0, "evicted": 0}
+        self._writes = 0
+
+    def _remember(self, key, value, created):
+        self.memory[key] = (value, created); self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory: self.memory.popitem(last=False)
+
+    async def get(self, key):
+        now = time.time()
+        item = self.memory.get(key)
+        if item and now - item[1] < self.ttl:
+            self.memory.move_to_end(key); self.stats["hits"] += 1
+            return item[0]
+        row = await self.db.fetchone("SELECT value, created FROM ai_cache WHERE key=?", (key,))
+        if row and now - row[1] < self.ttl:
+            self._remember(key, row[0], row[1])
+            await self.db.execute("UPDATE ai_cache SET accessed=? WHERE key=?", (now, key))
+            self.stats["hits"] += 1; self.stats["db_hits"] += 1
+            return row[0]
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key, value):
+        if not value: return
+        now = time.time()
+        self._remember(key, value, now)
+        await self.db.execute("INSERT OR REPLACE INTO ai_cache VALUES (?, ?, ?, ?)", (key, value, now, now))
+        self._writes += 1
+        if self._writes % self.prune_every == 0: await self.prune()
+
+    async def prune(self):
+        # Muddati o'tganlar va chegaradan oshgan eng eski (LRU) yozuvlar o'chiriladi
+        def _do(conn):
+            with conn:
+                n = conn.execute("DELETE FROM ai_cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+                extra = conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0] - self.max_rows
+                if extra > 0:
+                    n += conn.execute("DELETE FROM ai_cache WHERE key IN "
+                                      "(SELECT key FROM ai_cache ORDER BY accessed LIMIT ?)", (extra,)).rowcount
+                return n
+        removed = await self.db.run(_do)
+        self.stats["evicted"] += removed
+        return removed
+
+
+class UploadCache:
+    """file_unique_id -> Geminiga yuklangan fayl. Muddati tugaguncha qayta yuklanmaydi."""
+
+    def __init__(self, max_items=256, ttl=46 * 3600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.items = OrderedDict()   # uid -> (fayl, tugash vaqti)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, uid):
+        item = self.items.get(uid)
+        if item and item[1] > time.time():
+            self.items.move_to_end(uid); self.stats["hits"] += 1
+            return item[0]
+        self.items.pop(uid, None); self.stats["misses"] += 1
+        return None
+
+    def set(self, uid, uploaded):
+        # Gemini fayllari ~48 soatda o'chadi; ma'lum bo'lsa aniq vaqtdan 1 soat oldin eskiradi
+        exp = getattr(uploaded, "expiration_time", None)
+        expires = exp.timestamp() - 3600 if hasattr(exp, "timestamp") else time.time() + self.ttl
+        self.items[uid] = (uploaded, expires); self.items.move_to_end(uid)
+        while len(self.items) > self.max_items: self.items.popitem(last=False)
+
+    def discard(self, uid):
+        # Server faylni muddatidan oldin o'chirgan bo'lsa
+        self.items.pop(uid, None)
@@ -0,0 +1,81 @@
+import hashlib
+import re
+import time
+from collections import deque
+
+# ==========================================================
+# --- TAKROR YANGILIKLARNI ANIQLASH ---
+# Har post matnidan 64-bitli SimHash (4 belgili shingllar bo'yicha) olinadi.
+# Oxirgi `ttl` soniyadagi izlar bilan Hamming masofasi taqqoslanadi;
+# qidiruv bandlar bo'yicha indeksda (butun ro'yxat aylanib chiqilmaydi).
+# ==========================================================
+
+BITS = 64
+URL_RE = re.compile(r"https?://\S+|t\.me/\S+|@\w+")
+WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text, k=4):
+    """Havola, emoji va tinish belgilarisiz matndan k belgili bo'laklar.
+    So'z shingllaridan farqli, bitta so'z qo'shilsa yoki almashsa iz kam o'zgaradi."""
+    norm = " ".join(WORD_RE.findall(URL_RE.sub(" ", text.lower())))
+    if len(norm) <= k: return [norm] if norm else []
+    return [norm[i:i + k] for i in range(len(norm) - k + 1)]
+
+
+def simhash(text, k=4):
+    # Bitlar ustunlar bo'yicha sanaladi (zip) — Python siklida har bitni aylanishdan ancha tez
+    rows = [hashlib.blake2b(sh.encode(), digest_size=8).hexdigest() for sh in shingles(text, k)]
+    if not rows: return 0
+    rows = [format(int(h, 16), "064b") for h in rows]; half = len(rows) / 2
+    return int("".join("1" if col.count("1") > half else "0" for col in zip(*rows)), 2)
+
+
+def distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class DuplicateIndex:
+    def __init__(self, max_distance=7, ttl=6 * 3600, bands=8):
+        # bands > max_distance: kamida bitta band to'liq mos keladi (Dirixle prinsipi)
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.bands = bands
+        self.width = BITS // bands
+        self.stats = {"checked": 0, "duplicates": 0}
+        self._entries = deque()      # (vaqt, iz, meta) — vaqt bo'yicha tartibda
+        self._buckets = {}           # (band raqami, band qiymati) -> yozuvlar
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _keys(self, fp):
+        mask = (1 << self.width) - 1
+        return [(i, fp >> (i * self.width) & mask) for i in range(self.bands)]
+
+    def _evict(self, now):
+        while self._entries and self._entries[0][0] < now - self.ttl:
+            entry = self._entries.popleft()
+            for key in self._keys(entry[1]):
+                bucket = self._buckets.get(key)
+                if bucket is None: continue
+                bucket.remove(entry)
+                if not bucket: del self._buckets[key]
+
+    def find(self, fp, now=None):
+        """Yaqin izga ega oldingi postning meta si yoki None."""
+        self._evict(time.monotonic() if now is None else now)
+        for key in self._keys(fp):
+            for _, other, meta in self._buckets.get(key, ()):
+                if distance(fp, other) <= self.max_distance: return meta
+        return None
+
+    def check(self, text, meta, now=None):
+        """Takror bo'lsa asl postning meta sini qaytaradi, aks holda postni indeksga qo'shib None."""
+        now = time.monotonic() if now is None else now
+        fp = simhash(text); self.stats["checked"] += 1
+        original = self.find(fp, now)
+        if original is not None: self.stats["duplicates"] += 1; return original
+        entry = (now, fp, meta); self._entries.append(entry)
+        for key in self._keys(fp): self._buckets.setdefault(key, []).append(entry)
+        return None
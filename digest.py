@@ -0,0 +1,96 @@
+import asyncio
+import json
+import re
+
+# ==========================================================
+# --- YANGILIKLAR DAYJESTI ---
+# Manbalardan kelgan postlar `window` soniya yoki `max_items` tagacha yig'iladi,
+# bitta so'rovda har biri alohida qisqartiriladi va bitta xabar bo'lib ketadi.
+# ==========================================================
+
+
+def build_digest_prompt(items):
+    posts = "\n\n".join(f"[{i}] ({it['channel']})\n{it['text']}" for i, it in enumerate(items, 1))
+    return ("Quyida bir nechta kanal yangiliklari raqamlangan. Har birining eng asosiy mazmunini "
+            "1-2 gap bilan O'zbek tilida yoz. Javob FAQAT JSON massiv bo'lsin: har element — satr, "
+            f"tartib va soni postlar bilan bir xil ({len(items)} ta).\n\n{posts}")
+
+
+def parse_digest(text, count):
+    """Model javobidan `count` ta qisqa matn; topilmaganlari o'rniga None."""
+    text = (text or "").strip()
+    match = re.search(r"\[.*\]", text, re.S)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            # "[3] ..." kabi raqamli qator JSON massiv emas
+            if isinstance(data, list) and all(isinstance(x, str) or x is None for x in data):
+                items = [str(x).strip() if x else None for x in data[:count]]
+                return items + [None] * (count - len(items))
+        except ValueError: pass
+    # Zaxira: "1. ..." yoki "[1] ..." ko'rinishidagi qatorlar
+    found = {}
+    for line in text.splitlines():
+        m = re.match(r"\s*\[?(\d+)[\].):]\s*(.+)", line)
+        if m and 1 <= int(m.group(1)) <= count: found[int(m.group(1))] = m.group(2).strip()
+    return [found.get(i) for i in range(1, count + 1)]
+
+
+def source_line(item):
+    # Takror postlar (dedupe.py) asl postga qo'shimcha manba sifatida yoziladi
+    also = item.get("also")
+    return f"{item['channel']} (+{', '.join(also)})" if also else item["channel"]
+
+
+def format_digest(items, summaries, limit=4096):
+    """Dayjest matni; Telegram chegarasidan oshsa bir nechta xabarga bo'linadi."""
+    header = "🗞 **Dayjest**"; blocks = []
+    for it, s in zip(items, summaries):
+        tail = f"\n📰 {source_line(it)} • {it['link']}"
+        # Har blok sarlavha bilan birga bitta xabarga sig'adi: uzun xulosa qisqartiriladi
+        room = limit - len(header) - 2 - len("▪️ ") - len(tail)
+        if len(s) > room: s = s[:max(room - 1, 0)].rstrip() + "…"
+        blocks.append((f"▪️ {s}" + tail)[:limit - len(header) - 2])
+    messages, current = [], header
+    for block in blocks:
+        if len(current) + len(block) + 2 > limit: messages.append(current); current = ""
+        current = (current + "\n\n" + block) if current else block
+    messages.append(current)
+    return messages
+
+
+class DigestBuffer:
+    def __init__(self, flush, window=300, max_items=10):
+        self.flush_fn = flush        # async fn(items) — yig'ilgan postlarni qayta ishlaydi
+        self.window = window
+        self.max_items = max_items
+        self.items = []
+        self.stats = {"posts": 0, "digests": 0, "failed": 0}
+        self._timer = None
+        self._lock = None            # dayjestlar kelgan tartibda, bittadan yuboriladi
+        self._tasks = set()
+
+    def add(self, item):
+        self.items.append(item); self.stats["posts"] += 1
+        # Birinchi post kelganda taymer: har post ko'pi bilan `window` soniya kutadi
+        if len(self.items) >= self.max_items: self.flush_now()
+        elif not self._timer: self._timer = asyncio.get_running_loop().call_later(self.window, self.flush_now)
+
+    def flush_now(self):
+        """Buferdagi postlarni kutmasdan yuboradi."""
+        if self._timer: self._timer.cancel(); self._timer = None
+        items, self.items = self.items, []
+        if not items: return
+        task = asyncio.ensure_future(self._flush(items))
+        self._tasks.add(task); task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, items):
+        if self._lock is None: self._lock = asyncio.Lock()
+        async with self._lock:
+            try: await self.flush_fn(items); self.stats["digests"] += 1
+            except Exception: self.stats["failed"] += 1
+
+    async def close(self):
+        # To'xtashda buferdagi postlar ham yuboriladi
+        self.flush_now()
+        if self._tasks: await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+from pyrogram.errors import FloodWait, MessageNotModified
+
+from scheduler import TokenBucket
+
+# ==========================================================
+# --- XABAR TAHRIRLASH REJALASHTIRUVCHISI ---
+# Har bir xabar (chat_id, message_id) uchun faqat oxirgi matn saqlanadi,
+# eskirgan oraliq kadrlar tashlanadi. Global va chat bo'yicha limit,
+# FloodWait esa markazda hisobga olinadi.
+# ==========================================================
+
+
+class EditScheduler:
+    def __init__(self, global_per_min=1500, chat_per_min=40, chat_burst=10, min_interval=1.5):
+        self.global_bucket = TokenBucket(global_per_min, capacity=global_per_min // 60 or 1)
+        self.chat_per_min = chat_per_min
+        self.chat_burst = chat_burst
+        self.min_interval = min_interval
+        self.stats = {"sent": 0, "dropped": 0, "flood_waits": 0, "failed": 0}
+        self._chats = {}       # chat_id -> TokenBucket
+        self._pending = {}     # key -> [message, text, future|None]
+        self._flushers = {}    # key -> asyncio.Task
+        self._last = {}        # key -> oxirgi tahrir vaqti
+        self._blocked_until = 0.0
+
+    @staticmethod
+    def _key(message):
+        return (message.chat.id, message.id)
+
+    def _chat_bucket(self, chat_id):
+        if len(self._chats) > 1000:
+            # To'la (bo'sh turgan) chat limitlari o'chiriladi — lug'at cheksiz o'smaydi
+            for cid in [c for c, b in self._chats.items() if b.wait_time(b.capacity) == 0]: del self._chats[cid]
+        if chat_id not in self._chats: self._chats[chat_id] = TokenBucket(self.chat_per_min, capacity=self.chat_burst)
+        return self._chats[chat_id]
+
+    async def _wait_budget(self, chat_id):
+        bucket = self._chat_bucket(chat_id)
+        while True:
+            wait = max(self.global_bucket.wait_time(1), bucket.wait_time(1), self._blocked_until - time.monotonic())
+            if wait <= 0: break
+            await asyncio.sleep(wait)
+        self.global_bucket.take(1); bucket.take(1)
+
+    async def _send(self, key):
+        while key in self._pending:
+            await self._wait_budget(key[0])
+            item = self._pending.pop(key, None)
+            if not item: return
+            message, text, fut = item
+            try:
+                result = await message.edit_text(text)
+                self.stats["sent"] += 1
+                if fut and not fut.done(): fut.set_result(result)
+                return
+            except FloodWait as e:
+                self.stats["flood_waits"] += 1
+                self._blocked_until = max(self._blocked_until, time.monotonic() + e.value)
+                # Yangiroq kadr kelmagan bo'lsa, shu kadr qayta yuboriladi
+                if self._pending.setdefault(key, item) is not item and fut and not fut.done(): fut.set_result(None)
+            except MessageNotModified:
+                if fut and not fut.done(): fut.set_result(message)
+                return
+            except Exception as e:
+                self.stats["failed"] += 1
+                if fut and not fut.done(): fut.set_exception(e)
+                return
+
+    async def _flush(self, key):
+        try:
+            while key in self._pending:
+                # Oraliq kadr: shu xabar oxirgi marta tahrirlangandan min_interval o'tishi kerak.
+                # Yakuniy matn kelsa, kutish darhol to'xtaydi
+                delay = self._last.get(key, 0) + self.min_interval - time.monotonic()
+                if self._pending[key][2] is None and delay > 0:
+                    await asyncio.sleep(min(delay, 0.1)); continue
+                await self._send(key)
+                self._last[key] = time.monotonic()
+        finally:
+            self._flushers.pop(key, None)
+            if len(self._last) > 1000:
+                now = time.monotonic()
+                self._last = {k: t for k, t in self._last.items() if now - t < self.min_interval}
+
+    def _put(self, message, text, fut):
+        key = self._key(message)
+        old = self._pending.get(key)
+        if old:
+            self.stats["dropped"] += 1
+            if old[2] and not old[2].done(): old[2].set_result(None)
+        self._pending[key] = [message, text, fut]
+        if key not in self._flushers: self._flushers[key] = asyncio.ensure_future(self._flush(key))
+
+    async def edit(self, message, text, final=False):
+        """final=False: kadr navbatga qo'yiladi va darhol qaytadi.
+        final=True: eskirgan kadrlar o'rniga shu matn yuboriladi va kutiladi."""
+        if not final: self._put(message, text, None); return None
+        fut = asyncio.get_running_loop().create_future()
+        self._put(message, text, fut)
+        return await fut
+
+    def cancel(self, message):
+        # Xabar o'chirilishidan oldin: navbatdagi kadrlar tashlanadi
+        item = self._pending.pop(self._key(message), None)
+        if item and item[2] and not item[2].done(): item[2].set_result(None)
@@ -0,0 +1,47 @@
+import importlib
+import threading
+import time
+
+# ==========================================================
+# --- KECHIKTIRILGAN IMPORTLAR ---
+# Og'ir kutubxonalar (yt_dlp, google.generativeai) birinchi ishlatilganda yuklanadi.
+# Gemini modellari esa router.py da birinchi so'rovda quriladi.
+# ==========================================================
+
+IMPORT_TIMES = {}   # modul nomi -> yuklanish vaqti (ms)
+
+
+class LazyModule:
+    """Modul o'rnini bosuvchi: birinchi atributga murojaatda import qilinadi."""
+
+    def __init__(self, name, on_load=None):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_on_load", on_load)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            # Bir vaqtda bir nechta oqimdan murojaat bo'lsa ham bir marta yuklanadi
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    if self._on_load: self._on_load(module)
+                    IMPORT_TIMES[self._name] = round((time.perf_counter() - start) * 1000)
+                    object.__setattr__(self, "_module", module)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    # Testlardagi monkeypatch haqiqiy modulga yoziladi
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self.load(), attr)
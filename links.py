@@ -0,0 +1,170 @@
+import asyncio
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# ==========================================================
+# --- .link YUKLASH XIZMATI ---
+# Cheklangan ishchilar + navbat. Bir xil URL bir vaqtda faqat bir marta
+# yuklanadi, natija (Telegram file_id) keyingi so'rovlar uchun saqlanadi.
+# ==========================================================
+
+# Kontentga ta'sir qilmaydigan kuzatuv parametrlari
+TRACKING_PARAMS = {"si", "feature", "igshid", "igsh", "fbclid", "gclid", "ref", "ref_src", "s", "t", "pp"}
+
+
+def normalize_url(url):
+    """Bir xil kontentga olib boruvchi URL variantlarini bitta kalitga keltiradi."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m.", "mobile."):
+        if host.startswith(prefix): host = host[len(prefix):]
+    path = parts.path.rstrip("/") or "/"
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k not in TRACKING_PARAMS and not k.startswith("utm_")]
+    # YouTube: youtu.be/ID va /shorts/ID -> youtube.com/watch?v=ID
+    if host == "youtu.be": host, query, path = "youtube.com", [("v", path.strip("/"))], "/watch"
+    elif host == "youtube.com" and path.startswith("/shorts/"): query, path = [("v", path.split("/")[2])], "/watch"
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+# ==========================================================
+# --- YUKLASH PROFILLARI: .link URL [-q 720] [-audio] [-fast] ---
+# Format yuklashdan oldin, extract_info dagi hajm/sifat bo'yicha tanlanadi.
+# ==========================================================
+
+TG_UPLOAD_LIMIT = 2000 * 1024 * 1024
+FALLBACK_FORMAT = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+
+
+def parse_link_args(args):
+    """Buyruq argumentlari -> (url, profil). Sifat noto'g'ri bo'lsa ValueError."""
+    url, profile, i = None, {"height": None, "audio": False, "fast": False}, 0
+    while i < len(args):
+        a = args[i].lower()
+        if a == "-q":
+            value = args[i + 1].lower().rstrip("p") if i + 1 < len(args) else ""
+            if not value.isdigit() or not int(value): raise ValueError("-q qiymati son bo'lishi kerak (masalan 720)")
+            profile["height"] = int(value); i += 2; continue
+        if a in ("-audio", "-fast"): profile[a[1:]] = True
+        elif not url: url = args[i]
+        i += 1
+    return url, profile
+
+
+def link_key(url, profile):
+    # Har profil alohida keshlanadi: 720p va audio bir-birining o'rniga yuborilmaydi
+    parts = [normalize_url(url)]
+    if profile["audio"]: parts.append("audio")
+    else:
+        if profile["height"]: parts.append(f"{profile['height']}p")
+        if profile["fast"]: parts.append("fast")
+    return "#".join(parts)
+
+
+def estimate_size(f, duration):
+    size = f.get("filesize") or f.get("filesize_approx")
+    if not size and f.get("tbr") and duration: size = f["tbr"] * 125 * duration   # kbit/s -> bayt
+    return int(size or 0)
+
+
+def choose_format(info, profile, limit=TG_UPLOAD_LIMIT):
+    """{"format", "merge", "size", "height"}: limitga sig'adigan eng yaxshi format.
+    Bir xil sifatda audio+video birga bo'lgan (remux kerak bo'lmagan) format afzal."""
+    formats = info.get("formats") or []; dur = info.get("duration") or 0
+    audio = [f for f in formats if f.get("vcodec") == "none" and f.get("acodec") != "none"]
+    if profile["audio"]:
+        if not audio: return {"format": "bestaudio/best", "merge": False, "size": 0, "height": 0}
+        # m4a/mp3 Telegramda to'g'ridan-to'g'ri ijro etiladi — konvertatsiya kerak emas
+        best = max(audio, key=lambda f: (0 < estimate_size(f, dur) <= limit, f.get("ext") in ("m4a", "mp3"), f.get("abr") or f.get("tbr") or 0))
+        return {"format": best["format_id"], "merge": False, "size": estimate_size(best, dur), "height": 0}
+    cap = profile["height"] or 10 ** 5; cands = []
+    sound = max(audio, key=lambda f: (f.get("ext") == "m4a", f.get("abr") or f.get("tbr") or 0), default=None)
+    for f in formats:
+        h = f.get("height") or 0
+        if f.get("vcodec") == "none" or h > cap: continue
+        if f.get("acodec") != "none":
+            cands.append({"format": f["format_id"], "merge": False, "size": estimate_size(f, dur), "height": h, "mp4": f.get("ext") == "mp4"})
+        elif sound and not profile["fast"]:
+            # -fast: faqat tayyor (birlashtirish talab qilmaydigan) formatlar
+            cands.append({"format": f"{f['format_id']}+{sound['format_id']}", "merge": True, "height": h,
+                          "size": estimate_size(f, dur) + estimate_size(sound, dur), "mp4": f.get("ext") == "mp4"})
+    if not cands: return {"format": "best" if profile["fast"] else FALLBACK_FORMAT, "merge": not profile["fast"], "size": 0, "height": 0}
+    fitting = [c for c in cands if c["size"] <= limit]
+    # Hech biri sig'masa — eng kichigi olinadi va keyin qismlarga bo'linadi
+    best = max(fitting, key=lambda c: (c["height"], not c["merge"], c["mp4"], c["size"])) if fitting else min(cands, key=lambda c: c["size"])
+    best.pop("mp4", None)
+    return best
+
+
+class LinkService:
+    def __init__(self, db, workers=2, max_queue=20, ttl=30 * 24 * 3600):
+        self.db = db
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.stats = {"jobs": 0, "joined": 0, "cache_hits": 0, "failed": 0}
+        self._queue = None
+        self._tasks = []
+        self._inflight = {}   # url -> future (yuklanayotgan URL lar)
+
+    def _get_queue(self):
+        if self._queue is None: self._queue = asyncio.Queue(maxsize=self.max_queue)
+        return self._queue
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue else 0
+
+    # --- URL -> file_id lar keshi (bazada; qismlarga bo'lingan fayl uchun bir nechta) ---
+    async def cached(self, url):
+        row = await self.db.fetchone("SELECT file_id, created FROM link_cache WHERE url=?", (url,))
+        if row and time.time() - row[1] < self.ttl:
+            self.stats["cache_hits"] += 1; return row[0].split("\n")
+        return None
+
+    async def remember(self, url, file_ids):
+        if file_ids and all(file_ids):
+            await self.db.execute("INSERT OR REPLACE INTO link_cache VALUES (?, ?, ?)", (url, "\n".join(file_ids), time.time()))
+
+    async def forget(self, url):
+        await self.db.execute("DELETE FROM link_cache WHERE url=?", (url,))
+
+    # --- Navbat va ishchilar ---
+    async def _worker(self):
+        q = self._get_queue()
+        while True:
+            url, job, fut = await q.get()
+            try:
+                file_ids = await job()
+                await self.remember(url, file_ids)
+                if not fut.done(): fut.set_result(file_ids)
+            except asyncio.CancelledError:
+                if not fut.done(): fut.cancel()
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                if not fut.done(): fut.set_exception(e)
+            finally: self._inflight.pop(url, None)
+
+    def start(self):
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def run(self, url, job):
+        """job() -> [file_id, ...]. Shu URL allaqachon yuklanayotgan bo'lsa, o'sha natija kutiladi.
+        (file_id lar, birinchimi) qaytaradi: birinchi so'rov faylni o'zi yuborgan bo'ladi."""
+        fut = self._inflight.get(url)
+        if fut:
+            self.stats["joined"] += 1
+            return await asyncio.shield(fut), False
+        fut = asyncio.get_running_loop().create_future()
+        try: self._get_queue().put_nowait((url, job, fut))
+        except asyncio.QueueFull: raise RuntimeError("Navbat to'la, keyinroq urinib ko'ring.")
+        self._inflight[url] = fut; self.stats["jobs"] += 1
+        self.start()
+        return await asyncio.shield(fut), True
+
+    async def stop(self):
+        for t in self._tasks: t.cancel()
+        if self._tasks: await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
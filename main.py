@@ -1,23 +1,38 @@
+import time
+BOOT_STARTED = time.perf_counter()   # sovuq start o'lchovi importlardan oldin boshlanadi
 import asyncio
 import os
-import time
 import shutil
 import glob
-import sqlite3
 import random
 import math
 import html
-import yt_dlp
+import json
 from datetime import datetime, timedelta
-from pyrogram import Client, filters, enums
+from pyrogram import Client, filters, enums, idle
 from pyrogram.types import Message
-import google.generativeai as genai
 from config import API_ID, API_HASH, GEMINI_API_KEY
+from storage import Database, BatchWriter
+from lazy import IMPORT_TIMES, LazyModule
+from router import ModelRouter
+from scheduler import AIScheduler, INTERACTIVE, BACKGROUND, PRIORITY_NAMES
+from cache import ResultCache, UploadCache, make_key
+from media import MediaStore, StreamBuffer, cut_segment, merge_overlap, plan_segments, split_for_upload
+from edits import EditScheduler
+from digest import DigestBuffer, build_digest_prompt, format_digest, parse_digest
+from dedupe import DuplicateIndex
+from outbox import Outbox
+from retention import RetentionManager, archive_months, search_archive
+from search import message_link, parse_date_range, parse_search_args, search_messages
+from links import LinkService, TG_UPLOAD_LIMIT, choose_format, link_key, parse_link_args
+from backup import ArchiveWriter, DownloadPool, PageWriter, fetch_messages, prefetch_media, scan_history, BACKUP_TYPES, VOLUME_SIZE
 
 # ==========================================================
 # --- 1. SOZLAMALAR ---
 # ==========================================================
-genai.configure(api_key=GEMINI_API_KEY)
+# Og'ir kutubxonalar birinchi ishlatilganda yuklanadi (start va pytest tezroq)
+genai = LazyModule("google.generativeai", on_load=lambda m: m.configure(api_key=GEMINI_API_KEY))
+yt_dlp = LazyModule("yt_dlp")
 
 safety_settings = [
     {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
@@ -26,80 +41,158 @@ safety_settings = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
 ]
 
-try:
-    model = genai.GenerativeModel('gemini-2.0-flash', safety_settings=safety_settings)
-except:
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash', safety_settings=safety_settings)
-    except:
-        model = genai.GenerativeModel('gemini-pro', safety_settings=safety_settings)
+# Vazifa -> nomzod modellar (tartib bo'yicha). Modellar birinchi so'rovda quriladi,
+# API da yo'qlari tashlanadi; sekin yoki xato bergani vaqtincha keyingisiga almashtiriladi
+GEMINI_MODELS = ['gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-pro']
+MODEL_ROUTES = {
+    "default": GEMINI_MODELS,
+    "translate": ['gemini-2.0-flash-lite', 'gemini-2.0-flash', 'gemini-1.5-flash'],
+    "summarize": ['gemini-2.0-flash-lite', 'gemini-2.0-flash', 'gemini-1.5-flash'],
+    "news": ['gemini-2.0-flash-lite', 'gemini-2.0-flash', 'gemini-1.5-flash'],
+    "transcribe": ['gemini-2.0-flash', 'gemini-1.5-flash', 'gemini-1.5-pro'],
+}
+MODEL_SLOW_P95 = {"translate": 8, "summarize": 15, "news": 30, "transcribe": 120}   # soniya
+model = ModelRouter(genai, MODEL_ROUTES, slow=MODEL_SLOW_P95, cooldown=120, safety_settings=safety_settings)
+
+# Gemini limitlari: parallel so'rovlar, daqiqasiga so'rov va token
+GEMINI_WORKERS = 4
+GEMINI_RPM = 15
+GEMINI_TPM = 1_000_000
+ai_scheduler = AIScheduler(max_workers=GEMINI_WORKERS, rpm=GEMINI_RPM, tpm=GEMINI_TPM)
 
 app = Client("my_userbot", api_id=API_ID, api_hash=API_HASH)
+# Progress, .type va status xabarlari uchun yagona tahrirlash navbati
+editor = EditScheduler(global_per_min=1500, chat_per_min=40, min_interval=1.5)
+db = Database('userbot.db')
+LOG_INSERT_SQL = "INSERT INTO messages (date, chat_id, sender_id, text, type, msg_id) VALUES (?, ?, ?, ?, ?, ?)"
+# Shaxsiy xabarlar logi: har 200 qator yoki 0.5 soniyada bitta commit
+log_writer = BatchWriter(db, LOG_INSERT_SQL, max_batch=200, max_delay=0.5)
+# AI natijalar keshi: 512 ta xotirada, bazada 7 kun / 20000 yozuvgacha
+ai_cache = ResultCache(db, max_memory=512, ttl=7 * 24 * 3600, max_rows=20000)
 active_backups = set()
+BACKUP_PARALLEL = 4   # backup paytida bir vaqtda yuklanadigan media soni
+BACKUP_PAGE_SIZE = 500  # bitta HTML sahifadagi xabarlar soni
+BACKUP_VOLUME_SIZE = VOLUME_SIZE  # ZIP tomining maksimal hajmi
+BACKUP_DIR = "backups"  # davomli (.backup inc) backuplar doimiy saqlanadigan joy
+# Uzun audio/video: bo'laklab, parallel transkripsiya
+LONG_MEDIA_SECONDS = 600    # bundan uzun media bo'laklarga bo'linadi
+TRANSCRIBE_SEGMENT = 600    # bo'lak uzunligi (soniya)
+TRANSCRIBE_OVERLAP = 8      # qo'shni bo'laklar ustma-ust qismi (so'z kesilmasligi uchun)
+TRANSCRIBE_PARALLEL = 3     # bir vaqtda ishlanadigan bo'laklar
+# Media ombori: takroriy stiker/rasm/video qayta yuklanmaydi (5 GB gacha, LRU)
+media_store = MediaStore(db, root="media_store", budget=5 * 1024 ** 3)
+# Geminiga yuklangan fayllar file_unique_id bo'yicha (muddati tugaguncha qayta yuklanmaydi)
+upload_cache = UploadCache(max_items=256)
+# .link: 2 ta parallel yuklash, 20 tagacha navbat; URL -> file_id 30 kun saqlanadi
+link_service = LinkService(db, workers=2, max_queue=20, ttl=30 * 24 * 3600)
+LINK_FRAGMENTS = 8                  # HLS/DASH: bir vaqtda yuklanadigan bo'laklar
+LINK_UPLOAD_LIMIT = TG_UPLOAD_LIMIT # bundan katta fayl qismlarga bo'lib yuboriladi
+# Log saqlash muddati: 180 kundan eski yoki baza 512 MB dan oshsa — archive/ ga (.retention bilan o'zgaradi)
+retention = RetentionManager(db, folder="archive", max_age_days=180, max_bytes=512 * 1024 ** 2)
+UPLOAD_MIME = {"voice": "audio/ogg", "audio": "audio/mpeg", "video_note": "video/mp4", "video": "video/mp4"}
+UPLOAD_CHUNK = 4 * 1024 * 1024   # oqimli yuklash bo'lagi (256 KiB ga karrali): yuklash yuklab olish bilan parallel
 
 # ==========================================================
 # --- 2. BAZA VA YORDAMCHI FUNKSIYALAR ---
 # ==========================================================
 
 def init_db():
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS messages
-                 (date text, chat_id integer, sender_id integer, text text, type text)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS settings
-                 (key text primary key, value text)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS sources
-                 (chat_id integer primary key, title text)''')
-    conn.commit()
-    conn.close()
-
-def set_setting(key, value):
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, str(value)))
-    conn.commit()
-    conn.close()
-
-def get_setting(key):
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key=?", (key,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
-
-def add_source_channel(chat_id, title):
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (chat_id, title))
-    conn.commit()
-    conn.close()
-
-def remove_source_channel(chat_id):
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM sources WHERE chat_id=?", (chat_id,))
-    conn.commit()
-    conn.close()
-
-def get_all_sources():
-    conn = sqlite3.connect('userbot.db')
-    c = conn.cursor()
-    c.execute("SELECT chat_id FROM sources")
-    result = {row[0] for row in c.fetchall()}
-    conn.close()
-    return result
-
-def log_message(message: Message, msg_type="incoming"):
-    try:
-        conn = sqlite3.connect('userbot.db')
-        c = conn.cursor()
-        text = message.text or message.caption or "[Media]"
-        c.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", 
-                  (message.date, message.chat.id, message.from_user.id if message.from_user else 0, text, msg_type))
-        conn.commit()
-        conn.close()
-    except: pass
+    # Ulanishni ochadi va migratsiyalarni bajaradi (DB oqimida)
+    db.open()
+
+# --- KESH: manbalar va sozlamalar xotirada (channel_monitor issiq yo'li uchun) ---
+sources_cache = set()
+settings_cache = {}
+cache_stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+async def load_cache():
+    rows = await db.fetchall("SELECT chat_id FROM sources")
+    sources_cache.clear(); sources_cache.update(r[0] for r in rows)
+    rows = await db.fetchall("SELECT key, value FROM settings")
+    settings_cache.clear(); settings_cache.update(rows)
+    if settings_cache.get("retention_days"): retention.max_age_days = int(settings_cache["retention_days"])
+    if settings_cache.get("retention_mb"): retention.max_bytes = int(settings_cache["retention_mb"]) * 1024 ** 2
+    if settings_cache.get("digest_window"): news_digest.window = int(settings_cache["digest_window"])
+    if settings_cache.get("digest_max"): news_digest.max_items = int(settings_cache["digest_max"])
+
+async def set_setting(key, value):
+    await db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, str(value)))
+    settings_cache[key] = str(value)
+
+async def get_setting(key):
+    if key in settings_cache:
+        cache_stats["hits"] += 1
+        return settings_cache[key]
+    cache_stats["misses"] += 1
+    result = await db.fetchone("SELECT value FROM settings WHERE key=?", (key,))
+    settings_cache[key] = result[0] if result else None
+    return settings_cache[key]
+
+async def add_source_channel(chat_id, title):
+    await db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (chat_id, title))
+    sources_cache.add(chat_id)
+
+async def remove_source_channel(chat_id):
+    await db.execute("DELETE FROM sources WHERE chat_id=?", (chat_id,))
+    sources_cache.discard(chat_id)
+
+async def get_all_sources():
+    return set(sources_cache)
+
+async def log_message(message: Message, msg_type="incoming"):
+    text = message.text or message.caption or "[Media]"
+    await log_writer.put((str(message.date), message.chat.id, message.from_user.id if message.from_user else 0, text, msg_type, message.id))
+
+async def log_stats(days=7, top=5):
+    # Faqat yig'ma jadvallardan o'qiladi — logning hajmiga bog'liq emas
+    def _do(conn):
+        total = conn.execute("SELECT incoming, outgoing FROM stats_total WHERE id=1").fetchone() or (0, 0)
+        chats = conn.execute("SELECT chat_id, incoming, outgoing FROM stats_chat ORDER BY total DESC LIMIT ?", (top,)).fetchall()
+        daily = conn.execute("SELECT day, incoming, outgoing FROM stats_day ORDER BY day DESC LIMIT ?", (days,)).fetchall()
+        return total, chats, daily
+    return await db.run(_do)
+
+# --- START VAQTI HISOBOTI ---
+async def record_startup(phases):
+    total = sum(phases.values())
+    await db.execute("INSERT INTO startup_times VALUES (?, ?, ?)", (str(datetime.now()), total, json.dumps(phases)))
+    print("🚀 Start: " + " | ".join(f"{k} {v} ms" for k, v in phases.items()) + f" | jami {total} ms")
+    return total
+
+async def startup_summary(last=10):
+    rows = await db.fetchall("SELECT total_ms FROM startup_times ORDER BY rowid DESC LIMIT ?", (last,))
+    if not rows: return None
+    values = sorted(r[0] for r in rows)
+    return rows[0][0], values[len(values) // 2]
+
+# --- BACKUP NAZORAT NUQTALARI ---
+async def load_checkpoint(chat_id):
+    row = await db.fetchone("SELECT last_id, pages FROM backup_checkpoints WHERE chat_id=?", (chat_id,))
+    return (row[0], json.loads(row[1])) if row else (0, [])
+
+async def save_checkpoint(chat_id, pages):
+    last_id = pages[-1][4] if pages else 0
+    await db.execute("""INSERT INTO backup_checkpoints (chat_id, last_id, pages, updated, delivered_id) VALUES (?, ?, ?, ?, 0)
+                        ON CONFLICT(chat_id) DO UPDATE SET last_id=excluded.last_id, pages=excluded.pages, updated=excluded.updated""",
+                     (chat_id, last_id, json.dumps(pages), str(datetime.now())))
+
+# Nazorat nuqtasi diskdagi holatni bildiradi; "yetkazilgan" chegara esa faqat
+# barcha tomlar yuborilgandan keyin suriladi — uzilgan backup keyingi deltaga qo'shiladi
+async def load_delivered(chat_id, folder):
+    row = await db.fetchone("SELECT delivered_id FROM backup_checkpoints WHERE chat_id=?", (chat_id,))
+    rows = await db.fetchall("SELECT path FROM backup_media WHERE chat_id=? AND sent=0", (chat_id,))
+    return (row[0] or 0) if row else 0, {os.path.join(folder, r[0]) for r in rows}
+
+async def mark_delivered(chat_id):
+    await db.execute("UPDATE backup_media SET sent=1 WHERE chat_id=? AND sent=0", (chat_id,))
+    await db.execute("UPDATE backup_checkpoints SET delivered_id=last_id WHERE chat_id=?", (chat_id,))
+
+async def load_manifest(chat_id, folder):
+    rows = await db.fetchall("SELECT msg_id, path FROM backup_media WHERE chat_id=?", (chat_id,))
+    return {r[0]: os.path.join(folder, r[1]) for r in rows}
+
+async def add_to_manifest(chat_id, msg_id, path, folder):
+    await db.execute("INSERT OR REPLACE INTO backup_media (chat_id, msg_id, path, sent) VALUES (?, ?, ?, 0)", (chat_id, msg_id, os.path.relpath(path, folder)))
 
 # --- PROGRESS BAR ---
 def humanbytes(size):
@@ -112,14 +205,9 @@ def humanbytes(size):
         n += 1
     return str(round(size, 2)) + " " + dic_powerN[n] + 'B'
 
-last_update_time = {}
-
 async def progress_bar(current, total, message: Message, start_time, action_text):
+    # Throttling editor ichida: har xabar uchun faqat oxirgi kadr yuboriladi
     now = time.time()
-    chat_id = message.chat.id
-    if chat_id in last_update_time and (now - last_update_time[chat_id] < 3) and (current != total):
-        return
-    last_update_time[chat_id] = now
     percentage = current * 100 / total
     speed = current / (now - start_time) if (now - start_time) > 0 else 0
     
@@ -128,16 +216,140 @@ async def progress_bar(current, total, message: Message, start_time, action_text
         ''.join(["□" for i in range(10 - math.floor(percentage / 10))])
     )
     text = f"{action_text}\n{progress_str} **{round(percentage, 1)}%**\n💾 {humanbytes(current)} / {humanbytes(total)}\n🚀 {humanbytes(speed)}/s"
-    try: await message.edit_text(text)
-    except: pass
+    await editor.edit(message, text)
 
 # --- AI HELPER ---
+def estimate_tokens(contents):
+    # Taxminan: 4 belgi ~ 1 token (fayllar alohida hisoblanmaydi)
+    parts = contents if isinstance(contents, list) else [contents]
+    return max(1, sum(len(p) for p in parts if isinstance(p, str)) // 4)
+
+async def ask_ai(contents, priority=INTERACTIVE, task="default"):
+    return await ai_scheduler.submit(model.generate_content, contents, task=task, priority=priority, tokens=estimate_tokens(contents))
+
+async def ask_ai_cached(task, text, contents, lang="", priority=INTERACTIVE):
+    # Avval kesh, keyin tarmoq. Kalitga prompt emas, vazifa + asl matn kiradi
+    key = make_key(task, model.primary(task), lang, text)
+    hit = await ai_cache.get(key)
+    if hit is not None: return hit
+    res = await ask_ai(contents, priority=priority, task=task)
+    await ai_cache.set(key, res.text)
+    return res.text
+
+# --- STREAMING: javob bo'laklab keladi, xabar throttling bilan tahrirlanadi ---
+TG_LIMIT = 4096
+STREAM_EDIT_INTERVAL = 1.5  # Telegram edit limitlariga sig'ish uchun
+
+async def stream_ai(contents, priority=INTERACTIVE, task="default"):
+    loop = asyncio.get_running_loop(); q = asyncio.Queue()
+
+    def produce():
+        emitted = False
+        try:
+            res = model.generate_content(contents, task=task, stream=True)
+            for chunk in (res if hasattr(res, "__iter__") else [res]):
+                try: t = chunk.text
+                except ValueError: continue
+                if t: emitted = True; loop.call_soon_threadsafe(q.put_nowait, t)
+        except Exception as e:
+            # Matn chiqib bo'lgach qayta urinish takror matn beradi — bunday xato qayta urinilmaydi
+            if emitted: raise RuntimeError(str(e)) from e
+            raise
+
+    job = asyncio.ensure_future(ai_scheduler.submit(produce, priority=priority, tokens=estimate_tokens(contents)))
+    job.add_done_callback(lambda _: q.put_nowait(None))
+    try:
+        while (t := await q.get()) is not None: yield t
+        await job
+    finally:
+        if not job.done(): job.cancel()
+
+async def _once(text):
+    yield text
+
+async def render_stream(message: Message, header, chunks):
+    # Bo'laklar to'planadi, xabar har STREAM_EDIT_INTERVAL da bir marta tahrirlanadi.
+    # 4096 dan oshsa davomi keyingi xabarga o'tadi.
+    loop = asyncio.get_running_loop()
+    state = {"full": "", "offset": 0, "msg": message, "head": header, "shown": None}
+
+    async def render(final):
+        while len(state["head"]) + len(state["full"]) - state["offset"] > TG_LIMIT:
+            cut = state["offset"] + TG_LIMIT - len(state["head"])
+            nl = state["full"].rfind("\n", state["offset"], cut)
+            if nl > state["offset"]: cut = nl + 1
+            await editor.edit(state["msg"], state["head"] + state["full"][state["offset"]:cut], final=True)
+            state["offset"] = cut; state["head"] = ""
+            state["msg"] = await app.send_message(message.chat.id, "▌", reply_to_message_id=state["msg"].id)
+        body = state["head"] + state["full"][state["offset"]:] + ("" if final else " ▌")
+        if body != state["shown"]:
+            await editor.edit(state["msg"], body, final=final); state["shown"] = body
+
+    # Birinchi matn darhol ko'rsatiladi, keyingi tahrirlar STREAM_EDIT_INTERVAL bilan cheklanadi
+    last = float("-inf")
+    async for chunk in chunks:
+        state["full"] += chunk
+        if state["full"] and loop.time() - last >= STREAM_EDIT_INTERVAL: await render(False); last = loop.time()
+    await render(True)
+    return state["full"]
+
+async def stream_answer(message: Message, header, task, text, contents, lang=""):
+    key = make_key(task, model.primary(task), lang, text)
+    hit = await ai_cache.get(key)
+    full = await render_stream(message, header, _once(hit) if hit is not None else stream_ai(contents, task=task))
+    if hit is None: await ai_cache.set(key, full)
+    return full
+
 async def summarize_news(text, channel_name):
+    # Xato yutilmaydi: outbox vazifani keyinroq qayta urinadi
     prompt = f"Quyidagi yangilik '{channel_name}' kanalida chiqdi. Uning eng asosiy mazmunini 2-3 ta gap bilan O'zbek tilida yozib ber:\n\n{text}"
-    try:
-        response = await asyncio.to_thread(model.generate_content, prompt)
-        return response.text
-    except: return None
+    return await ask_ai_cached("news", text, prompt, lang="uz", priority=BACKGROUND)
+
+# --- DAYJEST: bir nechta post bitta so'rovda ---
+async def summarize_batch(items):
+    """Har post uchun qisqa matn: keshdagilar qayta so'ralmaydi, qolganlari bitta so'rovda."""
+    keys = [make_key("news", model.primary("news"), "uz", it["text"]) for it in items]
+    summaries = [await ai_cache.get(k) for k in keys]
+    todo = [i for i, s in enumerate(summaries) if s is None]
+    if todo:
+        prompt = build_digest_prompt([items[i] for i in todo])
+        res = await ask_ai(prompt, priority=BACKGROUND, task="news"); parsed = parse_digest(res.text, len(todo))
+        for i, s in zip(todo, parsed):
+            if s: summaries[i] = s; await ai_cache.set(keys[i], s)
+    # Javobda tushib qolganlari alohida so'raladi, u ham bo'lmasa — post boshi
+    for i, s in enumerate(summaries):
+        if s is None: summaries[i] = await summarize_news(items[i]["text"], items[i]["channel"]) or items[i]["text"][:300]
+    return summaries
+
+# --- OUTBOX VAZIFALARI: xato bo'lsa Outbox qayta urinadi ---
+async def deliver_news(item):
+    dest = await get_setting("dest_channel")
+    if not dest or dest == "off": return
+    sum_text = await summarize_news(item["text"], item["channel"]) or item["text"][:300]
+    await app.send_message(int(dest), f"{sum_text}\n\n📰 {item['channel']}\n🔗 {item['link']}")
+
+async def deliver_digest(payload):
+    dest = await get_setting("dest_channel")
+    if not dest or dest == "off": return
+    # Xulosalar keshda: qayta urinishda matn bir xil, yuborilgan qismlar takrorlanmaydi
+    parts = format_digest(payload["items"], await summarize_batch(payload["items"]), TG_LIMIT)
+    for i in range(payload.get("sent", 0), len(parts)):
+        await app.send_message(int(dest), parts[i]); payload["sent"] = i + 1
+
+outbox = Outbox(db, {"news": deliver_news, "digest": deliver_digest})
+
+async def enqueue_digest(items):
+    # Postlar kelganda 'buffered' bo'lib yozilgan — endi bitta dayjest vazifasiga almashtiriladi
+    await outbox.bundle([it["id"] for it in items if "id" in it], "digest", {"items": items})
+
+async def restore_digest():
+    # Oldingi jarayon dayjest oynasi tugamasdan to'xtagan bo'lsa, postlar buferga qaytadi
+    for row_id, item in await outbox.buffered(): news_digest.add({**item, "id": row_id})
+
+# Dayjest rejimi: 5 daqiqa yoki 10 ta post — qaysi biri oldin bo'lsa (.digest bilan o'zgaradi)
+news_digest = DigestBuffer(enqueue_digest, window=300, max_items=10)
+# Oxirgi 6 soatdagi postlar izlari: boshqa kanaldagi deyarli bir xil post qayta xulosa qilinmaydi
+news_dedupe = DuplicateIndex()
 
 # --- HTML STYLES (TELEGRAM DARK MODE) ---
 HTML_HEAD = """
@@ -155,6 +367,8 @@ HTML_HEAD = """
     .meta { font-size: 11px; color: #8fa0b5; text-align: right; margin-top: 4px; }
     img, video { max-width: 100%; border-radius: 8px; margin-bottom: 5px; display: block; }
     audio { width: 100%; margin-top: 5px; }
+    .nav { display: flex; justify-content: space-between; gap: 12px; padding: 10px 0; }
+    .nav a { color: #64b5f6; text-decoration: none; }
 </style>
 </head>
 <body><div class="container">
@@ -178,17 +392,47 @@ async def stop_handler(client, message):
 async def set_dest_handler(client, message):
     if len(message.command) < 2: return await message.edit_text("❌ ID kiriting.")
     target = message.command[1]
-    if target == "off": set_setting("dest_channel", "off"); return await message.edit_text("🔕 O'chirildi.")
-    try: chat = await app.get_chat(target); set_setting("dest_channel", chat.id); await message.edit_text(f"✅ Qabul: {chat.title}")
+    if target == "off": await set_setting("dest_channel", "off"); return await message.edit_text("🔕 O'chirildi.")
+    try: chat = await app.get_chat(target); await set_setting("dest_channel", chat.id); await message.edit_text(f"✅ Qabul: {chat.title}")
     except: await message.edit_text("❌ Kanal topilmadi.")
 
+@app.on_message(filters.me & filters.command("digest", prefixes="."))
+async def digest_handler(client, message):
+    # .digest on [soniya] [soni] | .digest off | .digest now | .digest — holat
+    args = message.command[1:]
+    if args and args[0] == "off":
+        await set_setting("digest_mode", "off"); news_digest.flush_now()
+        return await message.edit_text("🔕 Dayjest o'chirildi: har post alohida.")
+    if args and args[0] == "now":
+        n = len(news_digest.items); news_digest.flush_now()
+        return await message.edit_text(f"📤 Buferdagi {n} ta post yuborilmoqda.")
+    if args and args[0] == "on":
+        if not all(a.isdigit() for a in args[1:3]): return await message.edit_text("❌ Format: `.digest on 300 10` (soniya, post soni)")
+        await set_setting("digest_mode", "on")
+        if len(args) > 1: await set_setting("digest_window", args[1]); news_digest.window = int(args[1])
+        if len(args) > 2: await set_setting("digest_max", args[2]); news_digest.max_items = int(args[2])
+    ds = news_digest.stats; mode = await get_setting("digest_mode")
+    await message.edit_text(f"🗞 Dayjest: {'✅ yoqilgan' if mode == 'on' else '🔕 o‘chiq'} | ⏱ {news_digest.window}s yoki {news_digest.max_items} ta"
+                            f"\n📥 Postlar: {ds['posts']} | 📤 Dayjestlar: {ds['digests']} | ⏳ Buferda: {len(news_digest.items)} | ❗️ Xato: {ds['failed']}")
+
+@app.on_message(filters.me & filters.command("outbox", prefixes="."))
+async def outbox_handler(client, message):
+    # .outbox — navbat holati | .outbox retry — bekor bo'lganlarni qayta navbatga
+    if message.command[1:2] == ["retry"]:
+        n = await outbox.retry_dead(); outbox.wake()
+        return await message.edit_text(f"🔁 {n} ta vazifa qayta navbatga qo'yildi.")
+    counts = await outbox.counts(); st = outbox.stats
+    await message.edit_text(f"📮 Outbox: ⏳ {counts.get('pending', 0)} kutmoqda | ⚙️ {counts.get('running', 0)} ishlanmoqda | 🗞 {counts.get('buffered', 0)} dayjestda | ☠️ {counts.get('dead', 0)} bekor"
+                            f"\n✅ Yuborildi: {st['delivered']} | 🔁 Qayta urinish: {st['retries']} | 🌊 FloodWait: {st['flood_waits']}"
+                            + (f"\n❗️ Oxirgi xato: `{outbox.last_error[:200]}`" if outbox.last_error else ""))
+
 @app.on_message(filters.me & filters.command("addsource", prefixes="."))
 async def add_source_handler(client, message):
     chat_id = message.chat.id; title = message.chat.title or "Kanal"
     if len(message.command) > 1:
         try: chat = await app.get_chat(message.command[1]); chat_id = chat.id; title = chat.title
         except: return await message.edit_text("❌ Xato.")
-    add_source_channel(chat_id, title)
+    await add_source_channel(chat_id, title)
     await message.edit_text(f"✅ Qo'shildi: {title}")
 
 @app.on_message(filters.me & filters.command("delsource", prefixes="."))
@@ -197,135 +441,310 @@ async def del_source_handler(client, message):
     if len(message.command) > 1:
         try: chat = await app.get_chat(message.command[1]); chat_id = chat.id
         except: pass
-    remove_source_channel(chat_id)
+    await remove_source_channel(chat_id)
     await message.edit_text(f"🗑 Olib tashlandi.")
 
 @app.on_message(filters.me & filters.command("listsources", prefixes="."))
 async def list_sources_handler(client, message):
-    conn = sqlite3.connect('userbot.db'); c = conn.cursor()
-    c.execute("SELECT title, chat_id FROM sources"); rows = c.fetchall(); conn.close()
+    rows = await db.fetchall("SELECT title, chat_id FROM sources")
     await message.edit_text("📋 **Manbalar:**\n\n" + "\n".join([f"• {r[0]}" for r in rows]) if rows else "📭 Bo'sh")
 
 # --- TOOLS ---
 
+# LazyModule atributlari faqat ishchi oqimda o'qiladi: birinchi murojaatdagi
+# import (va genai.configure) event loopni to'xtatib qo'ymaydi
+def gemini_upload(path):
+    return genai.upload_file(path)
+
+def ydl_call(opts, method, *args, **kwargs):
+    with yt_dlp.YoutubeDL(opts) as ydl: return getattr(ydl, method)(*args, **kwargs)
+
 # 1. TRANSCRIBE (.text)
+async def transcribe_segments(file_path, status, duration):
+    plan = plan_segments(duration, TRANSCRIBE_SEGMENT, TRANSCRIBE_OVERLAP)
+    work = f"{file_path}_parts"; os.makedirs(work, exist_ok=True)
+    sem = asyncio.Semaphore(TRANSCRIBE_PARALLEL); done = []
+
+    async def one(i, start, length):
+        async with sem:
+            part = await cut_segment(file_path, start, length, f"{work}/{i:03d}.ogg")
+            uploaded = await ai_scheduler.submit(gemini_upload, part)
+            res = await ask_ai([uploaded, "Transcribe verbatim."], task="transcribe")
+            done.append(i)
+            await editor.edit(status, f"🧠 Tahlil: {len(done)}/{len(plan)} bo'lak tayyor...")
+            return res.text
+
+    tasks = [asyncio.ensure_future(one(i, s, l)) for i, (s, l) in enumerate(plan)]
+    try: texts = await asyncio.gather(*tasks)
+    except Exception:
+        for t in tasks: t.cancel()
+        raise
+    finally: shutil.rmtree(work, ignore_errors=True)
+    # Natijalar tartib bilan ulanadi, ustma-ust qismdagi takror so'zlar olib tashlanadi
+    full = texts[0]
+    for t in texts[1:]: full = merge_overlap(full, t)
+    return full
+
+def upload_stream(fd, mime_type):
+    """genai.upload_file(fd) bilan bir xil (0.8 FileServiceClient.create_file), lekin bo'laklar kichik:
+    standart 100 MB bo'lakda yuklash butun fayl kelguncha boshlanmaydi. Ishchi oqimda chaqiriladi."""
+    get_file = genai.get_file   # genai yuklanadi va configure() ishlaydi
+    from googleapiclient.http import MediaIoBaseUpload
+    from google.generativeai.client import get_default_file_client
+    client = get_default_file_client()
+    if getattr(client._local, "discovery_api", None) is None: client._setup_discovery_api()
+    media = MediaIoBaseUpload(fd, mimetype=mime_type, chunksize=UPLOAD_CHUNK, resumable=True)
+    result = client._local.discovery_api.media().upload(body={"file": {}}, media_body=media).execute()
+    return get_file(result["file"]["name"])
+
+async def upload_streamed(target, media, status):
+    """Telegramdan kelayotgan bo'laklar to'g'ridan-to'g'ri Geminiga yuklanadi (disksiz)."""
+    kind = next(k for k in UPLOAD_MIME if getattr(target, k, None) is media)
+    buf = StreamBuffer(media.file_size)
+    upload = asyncio.ensure_future(ai_scheduler.submit(upload_stream, buf, getattr(media, "mime_type", None) or UPLOAD_MIME[kind]))
+    done = 0; start = time.time()
+    try:
+        async for chunk in app.stream_media(target):
+            if upload.done(): break   # yuklash xato bilan to'xtagan
+            buf.feed(chunk); done += len(chunk)
+            await progress_bar(done, media.file_size, status, start, "⬆️ Gemini'ga oqim...")
+        buf.finish()
+        return await upload
+    except BaseException as e:
+        buf.fail(e); upload.cancel()
+        raise
+    finally: buf.close()
+
+async def upload_media(target, media, status):
+    # Tartib: yuklangan fayl keshi -> media ombori -> oqimli yuklash
+    uploaded = upload_cache.get(media.file_unique_id)
+    if uploaded: return uploaded
+    stored = await media_store.lookup(target)
+    if stored: uploaded = await ai_scheduler.submit(gemini_upload, stored)
+    elif media.file_size: uploaded = await upload_streamed(target, media, status)
+    else:
+        file_path = await media_store.download(app, target, "downloads", progress=progress_bar, progress_args=(status, time.time(), "⬇️ Serverga..."))
+        try: uploaded = await ai_scheduler.submit(gemini_upload, file_path)
+        finally:
+            if file_path and os.path.exists(file_path): os.remove(file_path)
+    upload_cache.set(media.file_unique_id, uploaded)
+    return uploaded
+
 @app.on_message(filters.me & filters.command("text", prefixes="."))
 async def transcribe_handler(client, message):
     target = message.reply_to_message
     if not target or not (target.voice or target.audio or target.video_note or target.video):
         await message.edit_text("❌ Media reply qiling.")
         return
+    media = target.voice or target.audio or target.video_note or target.video
+    key = make_key("transcribe", model.primary("transcribe"), "", media.file_unique_id)
+    hit = await ai_cache.get(key)
+    if hit is not None: return await render_stream(message, "📝 **Matn:**\n\n", _once(hit))
     status = await message.edit_text("⬇️ Yuklanmoqda...")
     file_path = None; start = time.time()
     try:
-        file_path = await app.download_media(target, progress=progress_bar, progress_args=(status, start, "⬇️ Serverga..."))
-        await status.edit_text("🧠 Tahlil...")
-        uploaded = await asyncio.to_thread(genai.upload_file, file_path)
-        res = await asyncio.to_thread(model.generate_content, [uploaded, "Transcribe verbatim."])
-        await status.edit_text(f"📝 **Matn:**\n\n{res.text}")
-    except Exception as e: await status.edit_text(f"❌ {e}")
+        if (getattr(media, "duration", 0) or 0) > LONG_MEDIA_SECONDS:
+            # Uzun media ffmpeg bilan kesiladi — diskdagi fayl kerak
+            file_path = await media_store.download(app, target, "downloads", progress=progress_bar, progress_args=(status, start, "⬇️ Serverga..."))
+            await editor.edit(status, "🧠 Tahlil...", final=True)
+            full = await transcribe_segments(file_path, status, media.duration)
+            await render_stream(status, "📝 **Matn:**\n\n", _once(full))
+        else:
+            # Qisqa media: yuklab olish va Geminiga yuklash bir vaqtda, diskka yozilmaydi
+            uploaded = await upload_media(target, media, status)
+            await editor.edit(status, "🧠 Tahlil...", final=True)
+            try: full = await render_stream(status, "📝 **Matn:**\n\n", stream_ai([uploaded, "Transcribe verbatim."], task="transcribe"))
+            except Exception: upload_cache.discard(media.file_unique_id); raise
+        await ai_cache.set(key, full)
+    except Exception as e: await editor.edit(status, f"❌ {e}", final=True)
     finally:
         if file_path and os.path.exists(file_path): os.remove(file_path)
 
 # 2. DOWNLOAD (.link)
-@app.on_message(filters.me & filters.command("link", prefixes="."))
-async def download_link_handler(client, message):
-    if len(message.command) < 2: return await message.edit_text("❌ Link yo'q.")
-    url = message.command[1]; status = await message.edit_text(f"🔍 Tahlil...")
-    path = f"downloads/{message.id}"; os.makedirs(path, exist_ok=True)
-    opts = {'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best', 'outtmpl': f'{path}/%(title)s.%(ext)s', 'merge_output_format': 'mp4', 'noplaylist': True, 'quiet': True, 'no_warnings': True}
+async def fetch_link(url, profile, chat_id, status, caption):
+    # Navbatdagi ish: yuklab olib shu chatga yuboradi, file_id larni qaytaradi
+    path = f"downloads/link_{status.id}_{int(time.time() * 1000)}"; os.makedirs(path, exist_ok=True)
+    base = {'outtmpl': f'{path}/%(title)s.%(ext)s', 'noplaylist': True, 'quiet': True, 'no_warnings': True}
     try:
-        await status.edit_text("⬇️ Serverga...")
-        with yt_dlp.YoutubeDL(opts) as ydl: await asyncio.to_thread(ydl.download, [url])
+        await editor.edit(status, "🔍 Formatlar...")
+        info = await asyncio.to_thread(ydl_call, base, "extract_info", url, download=False)
+        # Format hajm bo'yicha oldindan tanlanadi; HLS/DASH bo'laklari parallel yuklanadi
+        choice = choose_format(info, profile, LINK_UPLOAD_LIMIT)
+        opts = {**base, 'format': choice["format"], 'concurrent_fragment_downloads': LINK_FRAGMENTS}
+        if choice["merge"]: opts['merge_output_format'] = 'mp4'
+        await editor.edit(status, f"⬇️ Serverga... ({choice['height']}p)" if choice["height"] else "⬇️ Serverga...")
+        # Qayta extract qilinmaydi: tayyor info dan yuklanadi
+        await asyncio.to_thread(ydl_call, opts, "process_ie_result", info, download=True)
         files = glob.glob(f"{path}/*")
-        if not files: return await status.edit_text("❌ Xato.")
-        await app.send_video(message.chat.id, video=files[0], caption=f"🔗 {url}", supports_streaming=True, progress=progress_bar, progress_args=(status, time.time(), "📤 Yuklanmoqda"))
-        await status.delete(); await message.delete()
-    except Exception as e: await status.edit_text(f"❌ {e}"); await asyncio.sleep(5); await status.delete()
+        if not files: raise RuntimeError("Xato.")
+        parts = await split_for_upload(files[0], LINK_UPLOAD_LIMIT, info.get("duration") or 0)
+        file_ids = []
+        for i, part in enumerate(parts, 1):
+            cap = caption if len(parts) == 1 else f"{caption}\n📦 {i}/{len(parts)}"
+            args = (status, time.time(), f"📤 Yuklanmoqda {i}/{len(parts)}")
+            if profile["audio"]: sent = await app.send_audio(chat_id, audio=part, caption=cap, progress=progress_bar, progress_args=args)
+            else: sent = await app.send_video(chat_id, video=part, caption=cap, supports_streaming=True, progress=progress_bar, progress_args=args)
+            media = getattr(sent, "audio", None) or getattr(sent, "video", None) or getattr(sent, "document", None)
+            file_ids.append(media.file_id if media else None)
+        return file_ids
     finally:
         if os.path.exists(path): shutil.rmtree(path)
 
-# 3. BACKUP (.backup) - SANA VA SONI BILAN
+@app.on_message(filters.me & filters.command("link", prefixes="."))
+async def download_link_handler(client, message):
+    # .link URL [-q 720] [-audio] [-fast]
+    try: url, profile = parse_link_args(message.command[1:])
+    except ValueError: return await message.edit_text("❌ Format: `.link URL [-q 720] [-audio] [-fast]`")
+    if not url: return await message.edit_text("❌ Link yo'q.")
+    key = link_key(url, profile); caption = f"🔗 {url}"
+    status = await message.edit_text(f"🔍 Tahlil...")
+    try:
+        # Oldin yuborilgan link: yuklamasdan, file_id orqali darhol qayta yuboriladi
+        file_ids = await link_service.cached(key)
+        if file_ids:
+            try:
+                for fid in file_ids: await app.send_cached_media(message.chat.id, fid, caption=caption)
+            except Exception: await link_service.forget(key); file_ids = None
+        if not file_ids:
+            if link_service.pending: await editor.edit(status, f"⏳ Navbatda: {link_service.pending} ta oldinda")
+            file_ids, first = await link_service.run(key, lambda: fetch_link(url, profile, message.chat.id, status, caption))
+            # Shu URL boshqa chatda yuklanayotgan edi — tayyor fayl qayta yuboriladi
+            if not first:
+                for fid in file_ids: await app.send_cached_media(message.chat.id, fid, caption=caption)
+        editor.cancel(status); await status.delete(); await message.delete()
+    except Exception as e: await editor.edit(status, f"❌ {e}", final=True); await asyncio.sleep(5); await status.delete()
+
+# 3. BACKUP (.backup) - SANA, SONI VA DAVOMLI (inc) REJIM
 @app.on_message(filters.me & filters.command("backup", prefixes="."))
 async def backup_handler(client, message):
     chat_id = message.chat.id
     if chat_id in active_backups: return await message.edit_text("⚠️ Backup ketmoqda.")
     
-    args = message.command[1] if len(message.command) > 1 else "200"
+    # Filtrlar: .backup 1000 -from @user -type photo
+    rest = message.command[1:]; flags = {}; positional = []
+    while rest:
+        if rest[0] in ("-from", "-type") and len(rest) > 1: flags[rest[0][1:]] = rest[1]; rest = rest[2:]
+        else: positional.append(rest.pop(0))
+    from_user = flags.get("from"); media_filter = None
+    if "type" in flags:
+        media_filter = BACKUP_TYPES.get(flags["type"].lower())
+        if not media_filter: return await message.edit_text(f"❌ Tur: {', '.join(BACKUP_TYPES)}")
+    args = positional[0] if positional else "200"
     limit_count = 0; start_date = None; end_date = None; mode_text = ""
-    is_date_mode = False
-
-    if "-" in args and len(args.split("-")) == 2:
+    is_inc = False; last_id = saved_id = delivered_id = 0; pages = []; manifest = {}; unsent = set()
+
+    if args == "inc":
+        if flags: return await message.edit_text("❌ `inc` rejimida filtr ishlatilmaydi.")
+        # Davomli rejim: faqat oxirgi nazorat nuqtasidan keyingi xabarlar
+        is_inc = True; last_id, pages = await load_checkpoint(chat_id); saved_id = last_id
+        # Chala qolgan oxirgi sahifa qayta yoziladi (uning mediasi manifestdan olinadi)
+        if pages and pages[-1][1] < BACKUP_PAGE_SIZE: pages.pop(); last_id = pages[-1][4] if pages else 0
+        mode_text = f"Davomi: #{last_id} dan keyin" if last_id else "To'liq (davomli)"
+    elif "-" in args and len(args.split("-")) == 2:
         try:
             parts = args.split("-")
             s_date = datetime.strptime(parts[0].strip(), "%d.%m.%Y")
             e_date = datetime.strptime(parts[1].strip(), "%d.%m.%Y").replace(hour=23, minute=59, second=59)
             if s_date > e_date: s_date, e_date = e_date, s_date
-            start_date, end_date, is_date_mode = s_date, e_date, True
+            start_date, end_date = s_date, e_date
             mode_text = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
         except: return await message.edit_text("❌ Format: `.backup 01.11.2024-05.11.2024`")
     elif args.isdigit():
         limit_count = int(args); mode_text = f"Oxirgi {limit_count} ta"
     else: return await message.edit_text("❌ Xato buyruq.")
+    if from_user: mode_text += f" | 👤 {from_user}"
+    if media_filter: mode_text += f" | 🗂 {flags['type']}"
 
     active_backups.add(chat_id)
     status = await message.edit_text(f"⏳ Backup boshlandi... ({mode_text})")
-    base_folder = f"backup_{chat_id}_{int(time.time())}"
+    if is_inc:
+        base_folder = os.path.join(BACKUP_DIR, str(chat_id))
+        zip_base = f"{base_folder}_{int(time.time())}"
+    else: base_folder = zip_base = f"backup_{chat_id}_{int(time.time())}"
     media_folder_abs = os.path.join(base_folder, "media")
     os.makedirs(media_folder_abs, exist_ok=True)
+    if is_inc:
+        manifest = await load_manifest(chat_id, base_folder)
+        delivered_id, unsent = await load_delivered(chat_id, base_folder)
     forced = False
     
     try:
-        msgs = []
-        async for m in app.get_chat_history(chat_id):
+        # 1-bosqich: faqat id lar yig'iladi (Message obyektlari xotirada saqlanmaydi).
+        # Skaner oraliq oxiriga sakraydi, filtrlar server tomonida ishlaydi
+        ids = []
+        async for mid in scan_history(app, chat_id, limit=limit_count, start_date=start_date, end_date=end_date,
+                                      min_id=last_id, from_user=from_user, media=media_filter):
             if chat_id not in active_backups: forced=True; break
-            if is_date_mode:
-                if m.date > end_date: continue
-                if m.date < start_date: break
-                msgs.append(m)
-            else:
-                if len(msgs) >= limit_count: break
-                msgs.append(m)
-            if len(msgs) % 50 == 0: await status.edit_text(f"⏳ Yig'ilmoqda: {len(msgs)} ta...")
-
-        if not msgs:
-            await status.edit_text("❌ Xabarlar topilmadi.")
-            active_backups.remove(chat_id); shutil.rmtree(base_folder); return
-
-        msgs.reverse()
-        html_content = HTML_HEAD
-        for i, m in enumerate(msgs):
-            if chat_id not in active_backups: forced=True; break
-            if i % 20 == 0: await status.edit_text(f"⏳ Fayllar yuklanmoqda: {i}/{len(msgs)}")
-            is_me = m.from_user and m.from_user.is_self; msg_class = "outgoing" if is_me else "incoming"
-            sender = html.escape(m.from_user.first_name if m.from_user else "Deleted")
-            text_content = html.escape(m.text or m.caption or "").replace("\n", "<br>")
-            date_str = m.date.strftime("%H:%M")
-            media_html = ""
-            if m.media:
-                try:
-                    fp = await app.download_media(m, file_name=media_folder_abs + "/")
-                    if fp:
-                        fn = os.path.basename(fp); rel = f"media/{fn}"
-                        if m.photo: media_html = f'<a href="{rel}"><img src="{rel}"></a>'
-                        elif m.video or m.video_note: media_html = f'<video controls><source src="{rel}"></video>'
-                        elif m.voice or m.audio: media_html = f'<audio controls><source src="{rel}"></audio>'
-                        else: media_html = f'<a href="{rel}">📎 {fn}</a>'
-                except: pass
-            html_content += f'<div class="message {msg_class}"><span class="sender-name">{sender}</span>{media_html}<div class="text">{text_content}</div><div class="meta">{date_str}</div></div>'
-        
-        html_content += HTML_FOOTER
-        if forced: raise Exception("To'xtatildi")
-        with open(f"{base_folder}/index.html", "w", encoding="utf-8") as f: f.write(html_content)
-        await status.edit_text("🗜 Arxivlanmoqda...")
-        shutil.make_archive(base_folder, 'zip', base_folder)
-        await app.send_document("me", f"{base_folder}.zip", caption=f"📦 Backup: {chat_id}\n📊 {len(msgs)} ta\n🎯 {mode_text}", progress=progress_bar, progress_args=(status, time.time(), "📤 Yuborilmoqda"))
-        await status.delete()
-    except Exception as e: await status.edit_text(f"❌ {e}")
+            ids.append(mid)
+            if len(ids) % 50 == 0: await editor.edit(status, f"⏳ Yig'ilmoqda: {len(ids)} ta...")
+
+        undelivered = delivered_id < saved_id or bool(unsent)
+        if is_inc and not forced and (not ids or ids[0] <= saved_id) and not undelivered: return await editor.edit(status, "✅ Yangi xabar yo'q.", final=True)
+        if not ids and not is_inc: return await editor.edit(status, "❌ Xabarlar topilmadi.", final=True)
+
+        ids.reverse()
+        writer = PageWriter(base_folder, HTML_HEAD, HTML_FOOTER, page_size=BACKUP_PAGE_SIZE, pages=pages)
+        # Arxiv yuklash bilan parallel to'ldiriladi: media va yopilgan sahifalar darhol qo'shiladi.
+        # Davomli rejimda arxivga faqat yangi/o'zgargan fayllar tushadi (eski arxiv ustiga ochiladi)
+        archive = ArchiveWriter(zip_base, base_folder, volume_size=BACKUP_VOLUME_SIZE)
+        pool = DownloadPool(app, media_folder_abs, parallel=BACKUP_PARALLEL, known=manifest, store=media_store)
+        # Arxivga qayta qo'shilmaydigan fayllar — faqat oldingi yetkazilgan deltalardagilar
+        known_paths = set(manifest.values()) - unsent
+        # 2-bosqich: xabarlar bo'laklab olinadi, media parallel yuklanadi,
+        # har bir xabar tayyor bo'lishi bilan sahifaga yoziladi
+        stream = prefetch_media(fetch_messages(app, chat_id, ids), pool, lookahead=BACKUP_PARALLEL * 8)
+        try:
+            async for m, fp in stream:
+                if chat_id not in active_backups: forced=True; break
+                if writer.count % 20 == 0: await editor.edit(status, f"⏳ Fayllar yuklanmoqda: {writer.count}/{len(ids)}")
+                is_me = m.from_user and m.from_user.is_self; msg_class = "outgoing" if is_me else "incoming"
+                sender = html.escape(m.from_user.first_name if m.from_user else "Deleted")
+                text_content = html.escape(m.text or m.caption or "").replace("\n", "<br>")
+                date_str = m.date.strftime("%H:%M")
+                media_html = ""
+                if fp:
+                    fn = os.path.basename(fp); rel = f"media/{fn}"
+                    if m.photo: media_html = f'<a href="{rel}"><img src="{rel}"></a>'
+                    elif m.video or m.video_note: media_html = f'<video controls><source src="{rel}"></video>'
+                    elif m.voice or m.audio: media_html = f'<audio controls><source src="{rel}"></audio>'
+                    else: media_html = f'<a href="{rel}">📎 {fn}</a>'
+                    if fp not in known_paths:
+                        archive.add(fp)
+                        if is_inc: await add_to_manifest(chat_id, m.id, fp, base_folder)
+                changed = writer.write(f'<div class="message {msg_class}"><span class="sender-name">{sender}</span>{media_html}<div class="text">{text_content}</div><div class="meta">{date_str}</div></div>',
+                                       m.date.strftime("%d.%m.%Y"), m.id)
+                for fp in changed: archive.add(fp)
+                # Sahifa yopildi — nazorat nuqtasini saqlaymiz, uzilsa shu yerdan davom etadi
+                if is_inc and changed: await save_checkpoint(chat_id, writer.closed_pages())
+        finally:
+            await stream.aclose(); await pool.close()
+            for fp in writer.finish(): archive.add(fp)
+
+        if forced:
+            await archive.abort()
+            raise Exception("To'xtatildi" + (" (keyingi .backup inc shu yerdan davom etadi)" if is_inc else ""))
+        if is_inc:
+            await save_checkpoint(chat_id, writer.closed_pages())
+            # Oldingi uzilgan (yuborilmagan) backupdan qolganlar: yetkazilgan chegaradan keyingi
+            # sahifalar (oldingisi ham — uning "Keyingi" havolasi o'zgargan) va yuborilmagan media
+            first = next((i for i, p in enumerate(writer.pages) if p[4] > delivered_id), len(writer.pages))
+            for p in writer.pages[max(first - 1, 0):]: archive.add(os.path.join(base_folder, p[0]))
+            for fp in unsent:
+                if os.path.exists(fp): archive.add(fp)
+        await editor.edit(status, "🗜 Arxivlanmoqda...", final=True)
+        volumes = await archive.close()
+        skipped = f"\n⚠️ Juda katta, arxivga kirmadi: {', '.join(archive.skipped)}" if archive.skipped else ""
+        for n, vol in enumerate(volumes, 1):
+            part = f" ({n}/{len(volumes)})" if len(volumes) > 1 else ""
+            await app.send_document("me", vol, caption=f"📦 Backup: {chat_id}{part}\n📊 {writer.count} ta ({len(writer.pages)} sahifa)\n🎯 {mode_text}{skipped}"[:1024], progress=progress_bar, progress_args=(status, time.time(), f"📤 Yuborilmoqda{part}"))
+        if is_inc: await mark_delivered(chat_id)
+        editor.cancel(status); await status.delete()
+    except Exception as e: await editor.edit(status, f"❌ {e}", final=True)
     finally:
         if chat_id in active_backups: active_backups.remove(chat_id)
-        if os.path.exists(base_folder): shutil.rmtree(base_folder)
-        if os.path.exists(f"{base_folder}.zip"): os.remove(f"{base_folder}.zip")
+        # Davomli backup papkasi saqlanadi, oddiy backup esa tozalanadi
+        if not is_inc and os.path.exists(base_folder): shutil.rmtree(base_folder)
+        for vol in glob.glob(f"{zip_base}*.zip"): os.remove(vol)
 
 # 4. TRANSLATE (.tr, .uz, .en, .ru) 
 @app.on_message(filters.me & filters.command(["tr", "uz", "en", "ru"], prefixes="."))
@@ -347,8 +766,8 @@ async def translation_handler(client, message):
     if text_args:
         txt = " ".join(text_args)
         try:
-            res = await asyncio.to_thread(model.generate_content, f"Translate to {target}. Output ONLY translation:\n\n{txt}")
-            await message.edit_text(res.text)
+            res = await ask_ai_cached("translate", txt, f"Translate to {target}. Output ONLY translation:\n\n{txt}", lang=lang_code)
+            await message.edit_text(res)
         except: pass
     
     # 2. Reply qilingan bo'lsa (Birovning gapini tarjima qilish)
@@ -358,8 +777,8 @@ async def translation_handler(client, message):
         if txt:
             await message.edit_text(f"🔄 ...")
             try:
-                res = await asyncio.to_thread(model.generate_content, f"Translate to {target}. Output only translation:\n\n{txt}")
-                await message.edit_text(f"🌍 **{lang_code.upper()}:**\n\n{res.text}")
+                await stream_answer(message, f"🌍 **{lang_code.upper()}:**\n\n", "translate", txt,
+                                    f"Translate to {target}. Output only translation:\n\n{txt}", lang=lang_code)
             except Exception as e: await message.edit_text(f"❌ {e}")
         else: await message.edit_text("❌ Matn yo'q.")
     else: await message.edit_text(f"⚠️ Namuna:\n`.{lang_code} Salom`\n`.{lang_code}` (Reply)")
@@ -371,7 +790,7 @@ async def summarize_handler(client, message):
     txt = target.text or target.caption if target else None
     if not txt: return await message.edit_text("❌ Matn yo'q.")
     await message.edit_text("🧠 ...")
-    try: res = await asyncio.to_thread(model.generate_content, f"Summarize in Uzbek:\n{txt}"); await message.edit_text(f"📌 **Qisqa:**\n{res.text}")
+    try: await stream_answer(message, "📌 **Qisqa:**\n", "summarize", txt, f"Summarize in Uzbek:\n{txt}", lang="uz")
     except Exception as e: await message.edit_text(f"❌ {e}")
 
 # 6. TYPE (.type)
@@ -380,31 +799,134 @@ async def type_handler(client, message):
     if len(message.command)<2: return
     txt = message.text.split(" ", 1)[1]; curr=""
     try:
-        for c in txt: curr+=c; await message.edit_text(curr+" ▌"); await asyncio.sleep(0.05)
-        await message.edit_text(curr)
-    except: await message.edit_text(txt)
+        # Oraliq kadrlar editor orqali: limitdan oshsa eskirganlari tashlanadi
+        for c in txt: curr+=c; await editor.edit(message, curr+" ▌"); await asyncio.sleep(0.05)
+        await editor.edit(message, curr, final=True)
+    except: await editor.edit(message, txt, final=True)
 
 @app.on_message(filters.me & filters.command("stats", prefixes="."))
 async def stats_handler(client, message):
-    conn = sqlite3.connect('userbot.db'); c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM messages"); cnt = c.fetchone()[0]; conn.close()
-    await message.edit_text(f"📊 Jami loglar: {cnt}")
+    await log_writer.flush()
+    (inc, out), chats, daily = await log_stats(); boot = await startup_summary()
+    sec = lambda v: f"{v:.1f}s" if v is not None else "—"
+    routes = "\n".join(f"  • {t}: {n or '—'} | p50 {sec(p50)} p95 {sec(p95)} | xato {err:.0%}" for t, (n, p50, p95, err) in model.report().items())
+    ls = log_writer.stats; cs = cache_stats; ac = ai_cache.stats; ms = media_store.stats; us = upload_cache.stats
+    ratio = lambda i, o: f"📥 {i} / 📤 {o}" + (f" (1:{o / i:.1f})" if i else "")
+    top = "\n".join(f"  • [{cid}](tg://user?id={cid}): {i + o} ({ratio(i, o)})" for cid, i, o in chats)
+    days = "\n".join(f"  • {d}: {i + o} ({ratio(i, o)})" for d, i, o in daily)
+    await message.edit_text(f"📊 Jami loglar: {inc + out} ({ratio(inc, out)})\n📝 Batch: {ls['batches']} | ❗️ Tashlangan: {ls['dropped']} | Xato: {ls['failed']}"
+                            f"\n⚡️ Kesh: {cs['hits']} hit / {cs['misses']} miss | 🚫 Rad: {cs['rejected']}"
+                            f"\n🧬 Takror yangiliklar: {news_dedupe.stats['duplicates']} / {news_dedupe.stats['checked']} (indeksda {len(news_dedupe)})"
+                            f"\n🧠 AI kesh: {ac['hits']} hit ({ac['db_hits']} bazadan) / {ac['misses']} miss"
+                            f"\n💾 Media ombori: {ms['downloads_avoided']} yuklash tejaldi ({humanbytes(ms['bytes_saved']) or '0 B'}) | ☁️ Gemini fayl: {us['hits']} qayta ishlatildi"
+                            f"\n🤖 AI navbat: " + " | ".join(f"{PRIORITY_NAMES[p]} {d}" for p, d in ai_scheduler.queue_depth().items())
+                            + (f"\n🚀 Start: {boot[0]} ms (oxirgi 10 ta mediana: {boot[1]} ms)" if boot else "")
+                            + ("\n📦 Kech yuklangan: " + ", ".join(f"{n} {ms} ms" for n, ms in IMPORT_TIMES.items()) if IMPORT_TIMES else "")
+                            + f"\n\n🧭 **Modellar** ({model.switches} almashish):\n{routes}"
+                            + (f"\n\n👥 **Top chatlar:**\n{top}" if top else "")
+                            + (f"\n\n📅 **Kunlik:**\n{days}" if days else ""))
+
+SEARCH_LIMIT = 10   # .search natijalari soni
+
+@app.on_message(filters.me & filters.command("search", prefixes="."))
+async def search_handler(client, message):
+    # .search so'z [-chat @user] [-from id] [-date 01.01.2024-31.01.2024]
+    query, flags = parse_search_args(message.command[1:])
+    if not query: return await message.edit_text("❌ Format: `.search so'z -chat @user -from @user -date 01.01.2024-31.01.2024`")
+    try:
+        ids = {}
+        for k in ("chat", "from"):
+            if k in flags: v = flags[k]; ids[k] = int(v) if v.lstrip("-").isdigit() else (await app.get_chat(v)).id
+        since, until = parse_date_range(flags["date"]) if "date" in flags else (None, None)
+    except Exception: return await message.edit_text("❌ Filtr xato (chat/foydalanuvchi yoki sana).")
+    await log_writer.flush()   # navbatdagi yangi xabarlar ham qidiruvga tushsin
+    rows = await search_messages(db, query, ids.get("chat"), ids.get("from"), since, until, SEARCH_LIMIT)
+    if flags.get("archive") and len(rows) < SEARCH_LIMIT:
+        # Arxivdagi eski xabarlar: indekssiz, faqat kerakli oylar o'qiladi
+        old = await asyncio.to_thread(search_archive, retention.folder, query, ids.get("chat"), ids.get("from"), since, until, SEARCH_LIMIT - len(rows))
+        rows += [(cid, sid, d, mid, t, "🗄 " + (text[:120] + "…" if len(text) > 120 else text)) for d, cid, sid, text, t, mid in old]
+    if not rows: return await message.edit_text(f"🔎 **{query}** — hech narsa topilmadi.")
+    lines = [f"{'📤' if t == 'out' else '📥'} {d[:16]} · [{cid}]({message_link(cid, mid)}): {snip}" for cid, _, d, mid, t, snip in rows]
+    await message.edit_text(f"🔎 **{query}** — {len(rows)} ta natija:\n\n" + "\n\n".join(lines))
+
+@app.on_message(filters.me & filters.command("retention", prefixes="."))
+async def retention_handler(client, message):
+    # .retention — holat | .retention 90 500 — kun va MB | .retention run — hozir bajarish
+    args = message.command[1:]
+    if args and args[0] == "run":
+        status = await message.edit_text("🗄 Arxivlanmoqda...")
+        try:
+            # Eski bazani incremental rejimga o'tkazish (bir martalik to'liq VACUUM) faqat shu yerda
+            converted = await retention.ensure_incremental()
+            n = await retention.run_once()
+        except Exception as e: return await editor.edit(status, f"❌ {e}", final=True)
+        return await editor.edit(status, f"✅ Arxivga: {n} ta xabar | ♻️ {retention.stats['vacuumed_pages']} sahifa bo'shatildi"
+                                 + ("\n🔧 Baza incremental VACUUM rejimiga o'tkazildi" if converted else ""), final=True)
+    if args:
+        if not all(a.isdigit() for a in args[:2]): return await message.edit_text("❌ Format: `.retention 90 500` (kun, MB; 0 — cheklovsiz)")
+        await set_setting("retention_days", args[0]); retention.max_age_days = int(args[0])
+        if len(args) > 1: await set_setting("retention_mb", args[1]); retention.max_bytes = int(args[1]) * 1024 ** 2
+    rs = retention.stats; live = await retention.live_bytes()
+    await message.edit_text(f"🗄 **Saqlash:** {retention.max_age_days or '∞'} kun | {humanbytes(retention.max_bytes) or '∞'}"
+                            f"\n💾 Baza: {humanbytes(live) or '0 B'} | 📦 Arxiv oylari: {len(archive_months(retention.folder))}"
+                            f"\n✅ Arxivlangan: {rs['archived']} | ♻️ Bo'shatilgan sahifa: {rs['vacuumed_pages']}"
+                            + ("" if await retention.is_incremental() else "\n⚠️ Bo'sh joy qaytarilmaydi: `.retention run` bazani bir marta to'liq VACUUM qiladi")
+                            + (f"\n❗️ {retention.last_error}" if retention.last_error else ""))
 
 @app.on_message(filters.channel & ~filters.me)
 async def channel_monitor(client, message):
-    if message.chat.id not in get_all_sources(): return
-    dest = get_setting("dest_channel")
+    # Manba bo'lmagan kanallar: bitta set tekshiruvi, hech qanday I/O yo'q
+    if message.chat.id not in sources_cache: cache_stats["rejected"] += 1; return
+    dest = await get_setting("dest_channel")
     if not dest or dest=="off": return
     txt = message.text or message.caption
     if txt and len(txt)>50:
-        sum_text = await summarize_news(txt, message.chat.title)
-        if sum_text: await app.send_message(int(dest), f"{sum_text}\n\n📰 {message.chat.title}\n🔗 {message.link}")
+        item = {"channel": message.chat.title, "text": txt, "link": message.link}
+        # Takror: Gemini ga so'rov ham, yangi xabar ham yo'q — asl postga manba sifatida qo'shiladi
+        original = news_dedupe.check(txt, item)
+        if original is not None:
+            # Asl post dayjest buferida bo'lsa, takror kanal unga manba sifatida qo'shiladi (bazada ham)
+            if "id" in original and item["channel"] != original["channel"] and item["channel"] not in original.get("also", []):
+                original.setdefault("also", []).append(item["channel"]); await outbox.update(original["id"], original)
+            return
+        # Dayjest rejimi: post darhol bazaga (buffered) va buferga; aks holda outbox ga — handler darhol qaytadi
+        if await get_setting("digest_mode") == "on":
+            item["id"] = await outbox.put("post", item, status="buffered")
+            return news_digest.add(item)
+        await outbox.put("news", item)
 
 @app.on_message(filters.me & filters.private)
-async def log_out(c, m): log_message(m, "out")
+async def log_out(c, m): await log_message(m, "out")
 @app.on_message(filters.private & ~filters.me & ~filters.bot)
-async def log_in(c, m): log_message(m, "in")
+async def log_in(c, m): await log_message(m, "in")
+
+# Modul yuklanishi tugadi (handlerlar ro'yxatdan o'tgan)
+IMPORT_MS = round((time.perf_counter() - BOOT_STARTED) * 1000)
+
+async def main():
+    phases = {"import": IMPORT_MS}; t = time.perf_counter()
+    def mark(name):
+        nonlocal t; now = time.perf_counter(); phases[name] = round((now - t) * 1000); t = now
+    init_db(); mark("db")
+    await load_cache(); mark("cache")
+    log_writer.start()
+    retention.start()
+    await app.start(); mark("telegram")
+    # Navbat ishchilari faqat klient ulangandan keyin: aks holda har qator AI so'rovini
+    # sarflab, "Client has not been started" bilan urinish va kechikish yo'qotadi
+    outbox.start()
+    await restore_digest()
+    await record_startup(phases)
+    try: await idle()
+    finally:
+        await news_digest.close()
+        await outbox.stop()
+        await app.stop()
+        await log_writer.stop()
+        await retention.stop()
+        await link_service.stop()
+        ai_scheduler.close()
+        db.close()
 
 if __name__ == "__main__":
-    init_db()
-    app.run()
\ No newline at end of file
+    app.run(main())
\ No newline at end of file
@@ -0,0 +1,229 @@
+import asyncio
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+# ==========================================================
+# --- MEDIA OMBORI (file_unique_id bo'yicha) ---
+# Bir xil stiker/rasm/video qayta yuklanmaydi: fayl omborda turadi,
+# kerakli joyga hard-link (yoki nusxa) qilinadi. Hajm chegarasi + LRU.
+# ==========================================================
+
+MEDIA_ATTRS = ("photo", "video", "audio", "voice", "video_note", "animation", "sticker", "document")
+
+
+def media_unique_id(m):
+    for attr in MEDIA_ATTRS:
+        obj = getattr(m, attr, None)
+        if obj and getattr(obj, "file_unique_id", None): return obj.file_unique_id
+    return None
+
+
+def link_or_copy(src, dest):
+    if os.path.exists(dest): os.remove(dest)
+    try: os.link(src, dest)
+    except OSError: shutil.copy2(src, dest)
+    return dest
+
+
+class MediaStore:
+    def __init__(self, db, root="media_store", budget=5 * 1024 ** 3):
+        self.db = db
+        self.root = root
+        self.budget = budget
+        self.stats = {"hits": 0, "misses": 0, "downloads_avoided": 0, "bytes_saved": 0, "evicted": 0}
+        self._total = None
+
+    async def _lookup(self, uid):
+        row = await self.db.fetchone("SELECT path, size FROM media_store WHERE unique_id=?", (uid,))
+        if row and not os.path.exists(row[0]):
+            await self.db.execute("DELETE FROM media_store WHERE unique_id=?", (uid,)); row = None
+        return row
+
+    async def lookup(self, m):
+        """Ombordagi fayl yo'li (bog'lamasdan) yoki None."""
+        uid = media_unique_id(m)
+        row = await self._lookup(uid) if uid else None
+        if not row: return None
+        self.stats["hits"] += 1; self.stats["downloads_avoided"] += 1; self.stats["bytes_saved"] += row[1]
+        return row[0]
+
+    async def reuse(self, m, dest_dir):
+        """Omborda bo'lsa, faylni dest_dir ga bog'lab yo'lini qaytaradi, aks holda None."""
+        uid = media_unique_id(m)
+        row = await self._lookup(uid) if uid else None
+        if not row:
+            self.stats["misses"] += 1; return None
+        await self.db.execute("UPDATE media_store SET last_used=? WHERE unique_id=?", (time.time(), uid))
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = await asyncio.to_thread(link_or_copy, row[0], os.path.join(dest_dir, os.path.basename(row[0])))
+        self.stats["hits"] += 1; self.stats["downloads_avoided"] += 1; self.stats["bytes_saved"] += row[1]
+        return dest
+
+    async def add(self, m, path):
+        uid = media_unique_id(m)
+        if not uid or not path or not os.path.exists(path): return None
+        os.makedirs(self.root, exist_ok=True)
+        stored = os.path.join(self.root, uid + os.path.splitext(path)[1])
+        await asyncio.to_thread(link_or_copy, path, stored)
+        size = os.path.getsize(stored)
+        if self._total is None:
+            self._total = (await self.db.fetchone("SELECT COALESCE(SUM(size), 0) FROM media_store"))[0]
+        await self.db.execute("INSERT OR REPLACE INTO media_store VALUES (?, ?, ?, ?)", (uid, stored, size, time.time()))
+        self._total += size
+        if self._total > self.budget: await self.evict(keep=uid)
+        return stored
+
+    async def evict(self, keep=None):
+        # Eng uzoq ishlatilmaganlar o'chiriladi (backup ichidagi hard-linklar saqlanib qoladi)
+        rows = await self.db.fetchall("SELECT unique_id, path, size FROM media_store ORDER BY last_used")
+        for uid, path, size in rows:
+            if self._total <= self.budget: break
+            if uid == keep: continue
+            if os.path.exists(path): os.remove(path)
+            await self.db.execute("DELETE FROM media_store WHERE unique_id=?", (uid,))
+            self._total -= size; self.stats["evicted"] += 1
+
+    async def download(self, client, m, dest_dir, **kwargs):
+        """Avval ombor, keyin Telegram. Yangi yuklangan fayl omborga qo'shiladi."""
+        path = await self.reuse(m, dest_dir)
+        if path: return path
+        path = await client.download_media(m, file_name=dest_dir.rstrip("/") + "/", **kwargs)
+        await self.add(m, path)
+        return path
+
+
+# ==========================================================
+# --- YUKLAB OLISH -> YUKLASH QUVURI (diskka yozmasdan) ---
+# Telegramdan kelgan bo'laklar buferga yoziladi, Gemini yuklovchisi esa
+# boshqa oqimda shu buferdan o'qiydi. Kichik fayllar faqat xotirada turadi.
+# ==========================================================
+
+SPOOL_LIMIT = 20 * 1024 * 1024
+
+
+class StreamBuffer(io.RawIOBase):
+    def __init__(self, size, spool=SPOOL_LIMIT):
+        self.size = size
+        self._buf = tempfile.SpooledTemporaryFile(max_size=spool)
+        self._written = 0
+        self._pos = 0
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    # --- Yozuvchi tomoni (event loop) ---
+    def feed(self, data):
+        with self._cond:
+            self._buf.seek(0, os.SEEK_END); self._buf.write(data)
+            self._written += len(data); self._cond.notify_all()
+
+    def finish(self):
+        with self._cond: self._done = True; self._cond.notify_all()
+
+    def fail(self, e):
+        with self._cond: self._error = e; self._cond.notify_all()
+
+    @property
+    def in_memory(self):
+        return not getattr(self._buf, "_rolled", True)
+
+    # --- O'quvchi tomoni (yuklovchi oqim) ---
+    def readable(self): return True
+    def seekable(self): return True
+    def tell(self): return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, n=-1):
+        with self._cond:
+            target = self.size if n is None or n < 0 else min(self._pos + n, self.size)
+            # Kerakli baytlar hali kelmagan bo'lsa — kutamiz
+            while self._written < target and not self._done and not self._error: self._cond.wait()
+            if self._error: raise IOError(f"Yuklab olish uzildi: {self._error}")
+            end = min(target, self._written)
+            if end <= self._pos: return b""
+            self._buf.seek(self._pos); data = self._buf.read(end - self._pos)
+            self._pos += len(data)
+            return data
+
+    def readinto(self, b):
+        data = self.read(len(b)); b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        with self._cond: self._buf.close()
+        super().close()
+
+
+# ==========================================================
+# --- UZUN AUDIO/VIDEO: BO'LAKLARGA BO'LISH (ffmpeg) ---
+# ==========================================================
+
+def plan_segments(duration, segment=600, overlap=8):
+    """(boshlanish, uzunlik) ro'yxati; qo'shni bo'laklar `overlap` soniya ustma-ust tushadi."""
+    plan, start = [], 0
+    while start < duration:
+        plan.append((start, min(segment + overlap, duration - start)))
+        start += segment
+    return plan
+
+
+async def _run(*cmd):
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    out, err = await proc.communicate()
+    if proc.returncode != 0: raise RuntimeError(f"{cmd[0]}: {err.decode(errors='ignore')[-200:]}")
+    return out.decode()
+
+
+async def probe_duration(path):
+    out = await _run("ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path)
+    return float(out.strip() or 0)
+
+
+async def cut_segment(path, start, length, dest):
+    # Faqat nutq uchun: mono, 16 kHz, opus — yuklash hajmi kichik
+    await _run("ffmpeg", "-y", "-v", "error", "-ss", str(start), "-t", str(length), "-i", path,
+               "-vn", "-ac", "1", "-ar", "16000", "-c:a", "libopus", "-b:a", "32k", dest)
+    return dest
+
+
+async def split_for_upload(path, limit, duration=0):
+    """limit dan katta faylni qayta kodlamasdan (-c copy) vaqt bo'yicha qismlarga bo'ladi."""
+    size = os.path.getsize(path)
+    if size <= limit: return [path]
+    duration = duration or await probe_duration(path)
+    # Bitreyt notekis bo'lishi mumkin — 10% zaxira
+    seg = max(1, int(duration * limit / size * 0.9))
+    base, ext = os.path.splitext(path)
+    await _run("ffmpeg", "-y", "-v", "error", "-i", path, "-map", "0", "-c", "copy", "-f", "segment",
+               "-segment_time", str(seg), "-reset_timestamps", "1", f"{base}.part%03d{ext}")
+    os.remove(path)
+    folder, prefix = os.path.split(base)
+    return sorted(os.path.join(folder, n) for n in os.listdir(folder or ".") if n.startswith(os.path.basename(prefix) + ".part"))
+
+
+def _words(text):
+    return [w.strip(".,!?;:«»\"'()—-").lower() for w in text.split()]
+
+
+def merge_overlap(left, right, max_words=60, min_match=3):
+    """Ustma-ust qismda takrorlangan so'zlarni olib tashlab, ikki matnni ulaydi."""
+    lw, rw = _words(left), _words(right)
+    start = max(0, len(lw) - max_words); tail = lw[start:]
+    # O'ng matn boshidagi eng uzun bo'lak chap matn oxirida uchrasa — u takror.
+    # Chap matn shu bo'lak boshida kesiladi: moslikdan keyingi so'zlar ham o'ng matnda bor
+    for n in range(min(max_words, len(rw)), min_match - 1, -1):
+        head = rw[:n]
+        found = [i for i in range(len(tail) - n + 1) if tail[i:i + n] == head]
+        if found:
+            cut = [m.start() for m in re.finditer(r"\S+", left)][start + found[-1]]
+            return (left[:cut].rstrip() + " " + right.strip()).lstrip()
+    return left.rstrip() + "\n" + right.strip()
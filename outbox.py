@@ -0,0 +1,149 @@
+import asyncio
+import json
+import time
+
+from pyrogram.errors import FloodWait
+
+# ==========================================================
+# --- DOIMIY NAVBAT (OUTBOX) ---
+# Kanal yangiliklari avval userbot.db ga yoziladi, handler darhol qaytadi.
+# Fon ishchilari ularni xulosa qilib yuboradi: xato bo'lsa kechikish bilan
+# qayta urinadi, FloodWait da hamma ishchi kutadi. Qator faqat muvaffaqiyatli
+# yuborilgandan keyin o'chadi — qayta ishga tushganda ham yo'qolmaydi.
+# ==========================================================
+
+
+class Outbox:
+    def __init__(self, db, handlers, workers=2, max_attempts=8, base_delay=5, max_delay=900, poll=30):
+        self.db = db
+        self.handlers = handlers     # tur -> async fn(payload); payload o'zgarsa xatoda saqlanadi
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll = poll
+        self.stats = {"queued": 0, "delivered": 0, "retries": 0, "dead": 0, "flood_waits": 0}
+        self.last_error = None
+        self._resume_at = 0.0        # FloodWait: hamma ishchi shu vaqtgacha kutadi
+        self._wake = None
+        self._task = None
+
+    def _get_wake(self):
+        if self._wake is None: self._wake = asyncio.Event()
+        return self._wake
+
+    def wake(self):
+        # Navbat tashqaridan o'zgardi (masalan, .outbox retry) — ishchilar darhol tekshiradi
+        self._get_wake().set()
+
+    async def put(self, kind, payload, status="pending"):
+        """Vazifani bazaga yozadi (bitta INSERT), id sini qaytaradi.
+        status='buffered' — ishchilar olmaydi, keyin bundle() bilan bitta vazifaga yig'iladi."""
+        now = time.time()
+        def _do(conn):
+            with conn:
+                return conn.execute("INSERT INTO outbox (kind, payload, status, attempts, next_at, created) VALUES (?, ?, ?, 0, ?, ?)",
+                                    (kind, json.dumps(payload, ensure_ascii=False), status, now, now)).lastrowid
+        row_id = await self.db.run(_do)
+        if status == "pending": self.stats["queued"] += 1; self.wake()
+        return row_id
+
+    async def update(self, row_id, payload):
+        # Faqat hali yig'ilmagan (buffered) yozuv o'zgaradi
+        return await self.db.execute("UPDATE outbox SET payload=? WHERE id=? AND status='buffered'",
+                                     (json.dumps(payload, ensure_ascii=False), row_id))
+
+    async def bundle(self, ids, kind, payload):
+        """Buferdagi yozuvlar o'rniga bitta vazifa — bitta tranzaksiyada (post yo'qolmaydi ham, takrorlanmaydi ham)."""
+        now = time.time()
+        def _do(conn):
+            with conn:
+                conn.executemany("DELETE FROM outbox WHERE id=? AND status='buffered'", [(i,) for i in ids])
+                return conn.execute("INSERT INTO outbox (kind, payload, status, attempts, next_at, created) VALUES (?, ?, 'pending', 0, ?, ?)",
+                                    (kind, json.dumps(payload, ensure_ascii=False), now, now)).lastrowid
+        row_id = await self.db.run(_do)
+        self.stats["queued"] += 1; self.wake()
+        return row_id
+
+    async def buffered(self):
+        rows = await self.db.fetchall("SELECT id, payload FROM outbox WHERE status='buffered' ORDER BY id")
+        return [(r[0], json.loads(r[1])) for r in rows]
+
+    async def counts(self):
+        return dict(await self.db.fetchall("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+
+    async def retry_dead(self):
+        return await self.db.execute("UPDATE outbox SET status='pending', attempts=0, next_at=? WHERE status='dead'", (time.time(),))
+
+    async def _claim(self):
+        def _do(conn):
+            # DB bitta oqimda: tanlash va band qilish orasiga boshqa ishchi kira olmaydi
+            row = conn.execute("SELECT id, kind, payload, attempts FROM outbox WHERE status='pending' AND next_at <= ? ORDER BY id LIMIT 1",
+                               (time.time(),)).fetchone()
+            if row:
+                with conn: conn.execute("UPDATE outbox SET status='running' WHERE id=?", (row[0],))
+            return row
+        return await self.db.run(_do)
+
+    async def _reschedule(self, row_id, payload, attempts, delay, error):
+        status = "dead" if attempts >= self.max_attempts else "pending"
+        await self.db.execute("UPDATE outbox SET status=?, attempts=?, next_at=?, payload=?, last_error=? WHERE id=?",
+                              (status, attempts, time.time() + delay, json.dumps(payload, ensure_ascii=False), error, row_id))
+        self.stats["dead" if status == "dead" else "retries"] += 1
+
+    async def process_one(self):
+        """Muddati kelgan bitta vazifani bajaradi; vazifa bo'lmasa False."""
+        row = await self._claim()
+        if not row: return False
+        row_id, kind, raw, attempts = row; payload = json.loads(raw)
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None: raise KeyError(f"noma'lum vazifa turi: {kind}")
+            await handler(payload)
+        except FloodWait as e:
+            # Telegram cheklovi urinish hisoblanmaydi
+            self.stats["flood_waits"] += 1
+            self._resume_at = max(self._resume_at, time.monotonic() + e.value + 1)
+            await self._reschedule(row_id, payload, attempts, e.value + 1, repr(e))
+        except asyncio.CancelledError:
+            # To'xtatilganda qator 'running' bo'lib qoladi — keyingi startda qaytariladi
+            raise
+        except Exception as e:
+            self.last_error = repr(e)
+            await self._reschedule(row_id, payload, attempts + 1, min(self.max_delay, self.base_delay * 2 ** attempts), repr(e))
+        else:
+            await self.db.execute("DELETE FROM outbox WHERE id=?", (row_id,))
+            self.stats["delivered"] += 1
+        return True
+
+    async def _next_delay(self):
+        row = await self.db.fetchone("SELECT MIN(next_at) FROM outbox WHERE status='pending'")
+        return self.poll if row[0] is None else min(self.poll, max(0.0, row[0] - time.time()))
+
+    async def _worker(self):
+        wake = self._get_wake()
+        while True:
+            pause = self._resume_at - time.monotonic()
+            if pause > 0: await asyncio.sleep(pause)
+            try:
+                if await self.process_one(): continue
+                delay = await self._next_delay()
+            except asyncio.CancelledError: raise
+            except Exception as e: self.last_error = repr(e); delay = self.poll
+            try: await asyncio.wait_for(wake.wait(), delay)
+            except asyncio.TimeoutError: pass
+            wake.clear()
+
+    async def _run(self):
+        # Oldingi jarayon to'xtaganda yarim qolgan vazifalar qayta navbatga
+        await self.db.execute("UPDATE outbox SET status='pending' WHERE status='running'")
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    def start(self):
+        if not self._task: self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
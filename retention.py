@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+# ==========================================================
+# --- LOG SAQLASH MUDDATI VA SIQISH ---
+# Eski qatorlar oylik .jsonl.gz arxivlarga ko'chiriladi, bazadan o'chiriladi,
+# bo'shagan sahifalar esa fonda incremental_vacuum bilan qaytariladi.
+# ==========================================================
+
+ARCHIVE_COLUMNS = ("date", "chat_id", "sender_id", "text", "type", "msg_id")
+
+
+def archive_path(folder, month):
+    return os.path.join(folder, f"messages_{month}.jsonl.gz")
+
+
+def archive_months(folder):
+    if not os.path.isdir(folder): return []
+    return sorted(n[len("messages_"):-len(".jsonl.gz")] for n in os.listdir(folder)
+                  if n.startswith("messages_") and n.endswith(".jsonl.gz"))
+
+
+def write_archive(folder, rows):
+    """Qatorlarni oylar bo'yicha arxivga qo'shadi (har yozuv — yangi gzip a'zosi, fayl qayta yozilmaydi)."""
+    os.makedirs(folder, exist_ok=True); by_month = {}
+    for r in rows: by_month.setdefault(r[0][:7], []).append(r)
+    for month, items in by_month.items():
+        with gzip.open(archive_path(folder, month), "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(list(r), ensure_ascii=False) + "\n" for r in items)
+    return sorted(by_month)
+
+
+def iter_archive(folder, since=None, until=None):
+    # Faqat sana oralig'iga tushadigan oylar ochiladi, yangilari birinchi
+    for month in reversed(archive_months(folder)):
+        if (since and month < since[:7]) or (until and month > until[:7]): continue
+        with gzip.open(archive_path(folder, month), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if (since and row[0] < since) or (until and row[0] > until): continue
+                yield row
+
+
+def search_archive(folder, query, chat_id=None, sender_id=None, since=None, until=None, limit=10):
+    """Arxivdan qidiruv (so'rov bo'yicha, indekssiz): barcha so'zlar uchragan qatorlar."""
+    words = [w.strip("*").lower() for w in query.split() if w.strip("*")]
+    found = []
+    for row in iter_archive(folder, since, until):
+        if (chat_id is not None and row[1] != chat_id) or (sender_id is not None and row[2] != sender_id): continue
+        text = (row[3] or "").lower()
+        if all(w in text for w in words):
+            found.append(row)
+            if len(found) >= limit: break
+    return found
+
+
+class RetentionManager:
+    def __init__(self, db, folder="archive", max_age_days=180, max_bytes=512 * 1024 ** 2,
+                 batch=5000, vacuum_pages=256, interval=6 * 3600):
+        self.db = db
+        self.folder = folder
+        self.max_age_days = max_age_days   # 0 — yoshi bo'yicha o'chirilmaydi
+        self.max_bytes = max_bytes         # 0 — hajm chegarasi yo'q
+        self.batch = batch
+        self.vacuum_pages = vacuum_pages
+        self.interval = interval
+        self.stats = {"archived": 0, "vacuumed_pages": 0, "runs": 0}
+        self.last_error = None
+        self._task = None
+        self._lock = None   # fon vazifasi va .retention run bir vaqtda ishlamaydi
+
+    async def live_bytes(self):
+        # Fayl hajmi emas, band sahifalar: o'chirilgan qatorlar darhol hisobdan chiqadi
+        def _do(conn):
+            page = conn.execute("PRAGMA page_size").fetchone()[0]
+            return (conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]) * page
+        return await self.db.run(_do)
+
+    async def _archive_batch(self, cutoff=None):
+        # cutoff=None: yoshidan qat'i nazar eng eski qatorlar (hajm chegarasi uchun)
+        def _take(conn):
+            where = " WHERE date < ?" if cutoff else ""
+            return conn.execute(f"SELECT rowid, {', '.join(ARCHIVE_COLUMNS)} FROM messages{where} ORDER BY date LIMIT ?",
+                                ((cutoff,) if cutoff else ()) + (self.batch,)).fetchall()
+        rows = await self.db.run(_take)
+        if not rows: return 0
+        # Avval arxivga, keyin bazadan: to'xtab qolsa qator yo'qolmaydi (eng yomoni — arxivda takror)
+        await asyncio.to_thread(write_archive, self.folder, [r[1:] for r in rows])
+        def _delete(conn):
+            with conn: conn.executemany("DELETE FROM messages WHERE rowid=?", [(r[0],) for r in rows])
+        await self.db.run(_delete)
+        self.stats["archived"] += len(rows)
+        return len(rows)
+
+    def _get_lock(self):
+        if self._lock is None: self._lock = asyncio.Lock()
+        return self._lock
+
+    async def is_incremental(self):
+        return (await self.db.fetchone("PRAGMA auto_vacuum"))[0] == 2
+
+    async def ensure_incremental(self):
+        """auto_vacuum=INCREMENTAL yoqilmagan eski bazada bir marta to'liq VACUUM qilinadi.
+        DB oqimini uzoq band qiladi — shuning uchun faqat `.retention run` dan, avtomatik emas."""
+        def _do(conn):
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2: return False
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL"); conn.execute("VACUUM")
+            # VACUUM rowid larni qayta raqamlashi mumkin — FTS indeksi qayta quriladi
+            with conn: conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            return True
+        async with self._get_lock(): return await self.db.run(_do)
+
+    async def vacuum(self):
+        # Kichik qadamlar: har qadam orasida boshqa so'rovlar DB oqimiga kira oladi
+        def _step(conn):
+            conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+            return conn.execute("PRAGMA freelist_count").fetchone()[0]
+        before = (await self.db.fetchone("PRAGMA freelist_count"))[0]; left = before
+        while left:
+            now = await self.db.run(_step)
+            if now >= left: break
+            left = now; await asyncio.sleep(0)
+        await self.db.fetchone("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.stats["vacuumed_pages"] += before - left
+        return before - left
+
+    async def run_once(self):
+        """Siyosatni bir marta qo'llaydi, arxivlangan qatorlar sonini qaytaradi."""
+        async with self._get_lock(): return await self._apply()
+
+    async def _apply(self):
+        # Siyosat o'rnatilmagan — bazaga umuman tegilmaydi
+        if not self.max_age_days and not self.max_bytes: return 0
+        archived = 0
+        if self.max_age_days:
+            cutoff = str(datetime.now() - timedelta(days=self.max_age_days))
+            while n := await self._archive_batch(cutoff): archived += n
+        while self.max_bytes and await self.live_bytes() > self.max_bytes:
+            n = await self._archive_batch()
+            if not n: break
+            archived += n
+        await self.vacuum()
+        self.stats["runs"] += 1
+        return archived
+
+    async def _run(self):
+        while True:
+            try: await self.run_once(); self.last_error = None
+            except asyncio.CancelledError: raise
+            except Exception as e: self.last_error = repr(e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self._task: self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
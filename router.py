@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+
+from scheduler import is_retryable
+
+# ==========================================================
+# --- MODEL MARSHRUTLASH ---
+# Har vazifa (tarjima, qisqa, yangilik, transkripsiya) o'z nomzodlar ro'yxatiga ega.
+# (vazifa, model) bo'yicha kechikish va xatolar kuzatiladi: sekin yoki xato
+# beradigan model vaqtincha chetlanadi, muddat o'tgach bitta sinov so'rovi bilan qaytadi.
+# ==========================================================
+
+
+class ModelStats:
+    def __init__(self, window=50):
+        self.samples = deque(maxlen=window)   # (soniya, muvaffaqiyatmi)
+        self.cooldown_until = 0.0
+        self.probation = False   # chetlatishdan qaytgan: birinchi so'rov natijasi hal qiladi
+        self.calls = 0
+        self.errors = 0
+
+    def add(self, latency, ok):
+        self.samples.append((latency, ok)); self.calls += 1
+        if not ok: self.errors += 1
+
+    def percentile(self, q):
+        values = sorted(lat for lat, ok in self.samples if ok)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+    @property
+    def error_rate(self):
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples) if self.samples else 0.0
+
+
+class ModelRouter:
+    def __init__(self, genai, routes, slow=None, window=50, min_samples=5, max_error_rate=0.5, cooldown=120, **model_kwargs):
+        self.genai = genai
+        self.routes = {task: list(names) for task, names in routes.items()}   # "default" bo'lishi shart
+        self.slow = slow or {}          # vazifa -> p95 chegarasi (soniya)
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.model_kwargs = model_kwargs
+        self.unavailable = set()        # API da yo'q (404) — qayta tanlanmaydi
+        self.stats = {}                 # (vazifa, model) -> ModelStats
+        self.switches = 0
+        self._available = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def route(self, task):
+        return self.routes.get(task) or self.routes["default"]
+
+    def primary(self, task="default"):
+        # Kesh kalitlari uchun barqaror nom: vaqtinchalik almashish keshni buzmaydi
+        return self.route(task)[0]
+
+    @property
+    def model_name(self):
+        return self.primary()
+
+    def _stats(self, task, name):
+        key = (task, name)
+        if key not in self.stats: self.stats[key] = ModelStats(self.window)
+        return self.stats[key]
+
+    def _listed(self, fetch=True):
+        # API dagi modellar ro'yxati bir marta olinadi (ishchi oqimda); olinmasa — cheklovsiz
+        if self._available is None and fetch:
+            try: self._available = {m.name.split("/")[-1] for m in self.genai.list_models() if "generateContent" in m.supported_generation_methods}
+            except Exception: self._available = False
+        return self._available
+
+    def order(self, task, fetch=True):
+        """Sinab ko'rish tartibi: sog'lom modellar ro'yxat bo'yicha, keyin chetlatilganlar (tezroq qaytadigani oldin)."""
+        listed = self._listed(fetch); now = time.monotonic()
+        names = [n for n in self.route(task) if n not in self.unavailable and (not listed or n in listed)]
+        with self._lock:
+            healthy = [n for n in names if self._stats(task, n).cooldown_until <= now]
+            cooling = sorted((n for n in names if n not in healthy), key=lambda n: self._stats(task, n).cooldown_until)
+        return healthy + cooling
+
+    def current(self, task):
+        # Event loopdan chaqiriladi — tarmoqqa chiqmaydi
+        names = self.order(task, fetch=False)
+        return names[0] if names else None
+
+    def _model(self, name):
+        with self._lock:
+            if name not in self._models: self._models[name] = self.genai.GenerativeModel(name, **self.model_kwargs)
+            return self._models[name]
+
+    def record(self, task, name, latency, ok):
+        limit = self.slow.get(task)
+        bad = not ok or (limit is not None and latency > limit)
+        with self._lock:
+            st = self._stats(task, name); st.add(latency, ok)
+            if st.probation:
+                st.probation = False
+                degraded = bad
+            else:
+                p95 = st.percentile(0.95)
+                degraded = len(st.samples) >= self.min_samples and (
+                    st.error_rate > self.max_error_rate or (limit is not None and p95 is not None and p95 > limit))
+            if degraded:
+                st.cooldown_until = time.monotonic() + self.cooldown; st.probation = True
+                st.samples.clear(); self.switches += 1
+
+    def generate_content(self, contents, task="default", **kwargs):
+        """Vazifa uchun eng yaxshi modelda bajaradi; 404/429/5xx da keyingi nomzodga o'tadi."""
+        last = None
+        for name in self.order(task):
+            start = time.monotonic()
+            try: result = self._model(name).generate_content(contents, **kwargs)
+            except Exception as e:
+                if getattr(e, "code", None) == 404:
+                    with self._lock: self.unavailable.add(name)
+                elif is_retryable(e): self.record(task, name, time.monotonic() - start, False)
+                else: raise   # so'rovning o'zi xato (masalan 400) — boshqa model ham yordam bermaydi
+                last = e; continue
+            if kwargs.get("stream"): return self._tracked(task, name, start, result)
+            self.record(task, name, time.monotonic() - start, True)
+            return result
+        raise last or RuntimeError("Gemini: mavjud model topilmadi.")
+
+    def _tracked(self, task, name, start, stream):
+        # Oqimli javob: natija oxirgi bo'lakdan keyin yoziladi — kechikish to'liq javob vaqti
+        # (oqimsiz so'rovlar bilan bir xil o'lchov), o'rtada uzilgan oqim esa xato
+        try:
+            for chunk in stream: yield chunk
+        except Exception:
+            self.record(task, name, time.monotonic() - start, False); raise
+        self.record(task, name, time.monotonic() - start, True)
+
+    def report(self):
+        """Vazifa -> (joriy model, p50, p95, xato ulushi) — .stats uchun."""
+        rows = {}
+        for task in self.routes:
+            name = self.current(task)
+            st = self.stats.get((task, name))
+            if st and st.calls: rows[task] = (name, st.percentile(0.5), st.percentile(0.95), st.error_rate)
+            else: rows[task] = (name, None, None, 0.0)
+        return rows
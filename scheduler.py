@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================================
+# --- GEMINI REJALASHTIRUVCHISI ---
+# Barcha AI so'rovlari shu yerdan o'tadi: ustuvorlik, RPM/TPM limit,
+# cheklangan executor va 429/5xx da qayta urinish.
+# ==========================================================
+
+INTERACTIVE = 0   # .tr, .qisqa, .text — foydalanuvchi kutib turibdi
+BACKGROUND = 1    # kanal yangiliklari va boshqa fon ishlari
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+
+def is_retryable(e):
+    # google.api_core xatolarida .code HTTP status bo'ladi (429, 500, 503...)
+    code = getattr(e, "code", None)
+    if callable(code): code = None
+    return isinstance(code, int) and (code == 429 or 500 <= code < 600)
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class AIScheduler:
+    def __init__(self, max_workers=4, rpm=15, tpm=1_000_000, retries=3, base_delay=1.0):
+        self.max_workers = max_workers
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.stats = {p: {"done": 0, "failed": 0, "retries": 0, "max_depth": 0} for p in PRIORITY_NAMES}
+        self._executor = None
+        self._active = 0
+        self._waiters = []   # heap: (priority, seq, future)
+        self._rate_waiters = []   # heap: (priority, seq, tokens, future)
+        self._timer = None
+        self._seq = itertools.count()
+
+    def _get_executor(self):
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gemini")
+        return self._executor
+
+    def close(self):
+        if self._timer: self._timer.cancel(); self._timer = None
+        if self._executor: self._executor.shutdown(wait=False); self._executor = None
+
+    def queue_depth(self):
+        depth = {p: 0 for p in PRIORITY_NAMES}
+        for p, _, fut in self._waiters:
+            if not fut.done(): depth[p] += 1
+        return depth
+
+    # --- Ustuvorlikli slotlar ---
+    async def _acquire(self, priority):
+        if self._active < self.max_workers and not self._waiters:
+            self._active += 1; return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        st = self.stats[priority]; st["max_depth"] = max(st["max_depth"], self.queue_depth()[priority])
+        try: await fut
+        except asyncio.CancelledError:
+            # Slot berilgan bo'lsa-yu, vazifa bekor qilinsa — slotni keyingisiga uzatamiz
+            if fut.done() and not fut.cancelled(): self._release()
+            raise
+
+    def _release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done(): fut.set_result(None); return   # slot to'g'ridan-to'g'ri uzatiladi
+        self._active -= 1
+
+    # --- Ustuvorlikli RPM/TPM navbati ---
+    # Tokenlar ham heap tartibida beriladi: chelak bo'sh bo'lsa, keyin kelgan interactive
+    # so'rov kutib turgan background dan oldin o'tadi
+    def _grant(self):
+        if self._timer: self._timer.cancel(); self._timer = None
+        while self._rate_waiters:
+            _, _, tokens, fut = self._rate_waiters[0]
+            if fut.done(): heapq.heappop(self._rate_waiters); continue
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._grant); return
+            heapq.heappop(self._rate_waiters)
+            self.requests.take(1); self.tokens.take(tokens); fut.set_result(None)
+
+    async def _throttle(self, priority, tokens):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._rate_waiters, (priority, next(self._seq), tokens, fut))
+        self._grant()
+        try: await fut
+        finally:
+            # Bekor qilingan navbat boshida turgan bo'lsa, keyingisi kutib qolmasin
+            if fut.cancelled(): self._grant()
+
+    async def submit(self, fn, *args, priority=INTERACTIVE, tokens=1, **kwargs):
+        """fn(*args, **kwargs) ni cheklangan executorda bajaradi."""
+        call = functools.partial(fn, *args, **kwargs); st = self.stats[priority]
+        for attempt in range(self.retries + 1):
+            # Avval limit (ustuvorlik tartibida), keyin slot — kutayotgan so'rov slotni band qilmaydi
+            await self._throttle(priority, tokens)
+            await self._acquire(priority)
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+                st["done"] += 1
+                return result
+            except Exception as e:
+                if attempt >= self.retries or not is_retryable(e): st["failed"] += 1; raise
+                st["retries"] += 1
+            finally: self._release()
+            # Jitter bilan eksponensial kutish (slot bo'shatilgan holda)
+            await asyncio.sleep(self.base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+# ==========================================================
+# --- LOG BO'YICHA QIDIRUV (.search, FTS5) ---
+# messages_fts indeksi triggerlar orqali messages bilan sinxron turadi.
+# Filtrlar (chat, yuboruvchi, sana) indeksdan topilgan qatorlarga qo'llanadi.
+# ==========================================================
+
+SEARCH_FLAGS = ("-chat", "-from", "-date")
+SEARCH_SWITCHES = ("-archive",)   # qiymatsiz flaglar
+
+
+def build_match(query):
+    """Foydalanuvchi matnini xavfsiz FTS5 so'roviga aylantiradi: har so'z — ibora, `so'z*` — prefiks."""
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*"); word = word.rstrip("*")
+        if not any(ch.isalnum() for ch in word): continue
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def parse_search_args(args):
+    """.search so'z ... [-chat X] [-from Y] [-date 01.01.2024-31.01.2024] [-archive] -> (so'rov, flaglar)."""
+    words, flags, rest = [], {}, list(args)
+    while rest:
+        if rest[0] in SEARCH_SWITCHES: flags[rest.pop(0)[1:]] = True
+        elif rest[0] in SEARCH_FLAGS and len(rest) > 1: flags[rest[0][1:]] = rest[1]; rest = rest[2:]
+        else: words.append(rest.pop(0))
+    return " ".join(words), flags
+
+
+def parse_date_range(text):
+    # Bitta sana yoki oraliq; natija logdagi sana formatida (str(datetime))
+    parts = text.split("-")
+    start = datetime.strptime(parts[0].strip(), "%d.%m.%Y")
+    end = datetime.strptime(parts[-1].strip(), "%d.%m.%Y").replace(hour=23, minute=59, second=59)
+    if start > end: start, end = end.replace(hour=0, minute=0, second=0), start.replace(hour=23, minute=59, second=59)
+    return str(start), str(end)
+
+
+def message_link(chat_id, msg_id):
+    # Shaxsiy chatlarda t.me havolasi yo'q — tg:// orqali xabarning o'ziga o'tiladi
+    if msg_id: return f"tg://openmessage?user_id={chat_id}&message_id={msg_id}"
+    return f"tg://user?id={chat_id}"
+
+
+async def search_messages(db, query, chat_id=None, sender_id=None, since=None, until=None, limit=10):
+    """(chat_id, sender_id, sana, msg_id, tur, snippet) ro'yxati, eng mosi birinchi."""
+    match = build_match(query)
+    if not match: return []
+    sql = ("SELECT m.chat_id, m.sender_id, m.date, m.msg_id, m.type, snippet(messages_fts, 0, '**', '**', '…', 12) "
+           "FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid WHERE messages_fts MATCH ?")
+    params = [match]
+    for cond, value in (("m.chat_id = ?", chat_id), ("m.sender_id = ?", sender_id), ("m.date >= ?", since), ("m.date <= ?", until)):
+        if value is not None: sql += f" AND {cond}"; params.append(value)
+    sql += " ORDER BY rank LIMIT ?"; params.append(limit)
+    return await db.fetchall(sql, params)
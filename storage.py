@@ -0,0 +1,261 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================================
+# --- BAZA QATLAMI ---
+# Bitta doimiy WAL ulanish, faqat o'zining "db" oqimida ishlaydi.
+# Event loop hech qachon disk I/O kutib qolmaydi.
+# ==========================================================
+
+DB_PATH = 'userbot.db'
+
+# Har bir migratsiya bir marta ishlaydi, raqami PRAGMA user_version da saqlanadi
+MIGRATIONS = [
+    [
+        '''CREATE TABLE IF NOT EXISTS messages
+           (date text, chat_id integer, sender_id integer, text text, type text)''',
+        '''CREATE TABLE IF NOT EXISTS settings
+           (key text primary key, value text)''',
+        '''CREATE TABLE IF NOT EXISTS sources
+           (chat_id integer primary key, title text)''',
+    ],
+    [
+        # AI natijalar keshi (cache.py)
+        '''CREATE TABLE IF NOT EXISTS ai_cache
+           (key text primary key, value text, created real, accessed real)''',
+        "CREATE INDEX IF NOT EXISTS idx_ai_cache_accessed ON ai_cache(accessed)",
+    ],
+    [
+        # Davomli backup: har chat uchun nazorat nuqtasi va yuklangan media ro'yxati
+        '''CREATE TABLE IF NOT EXISTS backup_checkpoints
+           (chat_id integer primary key, last_id integer, pages text, updated text)''',
+        '''CREATE TABLE IF NOT EXISTS backup_media
+           (chat_id integer, msg_id integer, path text, primary key (chat_id, msg_id))''',
+    ],
+    [
+        # file_unique_id bo'yicha media ombori (media.py)
+        '''CREATE TABLE IF NOT EXISTS media_store
+           (unique_id text primary key, path text, size integer, last_used real)''',
+        "CREATE INDEX IF NOT EXISTS idx_media_store_used ON media_store(last_used)",
+    ],
+    [
+        # .link: normallashtirilgan URL -> oldin yuborilgan faylning Telegram file_id si (links.py)
+        '''CREATE TABLE IF NOT EXISTS link_cache
+           (url text primary key, file_id text, created real)''',
+    ],
+    [
+        # Xabarlar logi indekslari va .stats uchun yig'ma jadvallar.
+        # Yig'malar trigger orqali INSERT bilan bir tranzaksiyada yangilanadi
+        "CREATE INDEX IF NOT EXISTS idx_messages_chat_date ON messages(chat_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender_date ON messages(sender_id, date)",
+        '''CREATE TABLE IF NOT EXISTS stats_chat
+           (chat_id integer primary key, incoming integer, outgoing integer, total integer, last_date text)''',
+        "CREATE INDEX IF NOT EXISTS idx_stats_chat_total ON stats_chat(total)",
+        '''CREATE TABLE IF NOT EXISTS stats_day
+           (day text primary key, incoming integer, outgoing integer)''',
+        '''CREATE TABLE IF NOT EXISTS stats_total
+           (id integer primary key check (id = 1), incoming integer, outgoing integer)''',
+        # Mavjud log bir marta yig'iladi
+        '''INSERT OR REPLACE INTO stats_chat
+           SELECT chat_id, SUM(type != 'out'), SUM(type = 'out'), COUNT(*), MAX(date) FROM messages GROUP BY chat_id''',
+        '''INSERT OR REPLACE INTO stats_day
+           SELECT substr(date, 1, 10), SUM(type != 'out'), SUM(type = 'out') FROM messages GROUP BY substr(date, 1, 10)''',
+        '''INSERT OR REPLACE INTO stats_total
+           SELECT 1, COALESCE(SUM(type != 'out'), 0), COALESCE(SUM(type = 'out'), 0) FROM messages''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_stats AFTER INSERT ON messages BEGIN
+             INSERT INTO stats_chat VALUES (NEW.chat_id, NEW.type != 'out', NEW.type = 'out', 1, NEW.date)
+               ON CONFLICT(chat_id) DO UPDATE SET incoming = incoming + excluded.incoming,
+               outgoing = outgoing + excluded.outgoing, total = total + 1, last_date = MAX(last_date, excluded.last_date);
+             INSERT INTO stats_day VALUES (substr(NEW.date, 1, 10), NEW.type != 'out', NEW.type = 'out')
+               ON CONFLICT(day) DO UPDATE SET incoming = incoming + excluded.incoming, outgoing = outgoing + excluded.outgoing;
+             UPDATE stats_total SET incoming = incoming + (NEW.type != 'out'), outgoing = outgoing + (NEW.type = 'out') WHERE id = 1;
+           END''',
+    ],
+    [
+        # .search: FTS5 indeks (matn messages jadvalida, indeks faqat tokenlar) + xabarga havola uchun msg_id
+        "ALTER TABLE messages ADD COLUMN msg_id integer",
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5
+           (text, content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')''',
+        "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages BEGIN
+             INSERT INTO messages_fts(rowid, text) VALUES (NEW.rowid, NEW.text);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages BEGIN
+             INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', OLD.rowid, OLD.text);
+           END''',
+    ],
+    [
+        # Saqlash muddati (retention.py): eng eski qatorlar sana bo'yicha tanlanadi
+        "CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date)",
+    ],
+    [
+        # Har startda bosqichlar vaqti (ms) — sovuq start kuzatuvi
+        '''CREATE TABLE IF NOT EXISTS startup_times
+           (started text, total_ms integer, phases text)''',
+    ],
+    [
+        # Kanal yangiliklari uchun doimiy navbat (outbox.py): yuborilgach qator o'chiriladi
+        '''CREATE TABLE IF NOT EXISTS outbox
+           (id integer primary key autoincrement, kind text, payload text, status text,
+            attempts integer, next_at real, created real, last_error text)''',
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_at)",
+    ],
+    [
+        # Davomli backup: yetkazilgan chegara (barcha tomlar yuborilgach suriladi).
+        # Mavjud yozuvlar avvalgidek yetkazilgan hisoblanadi
+        "ALTER TABLE backup_checkpoints ADD COLUMN delivered_id integer",
+        "UPDATE backup_checkpoints SET delivered_id = last_id",
+        "ALTER TABLE backup_media ADD COLUMN sent integer DEFAULT 1",
+    ],
+]
+
+
+def migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if conn.in_transaction: conn.commit()   # chaqiruvchining ochiq tranzaksiyasi BEGIN ga xalaqit bermasin
+    for i, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+        # sqlite3 DDL oldidan o'zi tranzaksiya ochmaydi (har biri darhol commit bo'ladi) —
+        # BEGIN bilan migratsiya yo to'liq, yo umuman qo'llanmaydi
+        with conn:
+            conn.execute("BEGIN")
+            for sql in steps:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {i}")
+    return len(MIGRATIONS)
+
+
+class Database:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = None
+        self._executor = None
+
+    # --- Ulanish (faqat DB oqimida chaqiriladi) ---
+    def _connect(self):
+        # cached_statements: bir xil SQL satrlar qayta kompilyatsiya qilinmaydi (prepared statements)
+        conn = sqlite3.connect(self.path, cached_statements=256)
+        # Yangi bazada darhol kuchga kiradi; eskisida `.retention run` bir marta VACUUM qiladi
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        migrate(conn)
+        self.conn = conn
+
+    def open(self):
+        if self._executor: return
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+        self._executor.submit(self._connect).result()
+
+    def close(self):
+        if not self._executor: return
+        self._executor.submit(self._close).result()
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _close(self):
+        if self.conn: self.conn.close(); self.conn = None
+
+    # --- Async API ---
+    async def run(self, fn, *args):
+        """fn(conn, *args) ni DB oqimida bajaradi va natijasini qaytaradi."""
+        if not self._executor: self.open()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, self.conn, *args)
+
+    async def execute(self, sql, params=()):
+        def _do(conn):
+            with conn: return conn.execute(sql, params).rowcount
+        return await self.run(_do)
+
+    async def executemany(self, sql, rows):
+        def _do(conn):
+            with conn: return conn.executemany(sql, rows).rowcount
+        return await self.run(_do)
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+
+# ==========================================================
+# --- GURUHLAB YOZUVCHI (GROUP COMMIT) ---
+# Handlerlar qatorlarni navbatga qo'yadi, fon vazifasi esa ularni
+# har N qator yoki T soniyada bitta tranzaksiyada yozadi.
+# ==========================================================
+
+class BatchWriter:
+    def __init__(self, db, sql, max_batch=200, max_delay=0.5, max_queue=10000, put_timeout=1.0):
+        self.db = db
+        self.sql = sql
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.stats = {"written": 0, "batches": 0, "dropped": 0, "failed": 0}
+        self.last_error = None
+        self._queue = None
+        self._task = None
+
+    def _get_queue(self):
+        # Navbat loop ichida yaratiladi (Python 3.9 da Queue loopga bog'lanadi)
+        if self._queue is None: self._queue = asyncio.Queue(maxsize=self.max_queue)
+        return self._queue
+
+    @property
+    def pending(self):
+        return self._queue.qsize() if self._queue else 0
+
+    async def put(self, row):
+        q = self._get_queue()
+        try: q.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: biroz kutamiz, baribir joy bo'lmasa qatorni tashlaymiz
+            try: await asyncio.wait_for(q.put(row), self.put_timeout)
+            except asyncio.TimeoutError: self.stats["dropped"] += 1
+
+    async def _write(self, batch):
+        if not batch: return
+        try:
+            await self.db.executemany(self.sql, batch)
+            self.stats["written"] += len(batch); self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch); self.last_error = repr(e)
+
+    async def _run(self):
+        q = self._get_queue(); loop = asyncio.get_running_loop()
+        while True:
+            batch = [await q.get()]; deadline = loop.time() + self.max_delay
+            # wait_for(q.get()) bekor qilinganda qator yo'qolishi mumkin, shuning uchun get_nowait
+            while len(batch) < self.max_batch and batch[-1] is not None:
+                while not q.empty() and len(batch) < self.max_batch and batch[-1] is not None:
+                    batch.append(q.get_nowait())
+                remaining = deadline - loop.time()
+                if remaining <= 0 or len(batch) >= self.max_batch: break
+                await asyncio.sleep(min(remaining, 0.05))
+            done = batch[-1] is None
+            await self._write([r for r in batch if r is not None])
+            if done: return
+
+    def start(self):
+        if not self._task: self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def flush(self):
+        # Navbatda qolgan hamma narsani darhol yozadi
+        q = self._get_queue(); batch = []
+        while not q.empty():
+            row = q.get_nowait()
+            if row is None: continue
+            batch.append(row)
+            if len(batch) >= self.max_batch: await self._write(batch); batch = []
+        await self._write(batch)
+
+    async def stop(self):
+        # To'xtash: fon vazifasi tugaydi, qolgan qatorlar yozib bo'linadi
+        if self._task:
+            await self._get_queue().put(None)
+            await self._task
+            self._task = None
+        await self.flush()
@@ -1,27 +1,41 @@
 # tests/conftest.py
-import sqlite3
 import pytest
 
 import main  # main.py dagi kodlar
+from storage import Database, BatchWriter
+from scheduler import AIScheduler
+from cache import ResultCache, UploadCache
+from media import MediaStore
+from edits import EditScheduler
+from links import LinkService
+from retention import RetentionManager
 
 
 @pytest.fixture(autouse=True)
 def patch_sqlite_tmp_db(tmp_path, monkeypatch):
     """
-    Barcha testlar uchun sqlite bazani vaqtinchalik faylga yo'naltiramiz:
-    main.sqlite3.connect('userbot.db') -> tmp_path/'userbot.db'
+    Barcha testlar uchun bazani vaqtinchalik faylga yo'naltiramiz:
+    main.db -> tmp_path/'userbot.db' (alohida DB oqimi bilan)
     """
-    db_path = tmp_path / "userbot.db"
-
-    def _connect_override(*args, **kwargs):
-        return sqlite3.connect(db_path)
-
-    # main ichidagi sqlite3 modulining connect funksiyasini almashtiramiz
-    monkeypatch.setattr(main.sqlite3, "connect", _connect_override)
-
-    # Har bir test sessiyasi boshida jadval strukturasini yaratamiz
+    db = Database(str(tmp_path / "userbot.db"))
+    monkeypatch.setattr(main, "db", db)
+    monkeypatch.setattr(main, "log_writer", BatchWriter(db, main.LOG_INSERT_SQL))
+    monkeypatch.setattr(main, "ai_cache", ResultCache(db))
+    monkeypatch.setattr(main, "media_store", MediaStore(db, root=str(tmp_path / "media_store")))
+    monkeypatch.setattr(main, "upload_cache", UploadCache())
+    monkeypatch.setattr(main, "link_service", LinkService(db))
+    monkeypatch.setattr(main, "outbox", main.Outbox(db, main.outbox.handlers))
+    monkeypatch.setattr(main, "news_digest", main.DigestBuffer(main.enqueue_digest))
+    monkeypatch.setattr(main, "news_dedupe", main.DuplicateIndex())
+    monkeypatch.setattr(main, "retention", RetentionManager(db, folder=str(tmp_path / "archive")))
+    monkeypatch.setattr(main, "sources_cache", set())
+    monkeypatch.setattr(main, "settings_cache", {})
+    monkeypatch.setattr(main, "cache_stats", {"hits": 0, "misses": 0, "rejected": 0})
+
+    # Har bir test boshida ulanish ochiladi va migratsiyalar bajariladi
     main.init_db()
-    yield
+    yield db
+    db.close()
 
 
 @pytest.fixture(autouse=True)
@@ -29,7 +43,7 @@ def patch_gemini(monkeypatch):
     """
     Google Gemini chaqiruvlarini mock qilamiz:
     - model.generate_content
-    - genai.upload_file
+    - gemini_upload (main.genai ga tegilmaydi — haqiqiy modul import qilinmaydi)
     """
     class DummyResponse:
         def __init__(self, text):
@@ -44,7 +58,10 @@ def patch_gemini(monkeypatch):
         return f"uploaded://{path}"
 
     monkeypatch.setattr(main.model, "generate_content", fake_generate_content)
-    monkeypatch.setattr(main.genai, "upload_file", fake_upload_file)
+    monkeypatch.setattr(main, "gemini_upload", fake_upload_file)
+    # Har test uchun yangi rejalashtiruvchi (limitlar testlar orasida yig'ilmasin)
+    monkeypatch.setattr(main, "ai_scheduler", AIScheduler(max_workers=2, rpm=10_000))
+    monkeypatch.setattr(main, "editor", EditScheduler())
     yield
 
 
@@ -120,4 +137,13 @@ def fake_client(monkeypatch, fake_chat):
         async def get_chat(self, target):
             return fake_chat(chat_id=999, title="Dest Chat")
 
-        asy
+        async def send_message(self, chat_id, text, **kwargs):
+            self._sent_messages.append((chat_id, text))
+
+        async def send_document(self, chat_id, document, **kwargs):
+            self._sent_docs.append((chat_id, document))
+
+        async def send_video(self, chat_id, video, **kwargs):
+            self._sent_videos.append((chat_id, video))
+
+    return FakeClient()
@@ -0,0 +1,272 @@
+import asyncio
+import os
+import zipfile
+from datetime import datetime
+
+import pytest
+from pyrogram.errors import FloodWait
+
+import main
+from backup import ArchiveWriter, DownloadPool, PageWriter, aiter_list, prefetch_media
+
+
+class Msg:
+    def __init__(self, mid, media=True):
+        self.id = mid
+        self.media = media
+
+
+class SlowClient:
+    def __init__(self, flood_once=False):
+        self.active = 0
+        self.peak = 0
+        self.flood_once = flood_once
+
+    async def download_media(self, m, file_name=None):
+        if self.flood_once:
+            self.flood_once = False
+            raise FloodWait(value=0)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        # Teskari tartibda tugaydi: keyingi xabarlar tezroq
+        await asyncio.sleep(0.01 * (10 - m.id % 10))
+        self.active -= 1
+        return f"{file_name}{m.id}.jpg"
+
+
+@pytest.mark.asyncio
+async def test_prefetch_keeps_order_and_runs_concurrently():
+    client = SlowClient()
+    pool = DownloadPool(client, "media", parallel=4)
+    msgs = [Msg(i, media=(i % 3 != 0)) for i in range(12)]
+
+    out = [(m.id, fp) async for m, fp in prefetch_media(aiter_list(msgs), pool, lookahead=8)]
+
+    assert [mid for mid, _ in out] == list(range(12))
+    assert out[0][1] is None and out[1][1] == "media/1.jpg"
+    assert 1 < client.peak <= 4
+
+
+@pytest.mark.asyncio
+async def test_download_pool_retries_after_floodwait():
+    pool = DownloadPool(SlowClient(flood_once=True), "media", parallel=2)
+    assert await pool.submit(Msg(5)) == "media/5.jpg"
+    assert pool.stats["flood_waits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_download_pool_close_cancels_pending():
+    pool = DownloadPool(SlowClient(), "media", parallel=1)
+    tasks = [pool.submit(Msg(i)) for i in range(5)]
+    await asyncio.sleep(0)
+    await pool.close()
+    assert all(t.done() for t in tasks)
+
+
+def test_page_writer_splits_pages_with_navigation(tmp_path):
+    writer = PageWriter(str(tmp_path), "<html>", "</html>", page_size=2)
+    for i in range(5):
+        writer.write(f"<p>{i}</p>", "01.01.2024")
+    files = writer.finish()
+
+    assert [p[0] for p in writer.pages] == ["page_0001.html", "page_0002.html", "page_0003.html"]
+    assert files[-1].endswith("index.html")
+    first = (tmp_path / "page_0001.html").read_text(encoding="utf-8")
+    middle = (tmp_path / "page_0002.html").read_text(encoding="utf-8")
+    last = (tmp_path / "page_0003.html").read_text(encoding="utf-8")
+    assert "<p>0</p><p>1</p>" in first and "page_0002.html" in first
+    assert "page_0001.html" in middle and "page_0003.html" in middle
+    assert "<p>4</p>" in last and "Keyingi" not in last
+    assert "Jami: 5 ta" in (tmp_path / "index.html").read_text(encoding="utf-8")
+
+
+@pytest.mark.asyncio
+async def test_archive_writer_stores_media_and_splits_volumes(tmp_path):
+    root = tmp_path / "b"; (root / "media").mkdir(parents=True)
+    (root / "media" / "a.jpg").write_bytes(os.urandom(600))
+    (root / "media" / "b.mp4").write_bytes(os.urandom(600))
+    (root / "page_0001.html").write_text("<p>salom</p>" * 25)
+
+    # Sarlavhalar bilan: a.jpg yolg'iz, b.mp4 + sahifa ikkinchi tomda
+    archive = ArchiveWriter(str(tmp_path / "out"), str(root), volume_size=1300)
+    for name in ("media/a.jpg", "media/b.mp4", "page_0001.html"):
+        archive.add(str(root / name))
+    volumes = await archive.close()
+
+    assert len(volumes) == 2
+    with zipfile.ZipFile(volumes[0]) as z:
+        assert z.getinfo("media/a.jpg").compress_type == zipfile.ZIP_STORED
+    with zipfile.ZipFile(volumes[1]) as z:
+        assert z.getinfo("page_0001.html").compress_type == zipfile.ZIP_DEFLATED
+
+
+@pytest.mark.asyncio
+async def test_archive_volumes_include_headers_and_skip_oversized(tmp_path):
+    root = tmp_path / "b"; (root / "media").mkdir(parents=True)
+    for i in range(200): (root / "media" / f"photo_{i:03d}.jpg").write_bytes(os.urandom(50))
+    (root / "media" / "big.mp4").write_bytes(os.urandom(25000))
+
+    archive = ArchiveWriter(str(tmp_path / "out"), str(root), volume_size=20000)
+    archive.add(str(root / "media" / "big.mp4"))
+    for i in range(200): archive.add(str(root / "media" / f"photo_{i:03d}.jpg"))
+    volumes = await archive.close()
+
+    # Mayda fayllarning sarlavhalari ham hisobda — hech bir tom chegaradan oshmaydi
+    assert len(volumes) > 1 and all(os.path.getsize(v) <= 20000 for v in volumes)
+    names = []
+    for v in volumes:
+        with zipfile.ZipFile(v) as z: names += z.namelist()
+    assert len(names) == 200 and archive.skipped == ["media/big.mp4"]
+
+
+class FakeUser:
+    first_name = "Ali"
+    is_self = False
+
+
+class FakeTgMessage:
+    def __init__(self, mid, photo=False):
+        self.id = mid
+        self.empty = False
+        self.text = f"xabar {mid}"
+        self.caption = None
+        self.date = datetime(2024, 1, 1, 12, 0)
+        self.from_user = FakeUser()
+        self.photo = photo
+        self.media = photo
+        self.video = self.video_note = self.voice = self.audio = None
+
+
+def patch_fake_app(monkeypatch, history, sent, downloads=None):
+    async def get_chat_history(chat_id, **kwargs):
+        for m in history: yield m
+
+    async def get_messages(chat_id, ids):
+        return [FakeTgMessage(i, photo=(i % 2 == 0)) for i in ids]
+
+    async def download_media(m, file_name=None):
+        if downloads is not None: downloads.append(m.id)
+        path = f"{file_name}{m.id}.jpg"
+        with open(path, "wb") as f: f.write(b"jpg")
+        return path
+
+    async def send_document(chat_id, document, **kwargs):
+        with zipfile.ZipFile(document) as z: sent.append(sorted(z.namelist()))
+
+    for name, fn in [("get_chat_history", get_chat_history), ("get_messages", get_messages),
+                     ("download_media", download_media), ("send_document", send_document)]:
+        monkeypatch.setattr(main.app, name, fn)
+    monkeypatch.setattr(main, "BACKUP_PAGE_SIZE", 4)
+
+
+@pytest.mark.asyncio
+async def test_backup_handler_end_to_end(fake_message, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []
+    patch_fake_app(monkeypatch, [FakeTgMessage(i, photo=(i % 2 == 0)) for i in range(10, 0, -1)], sent)
+
+    await main.backup_handler(None, fake_message(command=["backup", "10"]))
+
+    assert sent == [["index.html", "media/10.jpg", "media/2.jpg", "media/4.jpg", "media/6.jpg", "media/8.jpg",
+                     "page_0001.html", "page_0002.html", "page_0003.html"]]
+    assert not [f for f in os.listdir(tmp_path) if f.startswith("backup_")]
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_fetches_only_new_messages(fake_message, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []; downloads = []
+    history = [FakeTgMessage(i, photo=(i % 2 == 0)) for i in range(10, 0, -1)]
+    patch_fake_app(monkeypatch, history, sent, downloads)
+
+    await main.backup_handler(None, fake_message(command=["backup", "inc"]))
+    last_id, pages = await main.load_checkpoint(123)
+    assert last_id == 10 and [p[1] for p in pages] == [4, 4, 2]
+
+    # Yangi xabarlar keldi: chala 3-sahifa qayta yoziladi, eski media qayta yuklanmaydi
+    history[:0] = [FakeTgMessage(i, photo=(i % 2 == 0)) for i in range(13, 10, -1)]
+    downloads.clear()
+    await main.backup_handler(None, fake_message(command=["backup", "inc"]))
+
+    assert downloads == [12]
+    assert sent[-1] == ["index.html", "media/12.jpg", "page_0002.html", "page_0003.html", "page_0004.html"]
+    last_id, pages = await main.load_checkpoint(123)
+    assert last_id == 13 and [p[1] for p in pages] == [4, 4, 4, 1]
+    page2 = (tmp_path / "backups" / "123" / "page_0002.html").read_text(encoding="utf-8")
+    assert "page_0003.html" in page2
+
+    msg = fake_message(command=["backup", "inc"])
+    await main.backup_handler(None, msg)
+    assert "Yangi xabar yo'q" in msg._edited_text
+
+
+@pytest.mark.asyncio
+async def test_incremental_backup_resends_undelivered_delta(fake_message, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []
+    history = [FakeTgMessage(i, photo=(i % 2 == 0)) for i in range(10, 0, -1)]
+    patch_fake_app(monkeypatch, history, sent)
+    await main.backup_handler(None, fake_message(command=["backup", "inc"]))
+
+    # Ikkinchi delta yuborilmay qoldi: sahifalar va media diskda, lekin yetkazilmagan
+    history[:0] = [FakeTgMessage(i, photo=(i % 2 == 0)) for i in range(13, 10, -1)]
+    ok_send = main.app.send_document
+
+    async def failing_send(chat_id, document, **kwargs): raise RuntimeError("tarmoq")
+
+    monkeypatch.setattr(main.app, "send_document", failing_send)
+    msg = fake_message(command=["backup", "inc"])
+    await main.backup_handler(None, msg)
+    assert "tarmoq" in msg._edited_text
+    assert (await main.load_checkpoint(123))[0] == 13
+
+    # Yangi xabar yo'q, lekin yetkazilmagan qism keyingi deltaga to'liq kiradi
+    monkeypatch.setattr(main.app, "send_document", ok_send)
+    await main.backup_handler(None, fake_message(command=["backup", "inc"]))
+    assert sent[-1] == ["index.html", "media/12.jpg", "page_0002.html", "page_0003.html", "page_0004.html"]
+
+    msg = fake_message(command=["backup", "inc"])
+    await main.backup_handler(None, msg)
+    assert "Yangi xabar yo'q" in msg._edited_text
+
+
+@pytest.mark.asyncio
+async def test_scan_history_seeks_to_end_date():
+    from backup import scan_history
+    seen = {}
+
+    class Client:
+        async def get_chat_history(self, chat_id, **kwargs):
+            seen.update(kwargs)
+            for i in range(20, 0, -1):
+                m = FakeTgMessage(i); m.date = datetime(2024, 1, i)
+                if m.date < kwargs["offset_date"]: yield m
+
+    ids = [mid async for mid in scan_history(Client(), 1, start_date=datetime(2024, 1, 5), end_date=datetime(2024, 1, 8, 23, 59, 59))]
+
+    assert seen["offset_date"] == datetime(2024, 1, 9)
+    assert ids == [8, 7, 6, 5]
+
+
+@pytest.mark.asyncio
+async def test_scan_history_uses_server_side_search():
+    from backup import scan_history
+    requests = []
+
+    class Result:
+        def __init__(self, ids):
+            self.messages = [type("M", (), {"id": i})() for i in ids]
+
+    class Client:
+        async def resolve_peer(self, target):
+            return f"peer:{target}"
+
+        async def invoke(self, query):
+            requests.append(query)
+            return Result([] if query.offset_id else [30, 20, 10])
+
+    ids = [mid async for mid in scan_history(Client(), 1, limit=2, from_user="@ali", media=main.BACKUP_TYPES["photo"])]
+
+    assert ids == [30, 20]
+    assert requests[0].from_id == "peer:@ali"
+    assert type(requests[0].filter).__name__ == "InputMessagesFilterPhotos"
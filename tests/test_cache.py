@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+import main
+from cache import ResultCache, make_key
+
+
+def test_make_key_normalizes_whitespace():
+    assert make_key("tr", "m", "en", "Salom   dunyo\n") == make_key("tr", "m", "en", " Salom dunyo")
+    assert make_key("tr", "m", "en", "Salom") != make_key("tr", "m", "ru", "Salom")
+
+
+@pytest.mark.asyncio
+async def test_memory_and_db_tiers(patch_sqlite_tmp_db):
+    cache = ResultCache(patch_sqlite_tmp_db, max_memory=1)
+    await cache.set("a", "A")
+    await cache.set("b", "B")   # "a" xotiradan chiqadi, lekin bazada qoladi
+
+    assert await cache.get("b") == "B"
+    assert await cache.get("a") == "A"
+    assert cache.stats["db_hits"] == 1
+    assert await cache.get("c") is None
+    assert cache.stats["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_prune_ttl_and_size_cap(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+    cache = ResultCache(db, max_rows=2, ttl=100)
+    old = time.time() - 1000
+    await db.execute("INSERT INTO ai_cache VALUES (?, ?, ?, ?)", ("old", "x", old, old))
+    for k in ("k1", "k2", "k3"):
+        await cache.set(k, k)
+
+    assert await cache.prune() == 2
+    rows = await db.fetchall("SELECT key FROM ai_cache ORDER BY key")
+    assert [r[0] for r in rows] == ["k2", "k3"]
+
+
+@pytest.mark.asyncio
+async def test_qisqa_uses_cache(fake_client, fake_message, monkeypatch):
+    calls = []
+    original = main.model.generate_content
+
+    def counting(prompt, *args, **kwargs):
+        calls.append(prompt)
+        return original(prompt)
+
+    monkeypatch.setattr(main.model, "generate_content", counting)
+    for _ in range(2):
+        reply = fake_message(text="Takrorlanadigan  matn")
+        await main.summarize_handler(fake_client, fake_message(command=["qisqa"], reply_to_message=reply))
+
+    assert len(calls) == 1
+    assert main.ai_cache.stats["hits"] == 1
@@ -1,41 +1,64 @@
-# tests/test_db.py
-import sqlite3
+import pytest
 import main
 
 
-def test_set_and_get_setting():
-    main.set_setting("dest_channel", "12345")
-    value = main.get_setting("dest_channel")
+@pytest.mark.asyncio
+async def test_set_and_get_setting():
+    await main.set_setting("dest_channel", "12345")
+    value = await main.get_setting("dest_channel")
     assert value == "12345"
 
 
-def test_add_and_get_all_sources():
-    main.add_source_channel(1001, "Source 1")
-    main.add_source_channel(1002, "Source 2")
+@pytest.mark.asyncio
+async def test_add_and_get_all_sources():
+    await main.add_source_channel(1001, "Source 1")
+    await main.add_source_channel(1002, "Source 2")
 
-    sources = main.get_all_sources()
+    sources = await main.get_all_sources()
     assert 1001 in sources
     assert 1002 in sources
 
 
-def test_remove_source_channel():
-    main.add_source_channel(1001, "Source 1")
-    main.remove_source_channel(1001)
+@pytest.mark.asyncio
+async def test_remove_source_channel():
+    await main.add_source_channel(1001, "Source 1")
+    await main.remove_source_channel(1001)
 
-    sources = main.get_all_sources()
+    sources = await main.get_all_sources()
     assert 1001 not in sources
 
 
-def test_log_message_inserts_row(fake_message):
+@pytest.mark.asyncio
+async def test_log_message_inserts_row(fake_message):
     fake_msg = fake_message(text="Hello")
-    main.log_message(fake_msg, "out")
+    await main.log_message(fake_msg, "out")
+    await main.log_writer.flush()
 
-    conn = sqlite3.connect("userbot.db")
-    c = conn.cursor()
-    c.execute("SELECT text, type FROM messages")
-    rows = c.fetchall()
-    conn.close()
+    rows = await main.db.fetchall("SELECT text, type FROM messages")
 
     assert len(rows) == 1
     assert rows[0][0] == "Hello"
     assert rows[0][1] == "out"
+
+
+@pytest.mark.asyncio
+async def test_load_cache_reads_db():
+    await main.db.execute("INSERT INTO sources VALUES (?, ?)", (2001, "Cached"))
+    await main.db.execute("INSERT INTO settings VALUES (?, ?)", ("dest_channel", "42"))
+    await main.load_cache()
+
+    assert 2001 in main.sources_cache
+    assert await main.get_setting("dest_channel") == "42"
+    assert main.cache_stats["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_channel_monitor_rejects_non_source_without_io(fake_message, monkeypatch):
+    async def no_io(*args, **kwargs):
+        raise AssertionError("DB ga murojaat bo'lmasligi kerak")
+
+    monkeypatch.setattr(main.db, "fetchone", no_io)
+    monkeypatch.setattr(main.db, "fetchall", no_io)
+
+    await main.channel_monitor(None, fake_message(text="x" * 100))
+    assert main.cache_stats["rejected"] == 1
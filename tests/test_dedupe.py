@@ -0,0 +1,70 @@
+# tests/test_dedupe.py
+import pytest
+
+import main
+from dedupe import DuplicateIndex, distance, simhash
+
+ORIGINAL = ("Prezident bugun Toshkentda yangi zavodning ochilish marosimida ishtirok etdi va sanoat rivoji haqida "
+            "nutq so'zladi. Zavod yiliga 50 ming tonna mahsulot ishlab chiqaradi va 800 kishi ish bilan ta'minlanadi.")
+REPOST = ("⚡️ Prezident bugun ertalab Toshkentda yangi zavodning ochilish marosimida qatnashdi hamda sanoat rivoji "
+          "haqida nutq so'zladi. Zavod yiliga 50 ming tonna mahsulot ishlab chiqaradi, 800 kishi ish bilan "
+          "ta'minlanadi. Obuna bo'ling: @kanal https://t.me/kanal/5")
+OTHER = ("Prezident bugun Samarqandda yangi maktabning ochilish marosimida ishtirok etdi va ta'lim rivoji haqida "
+         "nutq so'zladi. Maktab 1200 o'quvchiga mo'ljallangan.")
+
+
+def test_simhash_close_for_reworded_repost():
+    assert distance(simhash(ORIGINAL), simhash(REPOST)) <= 7
+    assert distance(simhash(ORIGINAL), simhash(OTHER)) > 7
+
+
+def test_index_detects_and_evicts_by_time():
+    idx = DuplicateIndex(ttl=60)
+    assert idx.check(ORIGINAL, "a", now=0) is None
+    assert idx.check(OTHER, "b", now=1) is None
+    assert idx.check(REPOST, "c", now=10) == "a"
+    assert len(idx) == 2 and idx.stats == {"checked": 3, "duplicates": 1}
+    # TTL o'tgach asl post unutiladi, takror yangi post sifatida qabul qilinadi
+    assert idx.check(REPOST, "d", now=100) is None
+    assert len(idx) == 1 and not any(len(b) > 1 for b in idx._buckets.values())
+
+
+@pytest.mark.asyncio
+async def test_channel_monitor_merges_duplicate_into_digest(fake_client, fake_message, fake_chat, monkeypatch):
+    calls = []
+
+    class Res:
+        text = '["Zavod ochildi"]'
+
+    def fake_generate(prompt, *args, **kwargs): calls.append(prompt); return Res()
+
+    monkeypatch.setattr(main.model, "generate_content", fake_generate)
+    monkeypatch.setattr(main, "app", fake_client)
+    await main.set_setting("dest_channel", "-100500")
+    await main.set_setting("digest_mode", "on")
+    main.sources_cache.update({1, 2})
+
+    for cid, title, text in ((1, "Kun", ORIGINAL), (2, "Daryo", REPOST)):
+        msg = fake_message(text=text, chat=fake_chat(chat_id=cid, title=title))
+        msg.link = f"https://t.me/c/{cid}"
+        await main.channel_monitor(None, msg)
+
+    await main.news_digest.close()
+    while await main.outbox.process_one(): pass
+    assert len(calls) == 1 and "Daryo" not in calls[0]
+    assert len(fake_client._sent_messages) == 1
+    assert "Kun (+Daryo)" in fake_client._sent_messages[0][1]
+
+
+@pytest.mark.asyncio
+async def test_channel_monitor_per_post_skips_duplicate(fake_client, fake_message, fake_chat, monkeypatch):
+    monkeypatch.setattr(main, "app", fake_client)
+    await main.set_setting("dest_channel", "-100500")
+    main.sources_cache.update({1, 2})
+    for cid, text in ((1, ORIGINAL), (2, REPOST), (2, OTHER)):
+        msg = fake_message(text=text, chat=fake_chat(chat_id=cid, title=f"K{cid}"))
+        msg.link = "https://t.me/x/1"
+        await main.channel_monitor(None, msg)
+    while await main.outbox.process_one(): pass
+    assert len(fake_client._sent_messages) == 2
+    assert main.news_dedupe.stats["duplicates"] == 1
@@ -0,0 +1,74 @@
+# tests/test_digest.py
+import asyncio
+
+import pytest
+
+import main
+from digest import DigestBuffer, format_digest, parse_digest
+
+
+def test_parse_digest_json_and_numbered_fallback():
+    assert parse_digest('Mana: ["Birinchi", "Ikkinchi"]', 3) == ["Birinchi", "Ikkinchi", None]
+    assert parse_digest("1. Birinchi\n[3] Uchinchi", 3) == ["Birinchi", None, "Uchinchi"]
+
+
+def test_format_digest_splits_long_digest():
+    items = [{"channel": f"K{i}", "link": f"https://t.me/k/{i}"} for i in range(5)]
+    parts = format_digest(items, ["x" * 100] * 5, limit=300)
+    assert len(parts) > 1 and parts[0].startswith("🗞 **Dayjest**")
+    assert all(len(p) <= 300 for p in parts)
+    assert sum(p.count("▪️") for p in parts) == 5
+
+    # Chegaradan uzun bitta xulosa: sarlavhaning o'zi alohida ketmaydi, xabar chegaradan oshmaydi
+    parts = format_digest(items[:2], ["y" * 5000, "qisqa"], limit=300)
+    assert all(len(p) <= 300 and "▪️" in p for p in parts)
+    assert parts[0].startswith("🗞 **Dayjest**") and "…" in parts[0] and "https://t.me/k/0" in parts[0]
+
+
+@pytest.mark.asyncio
+async def test_buffer_flushes_by_count_and_timer():
+    batches = []
+
+    async def flush(items): batches.append([it["n"] for it in items])
+
+    buf = DigestBuffer(flush, window=0.05, max_items=2)
+    buf.add({"n": 1}); buf.add({"n": 2}); buf.add({"n": 3})
+    await asyncio.sleep(0.01)
+    assert batches == [[1, 2]]
+    # Uchinchi post oynasi tugaganda yolg'iz ketadi
+    await asyncio.sleep(0.1)
+    assert batches == [[1, 2], [3]]
+    await buf.close()
+    assert buf.stats == {"posts": 3, "digests": 2, "failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_channel_monitor_digest_one_request_one_message(fake_client, fake_message, fake_chat, monkeypatch):
+    calls = []
+
+    class Res:
+        text = '["Qisqa 1", "Qisqa 2"]'
+
+    def fake_generate(prompt, *args, **kwargs): calls.append(prompt); return Res()
+
+    monkeypatch.setattr(main.model, "generate_content", fake_generate)
+    monkeypatch.setattr(main, "app", fake_client)
+    await main.set_setting("dest_channel", "-100500")
+    await main.set_setting("digest_mode", "on")
+    main.sources_cache.add(77)
+
+    posts = ["Toshkentda yangi metro bekati ochildi, u Yunusobod tumanini shahar markazi bilan bog'laydi.",
+             "Ertaga respublika bo'ylab kuchli yomg'ir va shamol kutilmoqda, harorat 10 darajaga tushadi."]
+    for i, text in enumerate(posts):
+        msg = fake_message(text=text, chat=fake_chat(chat_id=77, title="Manba"))
+        msg.link = f"https://t.me/manba/{i}"
+        await main.channel_monitor(None, msg)
+    assert fake_client._sent_messages == []   # hali buferda
+
+    await main.news_digest.close()
+    while await main.outbox.process_one(): pass
+    assert len(calls) == 1
+    assert len(fake_client._sent_messages) == 1
+    chat_id, text = fake_client._sent_messages[0]
+    assert chat_id == -100500
+    assert text.index("Qisqa 1") < text.index("Qisqa 2") and "https://t.me/manba/1" in text
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait
+
+from edits import EditScheduler
+
+
+class Chat:
+    id = 1
+
+
+class Msg:
+    def __init__(self, mid=1, flood_once=False):
+        self.id = mid
+        self.chat = Chat()
+        self.edits = []
+        self.flood_once = flood_once
+
+    async def edit_text(self, text):
+        if self.flood_once:
+            self.flood_once = False
+            raise FloodWait(value=0)
+        self.edits.append(text)
+        return self
+
+
+@pytest.mark.asyncio
+async def test_coalesces_to_latest_frame():
+    editor = EditScheduler(min_interval=0.2)
+    msg = Msg()
+    for i in range(10):
+        await editor.edit(msg, f"{i}%")
+    await editor.edit(msg, "tayyor", final=True)
+
+    # Oraliq kadrlar hali yuborilmagan edi — faqat yakuniy matn ketadi
+    assert msg.edits == ["tayyor"]
+    assert editor.stats["dropped"] == 10
+
+
+@pytest.mark.asyncio
+async def test_messages_in_same_chat_do_not_suppress_each_other():
+    editor = EditScheduler(min_interval=10)
+    a, b = Msg(1), Msg(2)
+    await editor.edit(a, "a 50%")
+    await editor.edit(b, "b 50%")
+    await asyncio.sleep(0.01)
+    assert a.edits == ["a 50%"] and b.edits == ["b 50%"]
+
+
+@pytest.mark.asyncio
+async def test_final_edit_retries_after_floodwait():
+    editor = EditScheduler()
+    msg = Msg(flood_once=True)
+    assert await editor.edit(msg, "natija", final=True) is msg
+    assert msg.edits == ["natija"]
+    assert editor.stats["flood_waits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_budget_limits_edit_rate():
+    editor = EditScheduler(chat_per_min=60, chat_burst=2, min_interval=0)
+    msgs = [Msg(i) for i in range(4)]
+    loop = asyncio.get_running_loop(); start = loop.time()
+    await asyncio.gather(*(editor.edit(m, "x", final=True) for m in msgs))
+    # 2 tasi darhol, qolgan 2 tasi sekundiga 1 tadan
+    assert loop.time() - start >= 1.5
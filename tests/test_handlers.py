@@ -1,6 +1,7 @@
 # tests/test_handlers.py
+import asyncio
+
 import pytest
-import sqlite3
 from datetime import datetime
 
 import main
@@ -139,7 +140,7 @@ async def test_set_dest_handler_on(fake_client, fake_message, monkeypatch):
 
     await main.set_dest_handler(fake_client, msg)
 
-    val = main.get_setting("dest_channel")
+    val = await main.get_setting("dest_channel")
     assert val == "555"
     assert "✅ Qabul" in msg._edited_text
 
@@ -153,7 +154,7 @@ async def test_set_dest_handler_off(fake_client, fake_message):
 
     await main.set_dest_handler(fake_client, msg)
 
-    val = main.get_setting("dest_channel")
+    val = await main.get_setting("dest_channel")
     assert val == "off"
     assert "O'chirildi" in msg._edited_text
 
@@ -184,7 +185,7 @@ async def test_delsource(fake_client, fake_message):
     """
     .delsource handleri DBdan o'chirayotganini tekshirish
     """
-    main.add_source_channel(123, "Source Chat")
+    await main.add_source_channel(123, "Source Chat")
 
     msg = fake_message(
         text=".delsource",
@@ -192,7 +193,7 @@ async def test_delsource(fake_client, fake_message):
     )
     await main.del_source_handler(fake_client, msg)
 
-    sources = main.get_all_sources()
+    sources = await main.get_all_sources()
     assert 123 not in sources
     assert "Olib tashlandi" in msg._edited_text
 
@@ -209,14 +210,15 @@ async def test_stats_handler(fake_client, fake_message):
     class DummyMsg:
         def __init__(self, text):
             from datetime import datetime
+            self.id = 1
             self.text = text
             self.caption = None
             self.date = datetime.now()
             self.chat = type("C", (), {"id": 1})
             self.from_user = type("U", (), {"id": 1})
 
-    main.log_message(DummyMsg("Hello 1"), "in")
-    main.log_message(DummyMsg("Hello 2"), "out")
+    await main.log_message(DummyMsg("Hello 1"), "in")
+    await main.log_message(DummyMsg("Hello 2"), "out")
 
     msg = fake_message(
         text=".stats",
@@ -225,7 +227,9 @@ async def test_stats_handler(fake_client, fake_message):
 
     await main.stats_handler(fake_client, msg)
 
-    assert "📊 Jami loglar: 2" in msg._edited_text
+    assert "📊 Jami loglar: 2 (📥 1 / 📤 1" in msg._edited_text
+    assert "[1](tg://user?id=1): 2" in msg._edited_text
+    assert "Kunlik" in msg._edited_text
 
 
 # -------------------------------
@@ -250,3 +254,66 @@ async def test_stop_handler(fake_client, fake_message):
 
     assert chat_id not in main.active_backups
     assert "To'xtatildi" in msg._edited_text
+
+
+# -------------------------------
+#  STREAMING (bo'laklab tahrirlash)
+# -------------------------------
+
+@pytest.mark.asyncio
+async def test_qisqa_streams_chunks(fake_client, fake_message, monkeypatch):
+    class Chunk:
+        def __init__(self, text):
+            self.text = text
+
+    def fake_stream(prompt, *args, **kwargs):
+        assert kwargs.get("stream") is True
+        return iter([Chunk("Birinchi "), Chunk("ikkinchi "), Chunk("uchinchi")])
+
+    monkeypatch.setattr(main.model, "generate_content", fake_stream)
+    reply_msg = fake_message(text="Uzun matn")
+    msg = fake_message(text=".qisqa", command=["qisqa"], reply_to_message=reply_msg)
+
+    await main.summarize_handler(fake_client, msg)
+
+    assert msg._edited_text == "📌 **Qisqa:**\nBirinchi ikkinchi uchinchi"
+
+
+@pytest.mark.asyncio
+async def test_render_stream_shows_first_chunk_before_finish(fake_message):
+    seen = []
+    msg = fake_message(text="🧠 ...")
+
+    async def chunks():
+        yield "Salom"
+        # Ikkinchi bo'lak kelishidan oldin birinchisi allaqachon ko'rinadi
+        await asyncio.sleep(0.05); seen.append(msg._edited_text)
+        yield " dunyo"
+
+    full = await main.render_stream(msg, "📌 ", chunks())
+    assert seen == ["📌 Salom ▌"]
+    assert full == "Salom dunyo" and msg._edited_text == "📌 Salom dunyo"
+
+
+@pytest.mark.asyncio
+async def test_render_stream_rolls_over_long_output(fake_message, monkeypatch):
+    sent = []
+
+    async def fake_send_message(chat_id, text, **kwargs):
+        m = fake_message(text=text)
+        sent.append(m)
+        return m
+
+    monkeypatch.setattr(main.app, "send_message", fake_send_message)
+
+    async def chunks():
+        for _ in range(3):
+            yield "x" * 2000 + "\n"
+
+    msg = fake_message(text="🧠 ...")
+    full = await main.render_stream(msg, "📌 ", chunks())
+
+    assert len(full) == 6003
+    assert len(msg._edited_text) <= main.TG_LIMIT
+    assert len(sent) == 1
+    assert msg._edited_text + sent[0]._edited_text == "📌 " + full
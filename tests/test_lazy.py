@@ -0,0 +1,54 @@
+import subprocess
+import sys
+
+import pytest
+
+import main
+from lazy import LazyModule
+
+
+def test_main_import_does_not_load_heavy_modules():
+    code = "import sys, main; print('yt_dlp' in sys.modules, 'google.generativeai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=main.os.path.dirname(main.__file__))
+    assert out.stdout.split() == ["False", "False"]
+
+
+def test_lazy_module_loads_once_and_forwards_setattr():
+    calls = []
+    mod = LazyModule("json", on_load=lambda m: calls.append(m.__name__))
+    assert not mod.loaded
+    assert mod.dumps([1]) == "[1]" and mod.loads("2") == 2
+    assert calls == ["json"]
+    mod.lazy_marker = 1
+    import json
+    assert json.lazy_marker == 1
+    del mod.lazy_marker
+    assert not hasattr(json, "lazy_marker")
+
+
+@pytest.mark.asyncio
+async def test_startup_report_is_recorded(capsys):
+    assert await main.record_startup({"import": 100, "db": 5, "telegram": 300}) == 405
+    await main.record_startup({"import": 90, "db": 5, "telegram": 200})
+    assert await main.startup_summary() == (295, 405)
+    assert "jami 405 ms" in capsys.readouterr().out
+
+
+@pytest.mark.asyncio
+async def test_heavy_module_loads_off_the_event_loop(monkeypatch):
+    import asyncio, threading, types
+    threads = []
+
+    class YDL:
+        def __init__(self, opts): self.opts = opts
+        def __enter__(self): return self
+        def __exit__(self, *exc): return False
+        def extract_info(self, url, download=True): return {"url": url, "download": download}
+
+    fake = types.ModuleType("fake_ydl"); fake.YoutubeDL = YDL
+    monkeypatch.setitem(sys.modules, "fake_ydl", fake)
+    monkeypatch.setattr(main, "yt_dlp", LazyModule("fake_ydl", on_load=lambda m: threads.append(threading.current_thread())))
+
+    info = await asyncio.to_thread(main.ydl_call, {}, "extract_info", "u", download=False)
+    assert info == {"url": "u", "download": False}
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import main
+from links import LinkService, normalize_url
+
+
+def test_normalize_url_merges_variants():
+    key = "https://youtube.com/watch?v=abc"
+    assert normalize_url("https://youtu.be/abc?si=XYZ") == key
+    assert normalize_url("http://www.youtube.com/watch?v=abc&utm_source=tg&feature=share") == key
+    assert normalize_url("https://m.youtube.com/shorts/abc/") == key
+    assert normalize_url("https://example.com/a?b=2&a=1#x") == "https://example.com/a?a=1&b=2"
+
+
+@pytest.mark.asyncio
+async def test_link_service_dedupes_inflight_and_caches(patch_sqlite_tmp_db):
+    service = LinkService(patch_sqlite_tmp_db, workers=2)
+    calls = []
+
+    async def job():
+        calls.append(1); await asyncio.sleep(0.05)
+        return ["FILE_ID"]
+
+    results = await asyncio.gather(*[service.run("https://x.com/v", job) for _ in range(3)])
+
+    assert calls == [1]
+    assert sorted(first for _, first in results) == [False, False, True]
+    assert all(fids == ["FILE_ID"] for fids, _ in results)
+    assert service.stats["joined"] == 2
+    assert await service.cached("https://x.com/v") == ["FILE_ID"]
+    await service.stop()
+
+
+@pytest.mark.asyncio
+async def test_link_repeat_is_resent_without_download(fake_message, monkeypatch):
+    downloads, cached_sends = [], []
+
+    async def fake_fetch(url, profile, chat_id, status, caption):
+        downloads.append(url); return ["FILE_ID"]
+
+    async def fake_send_cached(chat_id, file_id, **kwargs):
+        cached_sends.append((chat_id, file_id))
+
+    async def noop(*a, **k): pass
+
+    monkeypatch.setattr(main, "fetch_link", fake_fetch)
+    monkeypatch.setattr(main.app, "send_cached_media", fake_send_cached, raising=False)
+
+    for url in ("https://youtu.be/abc", "https://www.youtube.com/watch?v=abc&si=1"):
+        msg = fake_message(text=f".link {url}", command=["link", url])
+        msg.delete = noop
+        await main.download_link_handler(None, msg)
+
+    assert downloads == ["https://youtu.be/abc"]
+    assert cached_sends == [(123, "FILE_ID")]
+    await main.link_service.stop()
+
+
+def test_parse_link_args_and_profile_key():
+    from links import link_key, parse_link_args
+    url, profile = parse_link_args(["-q", "720p", "https://youtu.be/abc", "-fast"])
+    assert url == "https://youtu.be/abc" and profile == {"height": 720, "audio": False, "fast": True}
+    assert link_key(url, profile) == "https://youtube.com/watch?v=abc#720p#fast"
+    assert link_key(url, parse_link_args(["-audio"])[1]) == "https://youtube.com/watch?v=abc#audio"
+    for bad in (["URL", "-q", "hd"], ["URL", "-q"]):
+        with pytest.raises(ValueError): parse_link_args(bad)
+
+
+@pytest.mark.asyncio
+async def test_link_handler_replies_on_bad_quality(fake_message):
+    msg = fake_message(command=["link", "https://youtu.be/abc", "-q", "hd"])
+    await main.download_link_handler(None, msg)
+    assert msg._edited_text.startswith("❌ Format")
+
+
+FORMATS = {"duration": 100, "formats": [
+    {"format_id": "a", "vcodec": "none", "acodec": "mp4a", "ext": "m4a", "abr": 128, "filesize": 1_000},
+    {"format_id": "p360", "vcodec": "avc1", "acodec": "mp4a", "ext": "mp4", "height": 360, "filesize": 5_000},
+    {"format_id": "p720", "vcodec": "avc1", "acodec": "mp4a", "ext": "mp4", "height": 720, "filesize": 20_000},
+    {"format_id": "v720", "vcodec": "avc1", "acodec": "none", "ext": "mp4", "height": 720, "filesize": 15_000},
+    {"format_id": "v1080", "vcodec": "avc1", "acodec": "none", "ext": "mp4", "height": 1080, "tbr": 4},
+]}
+
+
+def test_choose_format_prefers_progressive_and_respects_size():
+    from links import choose_format
+    base = {"height": None, "audio": False, "fast": False}
+    # 1080p faqat alohida video — birlashtiriladi (tbr bo'yicha 50_000 bayt)
+    assert choose_format(FORMATS, base, limit=10 ** 6) == {"format": "v1080+a", "merge": True, "size": 51_000, "height": 1080}
+    # 720p da tayyor format remux talab qilmaydi
+    assert choose_format(FORMATS, {**base, "height": 720}, limit=10 ** 6)["format"] == "p720"
+    # Limitga sig'adigan eng yaxshisi
+    assert choose_format(FORMATS, base, limit=17_000)["format"] == "v720+a"
+    assert choose_format(FORMATS, {**base, "fast": True}, limit=10_000)["format"] == "p360"
+    # Hech biri sig'masa — eng kichigi (keyin qismlarga bo'linadi)
+    assert choose_format(FORMATS, {**base, "fast": True}, limit=100)["format"] == "p360"
+    assert choose_format(FORMATS, {**base, "audio": True})["format"] == "a"
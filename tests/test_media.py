@@ -0,0 +1,171 @@
+import os
+
+import pytest
+
+from media import MediaStore, media_unique_id
+
+
+class FileRef:
+    def __init__(self, uid):
+        self.file_unique_id = uid
+
+
+class Msg:
+    def __init__(self, uid, kind="photo"):
+        self.id = 1
+        setattr(self, kind, FileRef(uid))
+
+
+class CountingClient:
+    def __init__(self, size=100):
+        self.calls = 0
+        self.size = size
+
+    async def download_media(self, m, file_name=None, **kwargs):
+        self.calls += 1
+        os.makedirs(file_name, exist_ok=True)
+        path = os.path.join(file_name, f"file_{self.calls}.jpg")
+        with open(path, "wb") as f: f.write(b"x" * self.size)
+        return path
+
+
+def test_media_unique_id():
+    assert media_unique_id(Msg("abc", "voice")) == "abc"
+    assert media_unique_id(object()) is None
+
+
+@pytest.mark.asyncio
+async def test_store_reuses_by_unique_id(patch_sqlite_tmp_db, tmp_path):
+    store = MediaStore(patch_sqlite_tmp_db, root=str(tmp_path / "store"))
+    client = CountingClient()
+
+    first = await store.download(client, Msg("sticker1"), str(tmp_path / "chat1"))
+    second = await store.download(client, Msg("sticker1"), str(tmp_path / "chat2"))
+
+    assert client.calls == 1
+    assert os.path.exists(first) and os.path.exists(second)
+    assert store.stats["downloads_avoided"] == 1
+    assert store.stats["bytes_saved"] == 100
+
+
+@pytest.mark.asyncio
+async def test_store_evicts_lru_over_budget(patch_sqlite_tmp_db, tmp_path):
+    store = MediaStore(patch_sqlite_tmp_db, root=str(tmp_path / "store"), budget=250)
+    client = CountingClient()
+    for uid in ("a", "b", "c"):
+        await store.download(client, Msg(uid), str(tmp_path / "dl"))
+
+    assert store.stats["evicted"] == 1
+    assert await store.reuse(Msg("a"), str(tmp_path / "x")) is None
+    assert await store.reuse(Msg("c"), str(tmp_path / "x"))
+
+
+def test_plan_segments_overlap():
+    from media import plan_segments
+    assert plan_segments(1500, segment=600, overlap=8) == [(0, 608), (600, 608), (1200, 300)]
+    assert plan_segments(100, segment=600) == [(0, 100)]
+
+
+def test_merge_overlap_removes_duplicated_words():
+    from media import merge_overlap
+    left = "Bugun biz yangi mavzu haqida gaplashamiz"
+    right = "mavzu haqida gaplashamiz. Birinchi savol\nikkinchi savol"
+    assert merge_overlap(left, right) == "Bugun biz yangi mavzu haqida gaplashamiz. Birinchi savol\nikkinchi savol"
+    assert merge_overlap("bir ikki", "uch to'rt") == "bir ikki\nuch to'rt"
+    # Moslik chap matn oxirida bo'lmasa, undan keyingi so'zlar takrorlanmaydi
+    assert (merge_overlap("one two three four five six seven", "four five six eight seven nine ten")
+            == "one two three four five six eight seven nine ten")
+
+
+@pytest.mark.asyncio
+async def test_transcribe_segments_runs_in_order(fake_message, tmp_path, monkeypatch):
+    import main
+
+    async def fake_cut(path, start, length, dest):
+        with open(dest, "w") as f: f.write(str(start))
+        return dest
+
+    class Res:
+        def __init__(self, text):
+            self.text = text
+
+    texts = {"0": "boshi bir ikki uch", "600": "bir ikki uch to'rt besh", "1200": "uch to'rt besh olti"}
+
+    def fake_generate(contents, *args, **kwargs):
+        return Res(texts[contents[0]])
+
+    monkeypatch.setattr(main, "cut_segment", fake_cut)
+    monkeypatch.setattr(main, "gemini_upload", lambda p: open(p).read())
+    monkeypatch.setattr(main.model, "generate_content", fake_generate)
+
+    src = tmp_path / "long.ogg"; src.write_text("audio")
+    full = await main.transcribe_segments(str(src), fake_message(), 1500)
+
+    assert full == "boshi bir ikki uch to'rt besh olti"
+    assert not os.path.exists(f"{src}_parts")
+
+
+def test_stream_buffer_reader_waits_for_writer():
+    import threading
+    from media import StreamBuffer
+
+    buf = StreamBuffer(10); got = []
+    assert buf.seek(0, os.SEEK_END) == 10; buf.seek(0)
+    reader = threading.Thread(target=lambda: got.append(buf.read(10)))
+    reader.start()
+    buf.feed(b"01234"); buf.feed(b"56789"); buf.finish()
+    reader.join(2)
+    assert got == [b"0123456789"]
+    assert buf.in_memory
+
+
+def test_chunked_upload_reads_first_chunk_before_download_ends():
+    import threading
+    from googleapiclient.http import MediaIoBaseUpload
+    import main
+    from media import StreamBuffer
+
+    buf = StreamBuffer(3 * main.UPLOAD_CHUNK); got = []
+    media = MediaIoBaseUpload(buf, mimetype="audio/ogg", chunksize=main.UPLOAD_CHUNK, resumable=True)
+    assert media.size() == 3 * main.UPLOAD_CHUNK
+    reader = threading.Thread(target=lambda: got.append(len(media.getbytes(0, main.UPLOAD_CHUNK))))
+    reader.start()
+    # Faqat birinchi bo'lak keldi — yuklovchi qolganini kutmaydi
+    buf.feed(b"x" * main.UPLOAD_CHUNK)
+    reader.join(2)
+    assert got == [main.UPLOAD_CHUNK]
+    buf.fail(RuntimeError("test")); buf.close()
+
+
+@pytest.mark.asyncio
+async def test_short_media_streams_without_disk_and_reuses_upload(fake_message, tmp_path, monkeypatch):
+    import main
+
+    class Voice:
+        file_unique_id = "v1"; file_size = 6; duration = 5; mime_type = "audio/ogg"
+
+    uploads = []
+
+    def fake_upload(fd, mime_type=None):
+        fd.seek(0, os.SEEK_END); size = fd.tell(); fd.seek(0)
+        uploads.append((fd.read(size), mime_type))
+        return "uploaded://v1"
+
+    async def fake_stream_media(m):
+        for part in (b"abc", b"def"): yield part
+
+    async def fail_download(*a, **k): raise AssertionError("diskka yuklanmasligi kerak")
+
+    monkeypatch.setattr(main, "upload_stream", fake_upload)
+    monkeypatch.setattr(main.app, "stream_media", fake_stream_media, raising=False)
+    monkeypatch.setattr(main.app, "download_media", fail_download, raising=False)
+    monkeypatch.chdir(tmp_path)
+
+    target = fake_message(); target.voice = Voice()
+    status = fake_message()
+    assert await main.upload_media(target, target.voice, status) == "uploaded://v1"
+    assert await main.upload_media(target, target.voice, status) == "uploaded://v1"
+
+    assert uploads == [(b"abcdef", "audio/ogg")]
+    assert main.upload_cache.stats["hits"] == 1
+    assert not os.path.exists(tmp_path / "downloads")
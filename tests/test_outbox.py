@@ -0,0 +1,150 @@
+# tests/test_outbox.py
+import asyncio
+import time
+
+import pytest
+from pyrogram.errors import FloodWait
+
+import main
+from outbox import Outbox
+
+
+async def rows(db):
+    return await db.fetchall("SELECT kind, status, attempts, payload FROM outbox ORDER BY id")
+
+
+@pytest.mark.asyncio
+async def test_retry_with_backoff_then_delivered(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db; seen = []
+
+    async def flaky(payload):
+        seen.append(payload["n"])
+        if len(seen) == 1: raise RuntimeError("503")
+
+    box = Outbox(db, {"news": flaky}, base_delay=60)
+    await box.put("news", {"n": 1})
+    assert await box.process_one()
+    (kind, status, attempts, _), = await rows(db)
+    assert (status, attempts) == ("pending", 1)
+    # Kechikish tugamaguncha qayta olinmaydi
+    assert not await box.process_one()
+    await db.execute("UPDATE outbox SET next_at=0")
+    assert await box.process_one()
+    assert await rows(db) == [] and seen == [1, 1]
+    assert box.stats["delivered"] == 1 and box.stats["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flood_wait_pauses_without_counting_attempt(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+
+    async def flood(payload): raise FloodWait(value=30)
+
+    box = Outbox(db, {"news": flood})
+    await box.put("news", {})
+    await box.process_one()
+    (_, status, attempts, _), = await rows(db)
+    assert (status, attempts) == ("pending", 0)
+    assert box.stats["flood_waits"] == 1 and box._resume_at > time.monotonic() + 20
+
+
+@pytest.mark.asyncio
+async def test_dead_after_max_attempts_and_retry(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+
+    async def broken(payload): raise ValueError("yomon")
+
+    box = Outbox(db, {"news": broken}, max_attempts=2, base_delay=0)
+    await box.put("news", {})
+    while await box.process_one(): pass
+    assert await box.counts() == {"dead": 1}
+    assert await box.retry_dead() == 1
+    assert await box.counts() == {"pending": 1}
+
+
+@pytest.mark.asyncio
+async def test_running_rows_recovered_on_start(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+
+    async def ok(payload): pass
+
+    # Oldingi jarayon vazifa o'rtasida to'xtagan
+    await db.execute("INSERT INTO outbox (kind, payload, status, attempts, next_at, created) VALUES ('news', '{}', 'running', 0, 0, 0)")
+    box = Outbox(db, {"news": ok})
+    box.start()
+    # Qator yetkazilgandan (o'chirilgandan) keyingina to'xtatiladi
+    for _ in range(200):
+        if box.stats["delivered"]: break
+        await asyncio.sleep(0.01)
+    await box.stop()
+    assert box.stats["delivered"] == 1 and await box.counts() == {}
+
+
+@pytest.mark.asyncio
+async def test_channel_monitor_enqueues_without_ai(fake_message, fake_chat, monkeypatch):
+    def no_ai(*args, **kwargs): raise AssertionError("handler ichida AI chaqirilmasligi kerak")
+
+    monkeypatch.setattr(main.model, "generate_content", no_ai)
+    await main.set_setting("dest_channel", "-100500")
+    main.sources_cache.add(5)
+    msg = fake_message(text="Yangi ko'prik qurilishi boshlandi, u ikki tumanni bog'laydi va 2026 yilda tugaydi.", chat=fake_chat(chat_id=5, title="K"))
+    msg.link = "https://t.me/k/1"
+    await main.channel_monitor(None, msg)
+    (kind, status, _, payload), = await rows(main.db)
+    assert (kind, status) == ("news", "pending") and "https://t.me/k/1" in payload
+
+
+@pytest.mark.asyncio
+async def test_digest_retry_skips_parts_already_sent(fake_client, monkeypatch):
+    sent, failed = [], []
+
+    async def send_message(chat_id, text, **kwargs):
+        # Ikkinchi qism birinchi urinishda yuborilmaydi
+        if len(sent) == 1 and not failed: failed.append(text); raise RuntimeError("tarmoq")
+        sent.append(text)
+
+    fake_client.send_message = send_message
+    monkeypatch.setattr(main, "app", fake_client)
+    monkeypatch.setattr(main, "TG_LIMIT", 120)
+    await main.set_setting("dest_channel", "-100500")
+    items = [{"channel": f"K{i}", "text": f"post {i}", "link": f"https://t.me/k/{i}"} for i in range(3)]
+    await main.enqueue_digest(items)
+    await main.outbox.process_one()
+    await main.db.execute("UPDATE outbox SET next_at=0")
+    await main.outbox.process_one()
+    assert len(sent) == len(set(sent)) >= 2 and failed == [sent[1]]
+    assert await main.outbox.counts() == {}
+
+
+@pytest.mark.asyncio
+async def test_buffered_digest_posts_survive_restart(fake_client, fake_message, fake_chat, monkeypatch):
+    class Res:
+        text = '["Ko\'prik", "Metro"]'
+
+    monkeypatch.setattr(main.model, "generate_content", lambda *a, **k: Res())
+    monkeypatch.setattr(main, "app", fake_client)
+    await main.set_setting("dest_channel", "-100500")
+    await main.set_setting("digest_mode", "on")
+    main.sources_cache.update({5, 6})
+    posts = [(5, "Yangi ko'prik qurilishi boshlandi, u ikki tumanni bog'laydi va 2026 yilda tugaydi."),
+             (6, "Toshkentda yangi metro bekati ochildi, u Yunusobod tumanini shahar markazi bilan bog'laydi."),
+             (6, "⚡️ Yangi ko'prik qurilishi boshlandi: u ikki tumanni bog'laydi va 2026 yilda tugaydi! @kanal")]
+    for i, (cid, text) in enumerate(posts):
+        msg = fake_message(text=text, chat=fake_chat(chat_id=cid, title=f"K{cid}"))
+        msg.link = f"https://t.me/k/{i}"
+        await main.channel_monitor(None, msg)
+
+    # Postlar oyna tugashini kutmasdan bazada; takror kanal asl postga yozilgan
+    buffered = await main.outbox.buffered()
+    assert [p["link"] for _, p in buffered] == ["https://t.me/k/0", "https://t.me/k/1"]
+    assert buffered[0][1]["also"] == ["K6"]
+
+    # Jarayon "o'ldi": xotiradagi bufer yo'qoldi, yangi jarayon bazadan tiklaydi
+    monkeypatch.setattr(main, "news_digest", main.DigestBuffer(main.enqueue_digest))
+    await main.restore_digest()
+    await main.news_digest.close()
+    assert await main.outbox.counts() == {"pending": 1}
+    while await main.outbox.process_one(): pass
+    (_, text), = fake_client._sent_messages
+    assert "K5 (+K6)" in text and text.index("Ko'prik") < text.index("Metro")
+    assert await main.outbox.counts() == {}
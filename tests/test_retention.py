@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from retention import archive_months, iter_archive, search_archive
+
+
+async def insert(db, rows):
+    await db.executemany("INSERT INTO messages (date, chat_id, sender_id, text, type, msg_id) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+@pytest.mark.asyncio
+async def test_run_once_archives_old_rows_and_keeps_search_working(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db; r = main.retention
+    recent = str(datetime.now() - timedelta(days=1))
+    await insert(db, [("2023-01-05 10:00:00", 1, 1, "eski hisobot", "in", 1),
+                      ("2023-02-07 10:00:00", 2, 2, "yana eski gap", "out", 2),
+                      (recent, 1, 1, "yangi hisobot", "in", 3)])
+    r.max_age_days = 30; r.batch = 1
+
+    assert await r.run_once() == 2
+    assert (await db.fetchone("SELECT COUNT(*) FROM messages"))[0] == 1
+    assert archive_months(r.folder) == ["2023-01", "2023-02"]
+    assert [row[3] for row in iter_archive(r.folder)] == ["yana eski gap", "eski hisobot"]
+    # FTS indeksi ham tozalangan, yig'malar esa tarixni saqlaydi
+    assert [row[3] for row in await main.search_messages(db, "hisobot")] == [3]
+    assert (await db.fetchone("SELECT incoming + outgoing FROM stats_total"))[0] == 3
+    assert (await db.fetchone("PRAGMA auto_vacuum"))[0] == 2
+
+    assert [row[3] for row in search_archive(r.folder, "hisobot", since="2023-01-01 00:00:00")] == ["eski hisobot"]
+    assert search_archive(r.folder, "gap", chat_id=1) == []
+
+
+@pytest.mark.asyncio
+async def test_size_policy_archives_oldest_first(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db; r = main.retention
+    await insert(db, [(f"2024-01-{d:02d} 10:00:00", 1, 1, "x" * 2000, "in", d) for d in range(1, 29)])
+    r.max_age_days = 0; r.batch = 5
+    r.max_bytes = await r.live_bytes() - 20_000
+
+    assert await r.run_once() >= 5
+    oldest = (await db.fetchone("SELECT MIN(date) FROM messages"))[0]
+    assert oldest > "2024-01-05"
+    assert await r.live_bytes() <= r.max_bytes
+
+
+@pytest.mark.asyncio
+async def test_old_database_converted_only_on_explicit_run(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db; r = main.retention
+    await db.run(lambda conn: (conn.execute("PRAGMA auto_vacuum=NONE"), conn.execute("VACUUM")))
+    await insert(db, [("2023-01-05 10:00:00", 1, 1, "eski hisobot", "in", 1),
+                      (str(datetime.now()), 1, 1, "yangi hisobot", "in", 2)])
+
+    # Siyosat yo'q — fon ishi bazaga tegmaydi
+    r.max_age_days = 0; r.max_bytes = 0
+    assert await r.run_once() == 0 and r.stats["runs"] == 0
+    # Siyosat bor — arxivlaydi, lekin to'liq VACUUM qilmaydi
+    r.max_age_days = 30
+    assert await r.run_once() == 1 and not await r.is_incremental()
+
+    assert await r.ensure_incremental() and await r.is_incremental()
+    assert not await r.ensure_incremental()
+    assert [row[3] for row in await main.search_messages(db, "hisobot")] == [2]
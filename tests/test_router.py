@@ -0,0 +1,120 @@
+import pytest
+
+import main
+from router import ModelRouter
+
+
+class ApiError(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+class FakeGenai:
+    def __init__(self, available, behaviour=None):
+        self.available = available
+        self.behaviour = behaviour or {}   # nom -> "400" | "404" | "503"
+        self.built = []
+        self.clock = None
+
+    def list_models(self):
+        return [type("M", (), {"name": f"models/{n}", "supported_generation_methods": ["generateContent"]}) for n in self.available]
+
+    def GenerativeModel(self, name, **kwargs):
+        self.built.append(name); genai = self
+
+        class Model:
+            def generate_content(self, contents, **kw):
+                b = genai.behaviour.get(name)
+                if b == "404": raise ApiError(404)
+                if b in ("400", "503"): raise ApiError(int(b))
+                if kw.get("stream"): return genai.stream(name, contents)
+                return f"{name}:{contents}"
+        return Model()
+
+    def stream(self, name, contents):
+        # Bo'laklar orasida vaqt o'tadi; "cut" — oqim o'rtasida uziladi
+        for i in range(3):
+            if self.clock: self.clock[0] += 2
+            if i == 1 and self.behaviour.get(name) == "cut": raise ConnectionError("uzildi")
+            yield f"{name}:{i}"
+
+
+def test_router_skips_unlisted_and_fails_over_on_404():
+    genai = FakeGenai(["gone", "b"], {"gone": "404"})
+    router = ModelRouter(genai, {"default": ["a", "gone", "b"]})
+    assert genai.built == [] and router.model_name == "a"
+
+    assert router.generate_content("x") == "b:x"
+    assert genai.built == ["gone", "b"]
+    assert router.unavailable == {"gone"}
+
+
+def test_router_routes_per_task_and_rejects_bad_request():
+    genai = FakeGenai(["fast", "big"])
+    router = ModelRouter(genai, {"default": ["big"], "translate": ["fast", "big"]})
+    assert router.generate_content("x", task="translate") == "fast:x"
+    assert router.generate_content("x", task="transcribe") == "big:x"
+    # 400: so'rov xato — boshqa modelga o'tilmaydi va model "kasal" hisoblanmaydi
+    genai.behaviour["fast"] = "400"
+    with pytest.raises(ApiError):
+        router.generate_content("x", task="translate")
+    assert router.stats[("translate", "fast")].errors == 0
+
+
+def test_router_cools_down_erroring_model_and_recovers(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr("router.time.monotonic", lambda: clock[0])
+    genai = FakeGenai(["p", "s"], {"p": "503"})
+    router = ModelRouter(genai, {"default": ["p", "s"]}, min_samples=3, cooldown=60)
+
+    for _ in range(3): assert router.generate_content("x") == "s:x"
+    # 3 ta xatodan keyin "p" chetlatildi — to'g'ridan-to'g'ri zaxiraga boriladi
+    assert router.order("default") == ["s", "p"] and router.switches == 1
+
+    genai.behaviour["p"] = None; clock[0] += 61
+    assert router.generate_content("x") == "p:x"
+    assert router.report()["default"][0] == "p"
+
+
+def test_router_records_streams_after_last_chunk(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("router.time.monotonic", lambda: clock[0])
+    genai = FakeGenai(["p", "s"], {"p": "cut"}); genai.clock = clock
+    router = ModelRouter(genai, {"default": ["p", "s"]}, min_samples=2, cooldown=60)
+
+    # Oqim o'rtasida uzilish xato sifatida yoziladi va model chetlatiladi
+    for _ in range(2):
+        with pytest.raises(ConnectionError): list(router.generate_content("x", stream=True))
+    assert router.stats[("default", "p")].errors == 2 and router.switches == 1
+    assert router.order("default") == ["s", "p"]
+
+    # Kechikish birinchi bo'lakkacha emas, butun oqim bo'yicha
+    assert list(router.generate_content("x", stream=True)) == ["s:0", "s:1", "s:2"]
+    assert router.stats[("default", "s")].percentile(0.5) == 6
+
+
+def test_router_treats_slow_model_as_degraded(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("router.time.monotonic", lambda: clock[0])
+    genai = FakeGenai(["p", "s"])
+    router = ModelRouter(genai, {"default": ["p", "s"]}, slow={"default": 5}, min_samples=2, cooldown=60)
+    for latency in (9, 9): router.record("default", "p", latency, True)
+    assert router.order("default") == ["s", "p"]
+    # Sinov so'rovi ham sekin bo'lsa — yana chetlatiladi
+    clock[0] += 61; router.record("default", "p", 9, True)
+    assert router.order("default") == ["s", "p"] and router.switches == 2
+
+
+@pytest.mark.asyncio
+async def test_tasks_pass_through_to_router(fake_client, fake_message, monkeypatch):
+    seen = []
+
+    def fake_generate(contents, task="default", **kwargs):
+        seen.append(task)
+        return iter([type("C", (), {"text": "ok"})()]) if kwargs.get("stream") else type("R", (), {"text": "ok"})()
+
+    monkeypatch.setattr(main.model, "generate_content", fake_generate)
+    reply = fake_message(text="Matn")
+    await main.summarize_handler(fake_client, fake_message(command=["qisqa"], reply_to_message=reply))
+    await main.summarize_news("Yangilik matni", "Kanal")
+    assert seen == ["summarize", "news"]
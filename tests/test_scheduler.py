@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+
+from scheduler import AIScheduler, TokenBucket, INTERACTIVE, BACKGROUND, is_retryable
+
+
+class FakeApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def test_is_retryable():
+    assert is_retryable(FakeApiError(429))
+    assert is_retryable(FakeApiError(503))
+    assert not is_retryable(FakeApiError(400))
+    assert not is_retryable(ValueError("x"))
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)  # sekundiga 1 ta
+    bucket.take(60)
+    assert bucket.wait_time(1) > 0.9
+
+
+@pytest.mark.asyncio
+async def test_interactive_runs_before_background():
+    sched = AIScheduler(max_workers=1, rpm=10_000)
+    gate = threading.Event(); order = []
+
+    def blocker():
+        gate.wait(2)
+
+    first = asyncio.ensure_future(sched.submit(blocker, priority=BACKGROUND))
+    await asyncio.sleep(0.05)
+    bg = asyncio.ensure_future(sched.submit(order.append, "bg", priority=BACKGROUND))
+    it = asyncio.ensure_future(sched.submit(order.append, "it", priority=INTERACTIVE))
+    await asyncio.sleep(0.05)
+    assert sched.queue_depth() == {INTERACTIVE: 1, BACKGROUND: 1}
+
+    gate.set()
+    await asyncio.gather(first, bg, it)
+    assert order == ["it", "bg"]
+    sched.close()
+
+
+@pytest.mark.asyncio
+async def test_retries_on_429():
+    sched = AIScheduler(max_workers=1, rpm=10_000, base_delay=0.001)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3: raise FakeApiError(429)
+        return "ok"
+
+    assert await sched.submit(flaky) == "ok"
+    assert sched.stats[INTERACTIVE]["retries"] == 2
+
+    with pytest.raises(FakeApiError):
+        await sched.submit(lambda: (_ for _ in ()).throw(FakeApiError(400)))
+    assert sched.stats[INTERACTIVE]["failed"] == 1
+    sched.close()
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_tokens_go_to_interactive_first():
+    sched = AIScheduler(max_workers=2, rpm=600)   # har 0.1 s da bitta so'rov
+    sched.requests.take(600)                      # chelak bo'sh
+    order = []
+    bg = [asyncio.ensure_future(sched.submit(order.append, f"bg{i}", priority=BACKGROUND)) for i in range(2)]
+    await asyncio.sleep(0.01)
+    it = asyncio.ensure_future(sched.submit(order.append, "it", priority=INTERACTIVE))
+    await asyncio.gather(*bg, it)
+    assert order == ["it", "bg0", "bg1"]
+    sched.close()
@@ -0,0 +1,39 @@
+import pytest
+
+import main
+from search import build_match, parse_date_range, parse_search_args
+
+
+def test_build_match_quotes_terms():
+    assert build_match('salom "dunyo" kit*') == '"salom" """dunyo""" "kit"*'
+    assert build_match("... !!") == ""
+
+
+def test_parse_search_args_and_dates():
+    query, flags = parse_search_args(["hisobot", "-chat", "42", "oy", "-date", "05.01.2024-01.01.2024"])
+    assert query == "hisobot oy" and flags == {"chat": "42", "date": "05.01.2024-01.01.2024"}
+    assert parse_date_range(flags["date"]) == ("2024-01-01 00:00:00", "2024-01-05 23:59:59")
+
+
+@pytest.mark.asyncio
+async def test_search_handler_filters_and_links(fake_message):
+    from datetime import datetime
+
+    class Logged:
+        def __init__(self, mid, chat_id, text, date):
+            self.id = mid; self.text = text; self.caption = None; self.date = date
+            self.chat = type("C", (), {"id": chat_id}); self.from_user = type("U", (), {"id": chat_id})
+
+    await main.log_message(Logged(5, 42, "Oylik hisobot tayyor", datetime(2024, 1, 3, 10, 0)), "in")
+    await main.log_message(Logged(6, 43, "Hisobotni ertaga yuboraman", datetime(2024, 2, 3, 10, 0)), "out")
+    await main.log_message(Logged(7, 42, "Boshqa gap", datetime(2024, 1, 4, 10, 0)), "in")
+
+    msg = fake_message(text=".search hisobot*", command=["search", "hisobot*"])
+    await main.search_handler(None, msg)
+    assert "2 ta natija" in msg._edited_text
+
+    msg = fake_message(command=["search", "hisobot*", "-chat", "42", "-date", "01.01.2024-31.01.2024"])
+    await main.search_handler(None, msg)
+    assert "1 ta natija" in msg._edited_text
+    assert "tg://openmessage?user_id=42&message_id=5" in msg._edited_text
+    assert "**hisobot**" in msg._edited_text.lower()
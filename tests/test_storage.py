@@ -0,0 +1,88 @@
+import pytest
+
+import storage
+
+
+def test_migrate_sets_user_version(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+    version = db._executor.submit(lambda: db.conn.execute("PRAGMA user_version").fetchone()[0]).result()
+    assert version == len(storage.MIGRATIONS)
+
+
+@pytest.mark.asyncio
+async def test_database_uses_wal(patch_sqlite_tmp_db):
+    row = await patch_sqlite_tmp_db.fetchone("PRAGMA journal_mode")
+    assert row[0] == "wal"
+
+
+@pytest.mark.asyncio
+async def test_executemany_and_fetchall(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+    await db.executemany("INSERT INTO sources VALUES (?, ?)", [(1, "a"), (2, "b")])
+    rows = await db.fetchall("SELECT chat_id FROM sources ORDER BY chat_id")
+    assert [r[0] for r in rows] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_writer_group_commits(patch_sqlite_tmp_db):
+    db = patch_sqlite_tmp_db
+    writer = storage.BatchWriter(db, "INSERT INTO sources VALUES (?, ?)", max_batch=10, max_delay=0.01)
+    writer.start()
+    for i in range(25):
+        await writer.put((i, f"s{i}"))
+    await writer.stop()
+
+    rows = await db.fetchone("SELECT COUNT(*) FROM sources")
+    assert rows[0] == 25
+    assert writer.stats["written"] == 25
+    assert writer.stats["batches"] >= 3
+
+
+@pytest.mark.asyncio
+async def test_batch_writer_backpressure_drops(patch_sqlite_tmp_db):
+    writer = storage.BatchWriter(patch_sqlite_tmp_db, "INSERT INTO sources VALUES (?, ?)", max_queue=2, put_timeout=0.01)
+    for i in range(3):
+        await writer.put((i, "x"))
+    assert writer.stats["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_writer_counts_failures(patch_sqlite_tmp_db):
+    writer = storage.BatchWriter(patch_sqlite_tmp_db, "INSERT INTO no_such_table VALUES (?)")
+    await writer.put((1,))
+    await writer.flush()
+    assert writer.stats["failed"] == 1
+    assert writer.last_error
+
+
+def test_rollups_backfill_and_follow_inserts(tmp_path):
+    import sqlite3
+    conn = sqlite3.connect(str(tmp_path / "old.db"))
+    # Eski baza: faqat birinchi migratsiya, log allaqachon to'lgan
+    for sql in storage.MIGRATIONS[0]: conn.execute(sql)
+    conn.execute("PRAGMA user_version = 1")
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                     [("2024-01-01 10:00:00", 1, 1, "a", "in"), ("2024-01-01 11:00:00", 1, 0, "b", "out")])
+    storage.migrate(conn)
+    conn.execute("INSERT INTO messages (date, chat_id, sender_id, text, type) VALUES ('2024-01-02 09:00:00', 2, 2, 'c', 'in')")
+
+    assert conn.execute("SELECT incoming, outgoing FROM stats_total").fetchone() == (2, 1)
+    assert conn.execute("SELECT * FROM stats_chat ORDER BY chat_id").fetchall() == [
+        (1, 1, 1, 2, "2024-01-01 11:00:00"), (2, 1, 0, 1, "2024-01-02 09:00:00")]
+    assert conn.execute("SELECT * FROM stats_day ORDER BY day").fetchall() == [("2024-01-01", 1, 1), ("2024-01-02", 1, 0)]
+    conn.close()
+
+
+def test_failed_migration_leaves_no_partial_schema(tmp_path, monkeypatch):
+    import sqlite3
+    conn = sqlite3.connect(str(tmp_path / "half.db"))
+    storage.migrate(conn)
+    version = len(storage.MIGRATIONS)
+    # ALTER muvaffaqiyatli, keyingi buyruq xato — ustun ham qolmasligi kerak
+    monkeypatch.setattr(storage, "MIGRATIONS", storage.MIGRATIONS + [
+        ["ALTER TABLE messages ADD COLUMN extra TEXT", "CREATE VIRTUAL TABLE broken USING no_such_module(x)"]])
+    with pytest.raises(sqlite3.OperationalError):
+        storage.migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == version
+    assert "extra" not in [r[1] for r in conn.execute("PRAGMA table_info(messages)")]
+    conn.close()